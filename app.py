@@ -1,24 +1,53 @@
 # app.py
-from flask import Flask, render_template, request, json, redirect
+from flask import Flask, render_template, request, redirect, abort, make_response, send_from_directory, jsonify, g
 from bokeh.embed import components
-from bokeh.resources import INLINE
 from bokeh.models.callbacks import CustomJS
-from bokeh.models import TapTool, ColumnDataSource
-from bokeh.models.tools import TapTool
-from bokeh.plotting import figure, curdoc
-from bokeh.layouts import column
-
-import pandas as pd
-from ast import literal_eval
-import time
+
+import os
 import numpy as np
+from urllib.parse import urlencode
 
-from .components import base_map, heatmap, buildings, blocked_routes
+from .components import base_map, heatmap, buildings, blocked_routes, store, scoring, profiles, cache, assets, tiles, raster, impact, export, scenario, neighbors, network, transit, timing, snapshot, geometry, search
 
 app = Flask(__name__)
+
+# time the stages of every request, added first so the timing is the last step of a response
+app.before_request(timing.start_request)
+app.after_request(timing.finish_request)
+
+def load_data():
+    """Loads the building data, public transport layer and everything made of them for the whole process"""
+    store.load_buildings()
+    geometry.load_geometry()
+    tiles.load_bounds()
+    tiles.load_hover()
+    base_map.prepare_public_transport()
+    impact.load_impact()
+    scenario.load_index()
+    neighbors.load_neighbors()
+    network.load_network()
+    transit.load_transit()
+    profiles.load_counts()
+    export.load_postcodes()
+    search.load_search()
+    cache.load_version()
+
+# load the data once for the whole process, prepared arrays come from the current version of the snapshot
+snapshot.load_snapshot()
+load_data()
+
+# swap to a new version of the snapshot between requests, without dropping any
+snapshot.watch(load_data)
+app.before_request(snapshot.start_request)
+app.teardown_request(snapshot.end_request)
+
 # Configurations
 ALOWED_CORS_DOMAIN = 'http://localhost:8080'
 
+# all map variants without custom weights, rendered at startup when WARM_CACHE is set
+MAP_VARIANTS = ["/map/0/0"] + ["/heatmap/" + fire + "/" + focus for fire in ["small", "big"] 
+                               for focus in ["default", "residential", "roads"]]
+
 @app.route("/")
 def start():
     return redirect("/map/0/0")
@@ -26,14 +55,40 @@ def start():
 
 @app.route('/<map_type>/<fire>/<focus>', methods=(['GET']))
 def home(map_type, fire, focus):
+    # the page only depends on the route, the query and the data version
+    key  = (map_type, fire, focus, tuple(sorted(request.args.items(multi=True))))
+    etag = cache.get_etag(key)
+
+    # render only if the page is not cached and the browser does not have it either
+    page = cache.get_page(key)
+    if page is None and not request.if_none_match.contains(etag):
+        page = cache.put_page(key, render_map(map_type, fire, focus))
+
+    response = make_response(page["html"] if page is not None else "")
+    response.set_etag(etag)
+
+    return response.make_conditional(request)
+
+
+def render_map(map_type, fire, focus):
+    """Renders the html of the map of the whole area"""
     # plot figure
-    fig = base_map.create_base_map()
-    fig = base_map.add_public_transport(fig)
+    with timing.stage("glyphs"):
+        fig = base_map.create_base_map()
+        fig = base_map.add_public_transport(fig)
+
+        if map_type == "map":
+            fig = buildings.draw_polygon(fig, "not", "not")
+        elif map_type == "heatmap" and focus == "custom":
+            # score all buildings live with the weights given in the query
+            try:
+                weights = profiles.parse_weights(request.args)
+            except ValueError as error:
+                abort(400, str(error))
 
-    if map_type == "map":
-        fig = buildings.draw_polygon(fig, "not", "not")
-    elif map_type == "heatmap":
-        fig = heatmap.draw_heatmap(fig, fire, focus)
+            fig = heatmap.draw_heatmap(fig, fire, focus, scores=profiles.score_profile(fire, weights), query=get_query(fire, focus))
+        elif map_type == "heatmap":
+            fig = heatmap.draw_heatmap(fig, fire, focus, query=get_query(fire, focus))
 
     # remove logo and toolbar
     fig.toolbar.logo     = None
@@ -51,50 +106,57 @@ def home(map_type, fire, focus):
     fig.y_range.js_on_change('start', callback)
 
     # grab the static resources
-    js_resources  = INLINE.render_js()
-    css_resources = INLINE.render_css()
+    js_resources, css_resources = assets.get_resources()
 
     # # render template
-    script, div = components(fig)
+    with timing.stage("serialize"):
+        script, div = components(fig)
 
-    return render_template(
-        'index.html',
-        plot_script=script,
-        plot_div=div,
-        js_resources=js_resources,
-        css_resources=css_resources
-        )
+    with timing.stage("render"):
+        return render_template(
+            'index.html',
+            plot_script=script,
+            plot_div=div,
+            js_resources=js_resources,
+            css_resources=css_resources
+            )
 
 
 @app.route('/building/<pand_id>/<fire>', methods=(['GET']))
 def get_information(pand_id, fire):
-    df       = pd.read_csv('./data/city_area_buildings.csv')
+    # everything about the building and fire is precomputed in one bundle, fires with another radius are made on request
+    radius = request.args.get("radius")
+
+    with timing.stage("load"):
+        try:
+            bundle = impact.get_bundle(pand_id, fire, radius)
+        except KeyError:
+            abort(404)
+        except ValueError as error:
+            abort(400, str(error))
 
-    building    = df[df['pand_id'] == float(pand_id)]
-    coordinates = literal_eval(building.iloc[0]['wgs'])
+        coordinates = store.get_list("wgs", store.get_positions([pand_id])[0])
 
     # plot figure
-    fig = base_map.create_zoomed_map(coordinates)
-    fig = buildings.draw_radius(fig, building, fire)
-    fig = base_map.add_public_transport(fig)
-    fig = buildings.draw_polygon(fig, float(pand_id), fire)
+    with timing.stage("glyphs"):
+        fig = base_map.create_zoomed_map(coordinates)
+        fig = buildings.draw_radius(fig, bundle["radius"], fire if radius is None else str(bundle["meters"]) + " m")
+        fig = base_map.add_public_transport(fig)
+        fig = buildings.draw_polygon(fig, float(pand_id), fire)
 
-    fig, stations = blocked_routes.draw_blocked_ov(fig, building, fire)
-    fig, roads    = blocked_routes.draw_blocked_roads(fig, building, fire)
+        fig, stations = blocked_routes.draw_blocked_ov(fig, bundle["ov"])
+        fig, roads    = blocked_routes.draw_blocked_roads(fig, bundle["roads"])
 
     # remove logo and toolbar
     fig.toolbar.logo     = None
     fig.toolbar_location = None
 
     # grab the static resources
-    js_resources  = INLINE.render_js()
-    css_resources = INLINE.render_css()
+    js_resources, css_resources = assets.get_resources()
 
     # render template
-    script, div = components(fig)
-
-    # get information to show on html
-    building_functions, neighbor_functions, radius_info, amount_neighbors, amount_radius, complete_adress = buildings.get_info(pand_id, fire)
+    with timing.stage("serialize"):
+        script, div = components(fig)
 
     link_small = ("/building/" + pand_id + "/small")
     link_big = ("/building/" + pand_id + "/big")
@@ -103,59 +165,281 @@ def get_information(pand_id, fire):
         # UI
         small_active = "active"
         big_active = str()
-        # score
-        risk_score_default     = round(building.norm_score_small_default.values[0], 2)
-        risk_score_residential = round(building.norm_score_small_residential.values[0], 2)
-        risk_score_road        = round(building.norm_score_small_road.values[0], 2)
     else:
         # UI
         big_active   = "active"
         small_active = str()
-        # score
-        risk_score_default     = round(building.norm_score_big_default.values[0], 2)
-        risk_score_residential = round(building.norm_score_big_residential.values[0], 2)
-        risk_score_road        = round(building.norm_score_big_road.values[0], 2)
+
+    # only raw scores are known for another radius
+    scores = bundle["raw_scores"] if bundle["scores"] is None else bundle["scores"]
 
     # give the full address of the building back
-    building_address = building['full_adress'].values[0]
-    if pd.isnull(building_address):
-        print("this building has no adress")
+    if bundle["address"] is None:
         address = "Address unkown"
     else:
-        address = str(building_address.replace("\n", "<br>"))
-    
-    print("done with loading building")
+        address = str(bundle["address"].replace("\n", "<br>"))
 
     # return html template and contents
-    return render_template(
-        'building.html',
-        id=str(pand_id),
-        link_small = link_small,
-        link_big = link_big,
-        small_active = small_active,
-        big_active = big_active,
-        adress = address,
-        building_info = building_functions,
-        neighbor_info = neighbor_functions,
-        radius_info = radius_info,
-        amount_adjacent = amount_neighbors,
-        amount_radius = amount_radius,
-        radius_adress=complete_adress,
-        risk_score_default = risk_score_default,
-        risk_score_residential = risk_score_residential,
-        risk_score_road = risk_score_road,
-        stations = stations,
-        roads = roads,
-        plot_script=script,
-        plot_div=div,
-        js_resources=js_resources,
-        css_resources=css_resources
-    )
+    with timing.stage("render"):
+        page = render_template(
+            'building.html',
+            id=str(pand_id),
+            link_small = link_small,
+            link_big = link_big,
+            small_active = small_active,
+            big_active = big_active,
+            adress = address,
+            building_info = bundle["functions"],
+            neighbor_info = bundle["neighbor_functions"],
+            radius_info = bundle["radius_functions"],
+            amount_adjacent = bundle["amount_neighbors"],
+            amount_radius = bundle["amount_radius"],
+            radius_adress=bundle["radius_addresses"],
+            risk_score_default = round(scores["default"], 2),
+            risk_score_residential = round(scores["residential"], 2),
+            risk_score_road = round(scores["road"], 2),
+            radius = radius,
+            raw_scores = bundle["scores"] is None,
+            stations = stations,
+            roads = roads,
+            access = bundle["access"],
+            transit = bundle["transit"],
+            plot_script=script,
+            plot_div=div,
+            js_resources=js_resources,
+            css_resources=css_resources
+        )
+
+    return page
+
+
+@app.route('/api/building/<pand_id>/<fire>', methods=(['GET']))
+def get_building_bundle(pand_id, fire):
+    """Precomputed impact of a fire in a building, served as stored, or the impact of a fire with ?radius=<meters>"""
+    with timing.stage("load"):
+        try:
+            bundle = impact.get_bundle_json(pand_id, fire, request.args.get("radius"))
+        except KeyError:
+            abort(404)
+        except ValueError as error:
+            abort(400, str(error))
+
+    return app.response_class(bundle, mimetype='application/json')
+
+
+def get_query(fire, focus):
+    """Query for the buildings api with the fire, focus and custom weights of the current map"""
+    return "&" + urlencode([("fire", fire), ("focus", focus)] + list(request.args.items(multi=True)))
+
+
+@app.route('/api/buildings', methods=(['GET']))
+def get_buildings():
+    """Buildings inside the bbox (min x, min y, max x, max y in web mercator), simplified for the width of the bbox"""
+    try:
+        bbox = [float(value) for value in request.args.get("bbox", "").split(",")]
+        if len(bbox) != 4:
+            raise ValueError("bbox needs four values")
+        if not all(np.isfinite(bbox)) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError("bbox should be finite with the minimum before the maximum")
+    except ValueError:
+        abort(400, "bbox should be min x, min y, max x, max y")
+
+    # leave out the selected building, it is drawn separately
+    exclude = []
+    if "exclude" in request.args:
+        try:
+            exclude = [float(value) for value in request.args["exclude"].split(",")]
+            if not all(np.isfinite(exclude)):
+                raise ValueError("ids should be finite")
+        except ValueError:
+            abort(400, "exclude should be pand ids separated by commas")
+
+    positions = np.setdiff1d(tiles.query(bbox), store.get_positions(exclude))
+
+    # scores of the heatmap, custom weights are scored live
+    args   = request.args.to_dict()
+    fire   = args.pop("fire", None)
+    focus  = args.pop("focus", None)
+    scores = None
+
+    for key in ["bbox", "exclude"]:
+        args.pop(key, None)
+
+    if fire in scoring.FIRES and focus == "custom":
+        try:
+            scores = profiles.score_profile(fire, profiles.parse_weights(args))
+        except ValueError as error:
+            abort(400, str(error))
+    elif fire in scoring.FIRES and focus is not None:
+        column = "road" if focus == "roads" else focus
+        df     = store.get_buildings()
+
+        if 'score_' + fire + '_' + column not in df:
+            abort(400, "unknown focus " + focus)
+
+        scores = (df['score_' + fire + '_' + column].values, df['norm_score_' + fire + '_' + column].values)
+
+    data = tiles.get_data(positions, tiles.get_level(bbox[2] - bbox[0]), scores)
+
+    # numpy arrays are not json serializable, float32 values are rounded so they are not written with float64 digits
+    for key, decimals in [('x', 2), ('y', 2), ('scores', 6), ('norm_scores', 6)]:
+        if key in data:
+            data[key] = np.round(data[key].astype(np.float64), decimals).tolist()
+
+    for key in ['start', 'end', 'id']:
+        data[key] = data[key].tolist()
+
+    return jsonify(data)
+
+
+def get_compound():
+    """Impact of the fires in the fires query argument, aborts when they can not be read"""
+    try:
+        return impact.make_compound(impact.parse_fires(request.args.get("fires", "")))
+    except KeyError as error:
+        abort(404, "unknown building " + str(error))
+    except ValueError:
+        abort(400, "fires should be like <pand id>:small,<pand id>:big,<pand id>:<radius in meters>")
+
+
+@app.route('/scenario', methods=(['GET']))
+def get_scenario():
+    """Map and impact of several buildings on fire at once"""
+    with timing.stage("load"):
+        compound = get_compound()
+
+    with timing.stage("glyphs"):
+        # show all radii
+        fig = base_map.create_bounds_map([x for fire in compound["fires"] for x in fire["radius"]["xs"]],
+                                         [y for fire in compound["fires"] for y in fire["radius"]["ys"]])
+
+        # one glyph per fire size
+        labels = [fire["fire"] if fire["fire"] in scoring.FIRES else str(fire["meters"]) + " m" for fire in compound["fires"]]
+        for label in sorted(set(labels)):
+            fig = buildings.draw_radii(fig, [fire["radius"] for fire, other in zip(compound["fires"], labels) if other == label], label)
+
+        fig = base_map.add_public_transport(fig)
+        fig = buildings.draw_polygon(fig, [fire["pand_id"] for fire in compound["fires"]], "small")
+
+        fig, stations = blocked_routes.draw_blocked_ov(fig, compound["ov"])
+        fig, roads    = blocked_routes.draw_blocked_roads(fig, compound["roads"])
+
+    # remove logo and toolbar
+    fig.toolbar.logo     = None
+    fig.toolbar_location = None
+
+    js_resources, css_resources = assets.get_resources()
+
+    with timing.stage("serialize"):
+        script, div = components(fig)
+
+    with timing.stage("render"):
+        page = render_template(
+            'scenario.html',
+            fires = compound["fires"],
+            building_info = compound["functions"],
+            radius_info = compound["radius_functions"],
+            amount_radius = compound["amount_radius"],
+            radius_adress = compound["radius_addresses"],
+            scores = {focus: round(score, 2) for focus, score in compound["raw_scores"].items()},
+            stations = stations,
+            roads = roads,
+            access = compound["access"],
+            transit = compound["transit"],
+            plot_script=script,
+            plot_div=div,
+            js_resources=js_resources,
+            css_resources=css_resources
+        )
+
+    return page
+
+
+@app.route('/api/scenario', methods=(['GET']))
+def get_scenario_json():
+    """Impact of several buildings on fire at once as json, ?fires=<pand id>:small,<pand id>:big,<pand id>:<meters>"""
+    return jsonify(get_compound())
+
+
+@app.route('/api/export', methods=(['GET']))
+def get_export():
+    """Scores and blocked routes of the buildings in a bbox, postcode range or list of ids as csv, ndjson or parquet"""
+    file_format = request.args.get("format", "csv")
+
+    try:
+        positions = export.select(*export.parse_selection(request.args))
+        data      = export.export(positions, file_format)
+    except ValueError as error:
+        abort(400, str(error))
+
+    return app.response_class(data, mimetype=export.FORMATS[file_format],
+                              headers={"Content-Disposition": "attachment; filename=export." + file_format})
+
+
+@app.route('/api/search', methods=(['GET']))
+def get_search():
+    """Buildings with an address like ?q=<street> <number>, <postcode> or the start of one, with their bbox to jump the map to"""
+    try:
+        limit = int(request.args.get("limit", search.LIMIT))
+    except ValueError:
+        abort(400, "limit should be a number")
+
+    return jsonify(search.search(request.args.get("q", ""), limit))
+
+
+@app.route('/tiles/<version>/<fire>/<focus>/<int:z>/<int:x>/<int:y>.png', methods=(['GET']))
+def get_tile(version, fire, focus, z, x, y):
+    """Raster tile of a heatmap, rendered on the first request and kept on disk"""
+    # tiles of older data are not served, the page gives the url of the current version
+    if (version != cache.check_version()[:12] or fire not in scoring.FIRES or focus not in raster.FOCUSES
+            or not 0 <= z < raster.VECTOR_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z):
+        abort(404)
+
+    path     = raster.get_tile(version, fire, focus, z, x, y, heatmap.PALETTE)
+    response = send_from_directory(os.path.dirname(os.path.abspath(path)), os.path.basename(path))
+    response.headers['Cache-Control'] = 'public, max-age=' + str(assets.MAX_AGE) + ', immutable'
+
+    return response
+
+
+@app.route(assets.BOKEH_URL + 'static/<path:filename>', methods=(['GET']))
+def bokeh_static(filename):
+    """BokehJS files, the url contains the bokeh version so browsers can keep them"""
+    response = send_from_directory(assets.BOKEH_DIR, filename)
+
+    # read the file in the response so it can be compressed
+    response.direct_passthrough = False
+    response.make_sequence()
+    response.headers['Cache-Control'] = 'public, max-age=' + str(assets.MAX_AGE) + ', immutable'
+
+    return response
+
+
+@app.before_request
+def strip_etags():
+    # the ETags of compressed responses end in their encoding, routes and files compare the ETag of the uncompressed body
+    if "HTTP_IF_NONE_MATCH" in request.environ:
+        g.if_none_match = request.environ["HTTP_IF_NONE_MATCH"]
+        request.environ["HTTP_IF_NONE_MATCH"] = assets.strip_etags(g.if_none_match)
+
+
+@app.after_request
+def compress_response(response):
+    with timing.stage("compress"):
+        return assets.compress(response, request.headers.get('Accept-Encoding', ''), g.get('if_none_match', ''))
+
+
+@app.route('/metrics', methods=(['GET']))
+def get_metrics():
+    """Histograms of the request and stage timings of this process in the Prometheus text format"""
+    return app.response_class(timing.metrics(), mimetype="text/plain; version=0.0.4")
+
 
 @app.route('/FAQ', methods=(['GET']))
 def FAQ():
     return render_template(
-        'export.html'
+        'export.html',
+        weights=scoring.WEIGHTS
     )
 
 
@@ -172,5 +456,15 @@ def add_cors_headers(response):
 
 # app.after_request(add_cors_headers)
 
+
+def warm_cache():
+    """Renders all map variants once, so the first requests are served from the cache as well"""
+    with app.test_client() as client:
+        for url in MAP_VARIANTS:
+            client.get(url)
+
+if os.environ.get("WARM_CACHE"):
+    warm_cache()
+
 if __name__ == '__main__':
     app.run()
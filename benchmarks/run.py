@@ -0,0 +1,234 @@
+"""
+Benchmarks of the drawing functions and the routes of the app on synthetic cities of growing size. Every size runs in its
+own process in a scratch directory with the synthetic building csv and links to the other data files, so the app loads it
+like the real data. Results are written as json and can be compared with an earlier run. Run from the root of the project:
+
+    python -m benchmarks.run --sizes 1000 10000 100000 500000 --output ./benchmarks/results/latest.json
+    python -m benchmarks.run --sizes 1000 --compare ./benchmarks/results/latest.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+import numpy as np
+from datetime import datetime, timezone
+
+from . import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = [1000, 10000, 100000, 500000]
+
+# calls per case after the first one
+REPEAT = 10
+
+# generated data that belongs to the real buildings, the benchmark builds it in memory for the synthetic ones
+GENERATED = ["city_area_buildings.csv", "city_area_buildings", "geometry", "impact", "neighbors", "tiles", "snapshot"]
+
+# slowdown of the median above which a case counts as a regression
+THRESHOLD = 1.25
+
+def peak_rss():
+    """Largest resident memory of this process so far in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def measure(function, arguments, repeat=REPEAT):
+    """Times the first call and repeat more calls that take the arguments in turn, with the memory allocated by one call"""
+    start = time.perf_counter()
+    function(*arguments[0])
+    first = time.perf_counter() - start
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(*arguments[(i + 1) % len(arguments)])
+        times.append(time.perf_counter() - start)
+
+    # allocations are traced in a separate call, tracing slows the calls down
+    tracemalloc.start()
+    function(*arguments[0])
+    _, allocated = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times) * 1000
+
+    return {"first_ms": round(first * 1000, 3), "median_ms": round(float(np.median(times)), 3),
+            "p95_ms": round(float(np.percentile(times, 95)), 3), "min_ms": round(float(times.min()), 3),
+            "allocated_mb": round(allocated / 2**20, 3), "peak_rss_mb": round(peak_rss(), 1)}
+
+def get(client, url):
+    """Requests a url and reads the whole response, streamed responses included"""
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(url + " gave " + str(response.status_code))
+
+    return response.get_data()
+
+def run_cases(repeat=REPEAT, seed=0):
+    """Loads the app on the data in the working directory and gives back the results of every case"""
+    from flask.cli import prepare_import
+
+    start = time.perf_counter()
+    app   = importlib.import_module(prepare_import(os.path.join(ROOT, "app.py")))
+    results = [{"case": "startup", "first_ms": round((time.perf_counter() - start) * 1000, 3), "peak_rss_mb": round(peak_rss(), 1)}]
+
+    base_map, buildings, heatmap, blocked_routes = app.base_map, app.buildings, app.heatmap, app.blocked_routes
+    store, impact, tiles = app.store, app.impact, app.tiles
+
+    df  = store.get_buildings()
+    rng = np.random.default_rng(seed)
+
+    # buildings that block ov and roads, so the blocked routes are drawn (any buildings in small cities with too few)
+    blocking  = np.flatnonzero([len(ov) > 0 and len(roads) > 0 for ov, roads in zip(store.get_lists("ov_big"), store.get_lists("roads_big"))])
+    positions = rng.choice(blocking if len(blocking) > repeat else np.arange(len(df)), min(repeat + 1, len(df)), replace=False)
+    ids       = [str(int(df.pand_id.iloc[position])) for position in positions]
+    bundles   = [impact.make_bundle(int(position), "big") for position in positions]
+
+    # view of about a kilometer around the middle of the city
+    bounds = tiles.get_bounds()
+    x, y   = np.median(bounds[:, 0]), np.median(bounds[:, 1])
+    bbox   = ",".join(str(value) for value in [x - 500, y - 500, x + 500, y + 500])
+
+    # the drawing functions get a new figure every call, the figure alone is measured as well
+    components = {
+        "create_base_map": (base_map.create_base_map, [()]),
+        "draw_polygon": (lambda pand_id: buildings.draw_polygon(base_map.create_zoomed_map(store.get_list("wgs", store.get_positions([pand_id])[0])), float(pand_id), "small"),
+                         [(pand_id,) for pand_id in ids]),
+        "draw_heatmap": (lambda fire: heatmap.draw_heatmap(base_map.create_base_map(), fire, "default"), [("small",), ("big",)]),
+        "add_public_transport": (lambda: base_map.add_public_transport(base_map.create_base_map()), [()]),
+        "make_bundle": (lambda position: impact.make_bundle(int(position), "big"), [(position,) for position in positions]),
+        "draw_blocked_ov": (lambda bundle: blocked_routes.draw_blocked_ov(base_map.create_base_map(), bundle["ov"]), [(bundle,) for bundle in bundles]),
+        "draw_blocked_roads": (lambda bundle: blocked_routes.draw_blocked_roads(base_map.create_base_map(), bundle["roads"]), [(bundle,) for bundle in bundles]),
+        "draw_radius": (lambda bundle: buildings.draw_radius(base_map.create_base_map(), bundle["radius"], "big"), [(bundle,) for bundle in bundles]),
+    }
+
+    for name, (function, arguments) in components.items():
+        results.append(dict(case="component:" + name, **measure(function, arguments, repeat)))
+
+    client = app.app.test_client()
+    routes = {
+        "map": ["/map/small/default"],
+        "heatmap": ["/heatmap/small/default", "/heatmap/big/road"],
+        "building": ["/building/" + pand_id + "/small" for pand_id in ids],
+        "api_building": ["/api/building/" + pand_id + "/big" for pand_id in ids],
+        "api_buildings": ["/api/buildings?bbox=" + bbox + "&fire=small&focus=default"],
+        "scenario": ["/scenario?fires=" + ids[i] + ":small," + ids[i - 1] + ":big" for i in range(len(ids))],
+        "export": ["/api/export?format=csv&bbox=" + bbox],
+    }
+
+    for name, urls in routes.items():
+        results.append(dict(case="route:" + name, **measure(lambda url: get(client, url), [(url,) for url in urls], repeat)))
+
+    return results
+
+def prepare_data(size, path, seed=0):
+    """Scratch directory with a synthetic city of size buildings and links to the other data files of the project"""
+    data = os.path.join(path, "data")
+    os.makedirs(data)
+
+    for name in os.listdir(os.path.join(ROOT, "data")):
+        if name not in GENERATED:
+            os.symlink(os.path.join(ROOT, "data", name), os.path.join(data, name))
+
+    synthetic.write_city(size, os.path.join(data, "city_area_buildings.csv"), seed)
+
+def run_size(size, repeat=REPEAT, seed=0):
+    """Runs all cases for a synthetic city of size buildings in a new process and gives back the results"""
+    path = tempfile.mkdtemp(prefix="benchmark_")
+
+    try:
+        start = time.perf_counter()
+        prepare_data(size, path, seed)
+        generated = time.perf_counter() - start
+
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + os.environ.get("PYTHONPATH", "").split(os.pathsep)))
+        command     = [sys.executable, "-m", "benchmarks.run", "--child", "--repeat", str(repeat), "--seed", str(seed)]
+        output      = subprocess.run(command, cwd=path, env=environment, check=True, stdout=subprocess.PIPE).stdout
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    # the results are the last line, the app prints while loading
+    results = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    return [dict(size=size, **result) for result in [{"case": "generate", "first_ms": round(generated * 1000, 3)}] + results]
+
+def get_commit():
+    """Commit of the code that is benchmarked, None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL).stdout.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold=THRESHOLD):
+    """Prints the change of every case in both reports, gives back the cases of which the median got threshold times slower"""
+    before      = {(result["size"], result["case"]): result for result in old["results"]}
+    regressions = []
+
+    for result in new["results"]:
+        key = (result["size"], result["case"])
+        if key not in before:
+            continue
+
+        metric = "median_ms" if "median_ms" in result else "first_ms"
+        ratio  = result[metric] / max(before[key][metric], 1e-9)
+        print("{:>8} {:<28} {:>10.2f} ms {:>10.2f} ms {:>6.2f}x".format(key[0], key[1], before[key][metric], result[metric], ratio))
+
+        if ratio > threshold:
+            regressions.append(key)
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app on synthetic cities of growing size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of buildings")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="calls per case after the first one")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic cities and the sampled buildings")
+    parser.add_argument("--output", help="json report to write, standard output by default")
+    parser.add_argument("--compare", help="earlier json report to compare with, exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slowdown of the median that counts as a regression")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # one size, started by run_size in the scratch directory
+    if args.child:
+        print(json.dumps(run_cases(args.repeat, args.seed)))
+        return
+
+    results = []
+    for size in args.sizes:
+        print("benchmarking", size, "buildings", file=sys.stderr)
+        results.extend(run_size(size, args.repeat, args.seed))
+
+    report = {"created": datetime.now(timezone.utc).isoformat(), "commit": get_commit(), "python": platform.python_version(),
+              "platform": platform.platform(), "repeat": args.repeat, "seed": args.seed, "results": results}
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.threshold)
+
+        if regressions:
+            print(len(regressions), "cases are slower than", args.threshold, "times the earlier run", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
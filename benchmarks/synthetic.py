@@ -0,0 +1,139 @@
+"""
+Generator of a synthetic city in the shape of city_area_buildings.csv: a grid of buildings around the center of Amsterdam
+with random functions, addresses and blocked routes, scored the same way as the real data. Run from the root of the project:
+
+    python -m benchmarks.synthetic --buildings 10000 --output ./data/synthetic_10k.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from components import scoring
+
+OV_PATH    = "./data/tram en metro lijnen plus stations.csv"
+ROADS_PATH = "./data/all_roads_amsterdam.csv"
+
+# south west corner of the grid and the distance between buildings in degrees (about 20 meters)
+ORIGIN  = (52.34, 4.85)
+SPACING = (0.00018, 0.0003)
+
+# footprint of a building as part of the spacing
+FOOTPRINT = 0.75
+
+# functions and how often they are found in a building
+FUNCTIONS = {
+    "residential function" : 0.6,
+    "shopping function"    : 0.1,
+    "office function"      : 0.08,
+    "meet function"        : 0.05,
+    "other usage"          : 0.05,
+    "industry function"    : 0.03,
+    "educational function" : 0.03,
+    "health care function" : 0.02,
+    "sports function"      : 0.02,
+    "accomodation function": 0.015,
+    "cell function"        : 0.005,
+}
+
+# part of the buildings without address, and that block ov segments or roads for a small fire (more for a big one)
+NO_ADDRESS = 0.06
+OV_SMALL   = 0.02
+ROAD_SMALL = 0.15
+
+def make_wgs(rows, columns):
+    """Footprint of every building as a closed ring of [lat, lon] pairs"""
+    lat = ORIGIN[0] + rows * SPACING[0]
+    lon = ORIGIN[1] + columns * SPACING[1]
+    top = lat + SPACING[0] * FOOTPRINT
+    end = lon + SPACING[1] * FOOTPRINT
+
+    return [[[a, b], [c, b], [c, d], [a, d], [a, b]] for a, b, c, d in zip(lat.tolist(), lon.tolist(), top.tolist(), end.tolist())]
+
+def grid_neighbors(rows, columns, side, size, offsets):
+    """Ids of the buildings at the given grid offsets of every building, as floats like the building csv"""
+    ids       = 363100012000000 + np.arange(size)
+    neighbors = [[] for _ in range(size)]
+
+    for row_offset, column_offset in offsets:
+        other_rows    = rows + row_offset
+        other_columns = columns + column_offset
+        other         = other_rows * side + other_columns
+        inside        = (other_rows >= 0) & (other_columns >= 0) & (other_columns < side) & (other < size)
+
+        for position, neighbor in zip(np.flatnonzero(inside).tolist(), other[inside].tolist()):
+            neighbors[position].append(float(ids[neighbor]))
+
+    return neighbors
+
+def pick_routes(rng, numbers, size, share, amount):
+    """Random route numbers for a share of the buildings, up to amount per building"""
+    counts = np.where(rng.random(size) < share, rng.integers(1, amount + 1, size), 0)
+    picked = rng.choice(np.asarray(numbers, dtype=float), counts.sum())
+
+    return [values.tolist() for values in np.split(picked, np.cumsum(counts)[:-1])]
+
+def make_city(size, seed=0, ov_path=OV_PATH, roads_path=ROADS_PATH):
+    """Frame with size synthetic buildings in the columns of city_area_buildings.csv, with raw and normalized scores"""
+    rng  = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(size)))
+
+    rows, columns = np.divmod(np.arange(size), side)
+
+    # one to three functions per building
+    names     = list(FUNCTIONS)
+    chance    = np.array(list(FUNCTIONS.values())) / sum(FUNCTIONS.values())
+    amount    = rng.integers(1, 4, size)
+    picked    = rng.choice(len(names), amount.sum(), p=chance)
+    functions = [[names[i] for i in values] for values in np.split(picked, np.cumsum(amount)[:-1])]
+
+    # streets of fifty buildings with postcodes of the city, some buildings have no address
+    postcodes = [str(1011 + (row // 25) % 99) + chr(65 + (column // 26) % 26) + chr(65 + column % 26)
+                 for row, column in zip(rows.tolist(), (columns // 50).tolist())]
+    addresses = [None if missing else "Straat " + str(row) + " " + str(column + 1) + "\n" + postcode + " Amsterdam"
+                 for missing, row, column, postcode in zip(rng.random(size) < NO_ADDRESS, rows.tolist(), columns.tolist(), postcodes)]
+
+    ov    = pd.read_csv(ov_path, usecols=["number", "modaliteit"])
+    roads = pd.read_csv(roads_path, usecols=["number", "AUTO"])
+
+    # touching buildings on both sides, the ring around them is in reach of a big fire
+    touching = grid_neighbors(rows, columns, side, size, [(0, -1), (0, 1)])
+    ring     = grid_neighbors(rows, columns, side, size, [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+
+    ov_small    = pick_routes(rng, ov.number, size, OV_SMALL, 1)
+    roads_small = pick_routes(rng, roads.number, size, ROAD_SMALL, 2)
+
+    city_info = pd.DataFrame({
+        "pand_id": 363100012000000 + np.arange(size),
+        "full_adress": addresses,
+        "wgs": make_wgs(rows, columns),
+        "gebruiksdoelVerblijfsobject": functions,
+        "neighbors": touching,
+        "linked_small": touching,
+        "linked_big": ring,
+        "ov_small": ov_small,
+        "ov_big": [small + extra for small, extra in zip(ov_small, pick_routes(rng, ov.number, size, OV_SMALL, 2))],
+        "roads_small": roads_small,
+        "roads_big": [small + extra for small, extra in zip(roads_small, pick_routes(rng, roads.number, size, ROAD_SMALL, 2))],
+    })
+
+    # scored and normalized like the preprocessing pipeline does
+    city_info = scoring.add_scores(city_info, ov, roads)
+
+    return scoring.normalize(city_info, city_info[scoring.score_columns()].min(), city_info[scoring.score_columns()].max())
+
+def write_city(size, path, seed=0):
+    """Writes a synthetic city of size buildings as csv, lists are written as python strings like the building csv"""
+    make_city(size, seed).to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic city_area_buildings.csv")
+    parser.add_argument("--buildings", type=int, default=10000, help="number of buildings")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    parser.add_argument("--output", default="./data/synthetic_buildings.csv", help="csv to write to")
+    args = parser.parse_args()
+
+    write_city(args.buildings, args.output, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os
+import gzip
+import threading
+from collections import OrderedDict
+
+import bokeh
+from bokeh.resources import INLINE, Resources
+from bokeh.util.paths import bokehjsdir
+from werkzeug.datastructures import ETags
+from werkzeug.http import parse_etags
+
+# brotli is optional, responses are gzipped when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# BokehJS files are served by the app under a url with the bokeh version, so they can be cached forever
+BOKEH_URL = "/bokeh/" + bokeh.__version__ + "/"
+BOKEH_DIR = bokehjsdir()
+MAX_AGE   = 365 * 24 * 60 * 60
+
+# "static" serves BokehJS as separate files, "inline" puts it in every page
+RESOURCES_MODE = os.environ.get("BOKEH_RESOURCES", "static")
+
+# only compress text responses that are large enough to be worth it
+COMPRESS_TYPES    = ["text/html", "text/css", "application/javascript", "application/json", "text/javascript"]
+COMPRESS_MIN_SIZE = 1024
+
+# encodings responses are compressed with, the ETag of a compressed response ends in its encoding like "<etag>-gzip"
+ENCODINGS = ["br", "gzip"]
+
+# number of compressed responses with an ETag that are kept
+MAX_COMPRESSED = 64
+
+_COMPRESSED = OrderedDict()
+_LOCK       = threading.Lock()
+
+def get_resources():
+    """Gives back the html to load the BokehJS javascript and css"""
+    if RESOURCES_MODE == "inline":
+        resources = INLINE
+    else:
+        resources = Resources(mode="server", root_url=BOKEH_URL)
+
+    return resources.render_js(), resources.render_css()
+
+def choose_encoding(accept_encoding):
+    """Gives back the best encoding the browser accepts, None if it accepts none"""
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+
+    return None
+
+def encode(data, encoding):
+    """Compresses the data with the given encoding"""
+    if encoding == "br":
+        return brotli.compress(data)
+
+    return gzip.compress(data, compresslevel=6)
+
+def encode_etag(etag, encoding):
+    """ETag of a response compressed with encoding, every encoding is another body so it has another ETag"""
+    return etag + "-" + encoding
+
+def strip_etags(if_none_match):
+    """If-None-Match header without the encodings of compressed responses, so routes compare it with their own ETag"""
+    def strip(tag):
+        etag, _, encoding = tag.rpartition("-")
+        return etag if etag and encoding in ENCODINGS else tag
+
+    etags = parse_etags(if_none_match)
+    tags  = etags.as_set(include_weak=True)
+
+    return ETags([strip(tag) for tag in tags if etags.is_strong(tag)], [strip(tag) for tag in tags if etags.is_weak(tag)],
+                 etags.star_tag).to_header()
+
+def compress(response, accept_encoding, if_none_match=""):
+    """
+    Compresses a response if the browser accepts it, compressed responses with an ETag are kept. The ETag gets the
+    encoding, also for a 304 of a body the browser has compressed (if_none_match is the header of the request).
+    """
+    encoding   = choose_encoding(accept_encoding)
+    etag, weak = response.get_etag()
+
+    # a 304 has the ETag of the body the browser has
+    if (response.status_code == 304 and etag and encoding is not None
+            and parse_etags(if_none_match).contains_weak(encode_etag(etag, encoding))):
+        response.set_etag(encode_etag(etag, encoding), weak)
+        response.vary.add("Accept-Encoding")
+        return response
+
+    # streamed responses are sent as they are made
+    if (encoding is None or response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or response.mimetype not in COMPRESS_TYPES or "Content-Encoding" in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    # the same page is compressed only once
+    key = (etag, encoding)
+
+    with _LOCK:
+        compressed = _COMPRESSED.get(key) if etag else None
+
+    if compressed is None:
+        compressed = encode(data, encoding)
+
+        if etag:
+            with _LOCK:
+                _COMPRESSED[key] = compressed
+                while len(_COMPRESSED) > MAX_COMPRESSED:
+                    _COMPRESSED.popitem(last=False)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+
+    if etag:
+        response.set_etag(encode_etag(etag, encoding), weak)
+
+    return response
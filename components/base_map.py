@@ -1,21 +1,12 @@
 import pandas as pd
 import numpy as np
-import pyclipper
-from pyproj import Transformer, transform
-from ast import literal_eval
-from collections import Counter, OrderedDict
-import colorcet as cc
 
 # import bokeh modules
-from bokeh.plotting import figure, show
+from bokeh.plotting import figure
 from bokeh.tile_providers import get_provider, Vendors
-from bokeh.models.callbacks import CustomJS
-from bokeh.models import ColumnDataSource, TapTool, CustomJS, HoverTool, Line, MultiLine, LinearColorMapper, BasicTicker, ColorBar
+from bokeh.models import ColumnDataSource, HoverTool
 
-# reverse color map
-cc.fire.reverse()
-
-TRAN_4326_TO_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857")
+from . import geometry, snapshot, state
 
 def create_base_map():
     """Create base map to show all information on, map of Amsterdam"""
@@ -36,8 +27,8 @@ def create_zoomed_map(coordinates):
     y_coord = coordinates[0][0]
     x_coord = coordinates[0][1]
 
-    point1 = TRAN_4326_TO_3857.transform(y_coord - 0.0004, x_coord - 0.002)
-    point2 = TRAN_4326_TO_3857.transform(y_coord + 0.0004, x_coord + 0.002)
+    point1 = geometry.TRAN_4326_TO_3857.transform(y_coord - 0.0004, x_coord - 0.002)
+    point2 = geometry.TRAN_4326_TO_3857.transform(y_coord + 0.0004, x_coord + 0.002)
 
     x_range = (point1[0], point2[0])
     y_range = (point1[1], point2[1])
@@ -53,62 +44,75 @@ def create_zoomed_map(coordinates):
 
     return fig
 
+def create_bounds_map(xs, ys, margin=100):
+    """Makes a map that shows all given web mercator coordinates with a margin in meters"""
+    tile_provider = get_provider(Vendors.CARTODBPOSITRON_RETINA)
+
+    fig = figure(x_range=(min(xs) - margin, max(xs) + margin), y_range=(min(ys) - margin, max(ys) + margin),
+                 x_axis_type="mercator", y_axis_type="mercator", plot_width=800, plot_height=550,
+                 tools="pan,wheel_zoom,reset", active_scroll='wheel_zoom')
+
+    fig.add_tile(tile_provider)
+
+    return fig
+
+# colors of the public transport lines per modality
+TRANSPORT_COLORS = {"Tram": "blue", "Metro": "green"}
 
-def convert(test):
-    """Convert string of coordinates to list of list (inner list is xy coordinates) and transforms them"""
-    test  = test.replace('"', '')
-    test2 = test.split(',')
+def format_lines(lijn):
+    """Puts line numbers like "2 | 11 | 12" in readable format like "2, 11 and 12" """
+    lijn = lijn.replace(" ", '').split("|")
 
-    test3 = [x.split(' ') for x in test2]
+    if len(lijn) == 1:
+        return lijn[0]
 
-    final = []
-    for coord in test3:
-        # only keep coordinates if not equal to ""
-        if len(coord)>2:
-            coord = [c for c in coord if c != ""]
+    return ", ".join(lijn[:-1]) + " and " + lijn[-1]
 
-        # transform coordinates to be able to be plotted on map
-        transformed_coord = TRAN_4326_TO_3857.transform(float(coord[0]), float(coord[1]))
-        final.append([transformed_coord[0], transformed_coord[1]])
+def build_transport():
+    """Reads the public transport lines and stations, gives back their columns as arrays (stations projected in one batch)"""
+    lines    = pd.read_csv("./data/tram_metro_lijnen.csv")
+    stations = pd.read_csv('./data/TRAMMETRO_PUNTEN_2020.csv', error_bad_lines=False, encoding="utf-8", delimiter=";")
 
-    return final
+    coordinates = stations['WKT_LAT_LNG'].str.replace("POINT(", "", regex=False).str.replace(")", "", regex=False).str.split(",", expand=True)
+    coordinates = geometry.project(coordinates.values.astype(float))
+
+    return {"line_modality": lines.Modaliteit.values.astype(str), "line_lijn": lines.Lijn.apply(format_lines).values.astype(str),
+            "station_x": coordinates[:, 0], "station_y": coordinates[:, 1], "station_modality": stations.Modaliteit.values.astype(str),
+            "station_lijn": stations.Lijn.apply(format_lines).values.astype(str), "station_name": stations.Naam.values.astype(str)}
+
+def prepare_public_transport():
+    """Prepares the columns of all public transport lines and stations once for the whole process, from the snapshot if there is one"""
+    arrays = snapshot.read_arrays("transport")
+    if arrays is None:
+        arrays = build_transport()
+
+    # coordinates of the lines are already projected, only keep modalities that are drawn
+    all_coordsx, all_coordsy = geometry.get_shapes("lines")
+    keep = np.isin(arrays["line_modality"], list(TRANSPORT_COLORS))
+
+    lines = {"coordsx":[x for x, k in zip(all_coordsx, keep) if k], "coordsy":[y for y, k in zip(all_coordsy, keep) if k],
+             "modality":arrays["line_modality"][keep].tolist(), "lijn":arrays["line_lijn"][keep].tolist(),
+             "color":[TRANSPORT_COLORS[modality] for modality in arrays["line_modality"][keep]]}
+
+    stations = {"coordsx":np.asarray(arrays["station_x"]), "coordsy":np.asarray(arrays["station_y"]),
+                "modality":arrays["station_modality"].tolist(), "lijn":arrays["station_lijn"].tolist(),
+                "station":arrays["station_name"].tolist()}
+
+    return state.put("transport", {"lines": lines, "stations": stations})
 
 def add_public_transport(fig):
     """"Draw all of the public transport lines and stations. Also creates hover function so """
 
-    # put data about lines into frame and put to the rigth dtype
-    df = pd.read_csv("./data/tram_metro_lijnen.csv")
-    df['WKT_LAT_LNG'] = df['WKT_LAT_LNG'].apply(convert)
-
-    # plot every line
-    for i in df.itertuples():
-        coordsx = []
-        coordsy = []
-
-        for coord in i.WKT_LAT_LNG:
-            coordsx.append(coord[0])
-            coordsy.append(coord[1])
-        
-        # put line information in the right format
-        lijn = i.Lijn.replace(" ", '').split("|")
-        
-        if len(lijn) == 1:
-            lijn = lijn[0]
-        else: 
-            lijn = ", ".join(lijn)
-            k    = lijn.rfind(", ")
-            lijn = lijn[:k] + " and " + lijn[k+1:]
-
-        modaliteit = [i.Modaliteit] * len(coordsx)
-        lijn       = [lijn] * len(coordsx)
-        
-        source = ColumnDataSource(data={"coordsx":coordsx, "coordsy":coordsy, "modality":modaliteit, "lijn":lijn})
-
-        # add lines to plot
-        if modaliteit[0] == "Tram":
-            fig.line("coordsx", "coordsy", line_color="blue", line_width=2.5, alpha=0.8, name="ov", source=source, legend_label="Tram")
-        elif modaliteit[0] == "Metro":
-            fig.line("coordsx", "coordsy", line_color="green", line_width=2.5, alpha=0.8, name="ov", source=source, legend_label="Metro")
+    transport = state.get("transport")
+    if transport is None:
+        transport = prepare_public_transport()
+
+    # every figure needs its own sources, the columns are shared
+    lines    = ColumnDataSource(data=dict(transport["lines"]))
+    stations = ColumnDataSource(data=dict(transport["stations"]))
+
+    # add all lines to plot in one glyph
+    fig.multi_line("coordsx", "coordsy", line_color="color", line_width=2.5, alpha=0.8, name="ov", source=lines, legend_field="modality")
 
     # create hover tool for the lines
     fig.add_tools(HoverTool(
@@ -118,31 +122,8 @@ def add_public_transport(fig):
         ]
     ))
 
-    # put data about stations into the frame and put columns in right dtype
-    df = pd.read_csv('./data/TRAMMETRO_PUNTEN_2020.csv', error_bad_lines=False, encoding="utf-8", delimiter=";")
-    
-    df['WKT_LAT_LNG'] = df['WKT_LAT_LNG'].apply(lambda x: x.replace("POINT(", "").replace(")", ""))
-    
-    # plot every station
-    for i in df.itertuples():
-        coords            = i.WKT_LAT_LNG.split(",")
-        transformed_coord = TRAN_4326_TO_3857.transform(float(coords[0]), float(coords[1]))
-        coordsx           = [transformed_coord[0]]
-        coordsy           = [transformed_coord[1]]
-        modaliteit        = [i.Modaliteit]
-        
-        lijn = i.Lijn.replace(" ", '').split("|")
-        lijn = ", ".join(lijn)
-        k    = lijn.rfind(", ")
-        lijn = lijn[:k] + " and" + lijn[k+1:]
-
-        lijn     = [lijn]
-        stations = [i.Naam]
-
-        source = ColumnDataSource(data={"coordsx":coordsx, "coordsy":coordsy, "modality":modaliteit, "lijn":lijn, "station":stations})
-
-        # add stations to plot
-        fig.circle("coordsx", "coordsy", alpha=0.8, name="stations", color="black", size=5, source=source)
+    # add all stations to plot in one glyph
+    fig.circle("coordsx", "coordsy", alpha=0.8, name="stations", color="black", size=5, source=stations)
     
     # create hover tool for stations
     fig.add_tools(HoverTool(
@@ -0,0 +1,90 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import snapshot, state
+
+# files the rendered maps depend on, directories are walked
+DATA_PATHS = ["./data/city_area_buildings.csv", "./data/city_area_buildings", "./data/geometry",
+              "./data/tram_metro_lijnen.csv", "./data/TRAMMETRO_PUNTEN_2020.csv",
+              "./data/tram en metro lijnen plus stations.csv", "./data/all_roads_amsterdam.csv"]
+
+# number of rendered pages that are kept (every custom weight profile is a page)
+MAX_PAGES = 32
+
+# rendered pages per key and the version they were rendered of, the oldest used page is removed first
+_PAGES   = OrderedDict()
+_VERSION = None
+_LOCK    = threading.Lock()
+
+def data_version(paths=DATA_PATHS):
+    """Version of the data, a hash of the name, modification time and size of every data file"""
+    version = hashlib.sha1()
+
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+
+        for name in files:
+            if os.path.exists(name):
+                stat = os.stat(name)
+                version.update((name + str(stat.st_mtime_ns) + str(stat.st_size)).encode("utf-8"))
+
+    return version.hexdigest()
+
+def load_version():
+    """
+    Version of the data and the served snapshot, once when the data is loaded (and loaded again for a new version of the
+    snapshot), so requests do not read the files of the data
+    """
+    return state.put("version", hashlib.sha1((data_version() + snapshot.get_version()).encode("utf-8")).hexdigest())
+
+def get_version():
+    """Gives back the version of the loaded data, finds it if that did not happen yet"""
+    version = state.get("version")
+    if version is None:
+        version = load_version()
+
+    return version
+
+def check_version():
+    """Empties the cache when another version of the data is served than the pages were rendered of"""
+    global _VERSION
+
+    version = get_version()
+
+    with _LOCK:
+        if version != _VERSION:
+            _PAGES.clear()
+            _VERSION = version
+
+    return version
+
+def get_etag(key):
+    """ETag of a page, depends on the key of the page and the data version"""
+    return hashlib.sha1((check_version() + repr(key)).encode("utf-8")).hexdigest()
+
+def get_page(key):
+    """Gives back the rendered page of a key or None if it is not cached"""
+    check_version()
+
+    with _LOCK:
+        page = _PAGES.get(key)
+        if page is not None:
+            _PAGES.move_to_end(key)
+
+    return page
+
+def put_page(key, html):
+    """Keeps a rendered page, gives back the page with its ETag"""
+    page = {"html": html, "etag": get_etag(key)}
+
+    with _LOCK:
+        _PAGES[key] = page
+        while len(_PAGES) > MAX_PAGES:
+            _PAGES.popitem(last=False)
+
+    return page
@@ -0,0 +1,189 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+
+# kind of storage per list column, other columns are stored as plain arrays
+ID_COLUMNS         = ["neighbors", "linked_small", "linked_big", "ov_small", "ov_big", "roads_small", "roads_big"]
+COORDINATE_COLUMNS = ["wgs"]
+CATEGORY_COLUMNS   = ["gebruiksdoelVerblijfsobject"]
+
+def to_offsets(lengths):
+    """Gives back the offsets where every part of a flat array starts, the last offset is the total length"""
+    offsets     = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+
+    return offsets
+
+def to_csr(lists, dtype):
+    """Puts a list of lists into one flat value array and an offset array (csr layout)"""
+    offsets = to_offsets([len(values) for values in lists])
+    values  = np.array([value for values in lists for value in values], dtype=dtype)
+
+    return values, offsets
+
+def from_csr(values, offsets):
+    """Splits a flat value array back into a list of lists"""
+    return to_lists(values, offsets)
+
+def take_csr(values, offsets, rows):
+    """Flat values and offsets of the given rows of a csr layout, in the order of rows"""
+    offsets = np.asarray(offsets)
+    rows    = np.asarray(rows, dtype=np.int64)
+    starts  = offsets[rows]
+
+    new_offsets = to_offsets(offsets[rows + 1] - starts)
+    index       = np.repeat(starts - new_offsets[:-1], np.diff(new_offsets)) + np.arange(new_offsets[-1])
+
+    return np.asarray(values)[index], new_offsets
+
+def to_lists(values, offsets, categories=None, rows=None):
+    """Lists of the given rows (all rows if None) of an encoded list column, with the names of the categories if given"""
+    if rows is not None:
+        values, offsets = take_csr(values, offsets, rows)
+
+    if categories is not None:
+        values = categories[values]
+
+    # one conversion of all values, the lists are slices of it
+    values  = np.asarray(values).tolist()
+    offsets = np.asarray(offsets).tolist()
+
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def encode_strings(strings):
+    """Puts strings into one flat utf-8 byte array and an offset array"""
+    encoded = [string.encode("utf-8") for string in strings]
+
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), to_offsets([len(string) for string in encoded])
+
+def decode_strings(values, offsets, rows=None):
+    """Strings of the given rows (all rows if None) of a flat utf-8 byte array and its offsets"""
+    if rows is not None:
+        values, offsets = take_csr(values, offsets, rows)
+
+    # one copy of the bytes, the strings are slices of it
+    values  = np.asarray(values).tobytes()
+    offsets = np.asarray(offsets).tolist()
+
+    return [values[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+def encode_list(column, lists):
+    """Flat values, offsets and categories (None if the column is not categorical) of a list column"""
+    if column in COORDINATE_COLUMNS:
+        values, offsets = to_csr(lists, np.float64)
+        return values.reshape(-1, 2), offsets, None
+
+    if column in CATEGORY_COLUMNS:
+        # categorical codes instead of the function names
+        categories, codes = np.unique([value for values in lists for value in values], return_inverse=True)
+        return codes.astype(np.int16), to_offsets([len(values) for values in lists]), categories.astype(object)
+
+    values, offsets = to_csr(lists, np.int64)
+
+    return values, offsets, None
+
+def update_list(column, encoded, rows, lists):
+    """
+    Encoded list column (values, offsets, categories) of a new table from an encoded column: row i of the new table is row
+    rows[i] of the encoded column, or the next list of lists when rows[i] is -1
+    """
+    values, offsets, categories             = encoded
+    new_values, new_offsets, new_categories = encode_list(column, lists)
+
+    # codes of both parts point into the combined categories
+    if categories is not None:
+        combined   = np.union1d(categories, new_categories).astype(object)
+        values     = np.searchsorted(combined, categories)[np.asarray(values)].astype(np.int16)
+        new_values = np.searchsorted(combined, new_categories)[new_values].astype(np.int16)
+        categories = combined
+
+    # new lists come after the rows of the encoded column
+    rows      = np.array(rows, dtype=np.int64)
+    new       = rows < 0
+    rows[new] = len(offsets) - 1 + np.arange(new.sum())
+
+    values, offsets = take_csr(np.concatenate([np.asarray(values), new_values]),
+                               np.concatenate([np.asarray(offsets)[:-1], new_offsets + offsets[-1]]), rows)
+
+    return values, offsets, categories
+
+def write_columns(df, path, lists=None):
+    """
+    Writes a frame with parsed list columns as typed .npy arrays in a directory, list columns can also be given already
+    encoded in lists (like read_lists gives back)
+    """
+    os.makedirs(path, exist_ok=True)
+
+    if lists is None:
+        lists = {}
+
+    kinds = {}
+    for column in list(df.columns) + list(lists):
+        if column in ID_COLUMNS + COORDINATE_COLUMNS + CATEGORY_COLUMNS:
+            values, offsets, categories = lists[column] if column in lists else encode_list(column, df[column])
+            kinds[column] = "ids" if column in ID_COLUMNS else "coordinates" if column in COORDINATE_COLUMNS else "categories"
+
+            if categories is not None:
+                with open(os.path.join(path, column + "_categories.json"), "w") as f:
+                    json.dump(categories.tolist(), f)
+        elif df[column].dtype == object:
+            # strings are stored as one utf-8 byte array, missing values as a mask
+            np.save(os.path.join(path, column + "_missing.npy"), df[column].isnull().values)
+            values, offsets = encode_strings(df[column].fillna("").astype(str))
+            kinds[column]   = "strings"
+        else:
+            values        = df[column].values
+            offsets       = None
+            kinds[column] = "values"
+
+        np.save(os.path.join(path, column + ".npy"), values)
+        if offsets is not None:
+            np.save(os.path.join(path, column + "_offsets.npy"), offsets)
+
+    with open(os.path.join(path, "columns.json"), "w") as f:
+        json.dump(kinds, f)
+
+def read_array(path, column, suffix=""):
+    """Memory maps one stored array"""
+    return np.load(os.path.join(path, column + suffix + ".npy"), mmap_mode="r")
+
+def read_csr(path, column):
+    """Gives back the flat values and offsets of a list column without building lists"""
+    return read_array(path, column), read_array(path, column, "_offsets")
+
+def read_categories(path, column):
+    """Names of the codes of a categorical list column"""
+    with open(os.path.join(path, column + "_categories.json")) as f:
+        return np.array(json.load(f), dtype=object)
+
+def read_lists(path):
+    """Memory maps the flat values and offsets of every list column, with the categories of categorical columns"""
+    with open(os.path.join(path, "columns.json")) as f:
+        kinds = json.load(f)
+
+    return {column: read_csr(path, column) + (read_categories(path, column) if kind == "categories" else None,)
+            for column, kind in kinds.items() if kind in ["ids", "coordinates", "categories"]}
+
+def read_columns(path, lists=True):
+    """Reads a directory written by write_columns back into a frame, with the list columns only if lists is True"""
+    with open(os.path.join(path, "columns.json")) as f:
+        kinds = json.load(f)
+
+    data = {}
+    for column, kind in kinds.items():
+        if not lists and kind in ["ids", "coordinates", "categories"]:
+            continue
+
+        if kind in ["ids", "coordinates"]:
+            data[column] = from_csr(*read_csr(path, column))
+        elif kind == "categories":
+            codes, offsets = read_csr(path, column)
+            data[column]   = from_csr(read_categories(path, column)[codes], offsets)
+        elif kind == "strings":
+            values       = pd.Series(decode_strings(*read_csr(path, column)), dtype=object)
+            data[column] = values.where(~np.asarray(read_array(path, column, "_missing")))
+        else:
+            data[column] = np.asarray(read_array(path, column))
+
+    return pd.DataFrame(data)
@@ -0,0 +1,218 @@
+"""
+Bulk export of the scores and blocked routes of buildings, written in chunks so memory does not grow with the size of the
+export. Run from the root of the project:
+
+    python -m components.export --format csv --postcode 1091-1092 --output oost.csv
+"""
+import re
+import io
+import sys
+import argparse
+import numpy as np
+
+# parquet is optional, only available when pyarrow is installed
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from . import store, scoring, tiles, columnar, state
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+# number of buildings written at once
+CHUNK_SIZE = 2000
+
+ROUTE_COLUMNS = ["ov_small", "ov_big", "roads_small", "roads_big"]
+
+POSTCODE = re.compile(r"\d{4} ?[A-Z]{2}")
+
+def get_columns():
+    """Columns in the export, in this order"""
+    return (["pand_id", "full_adress"] + scoring.score_columns() + ["norm_" + column for column in scoring.score_columns()]
+            + ROUTE_COLUMNS)
+
+def load_postcodes():
+    """Finds the postcodes in the address of every building once for the whole process, without spaces"""
+    return state.put("postcodes", [[postcode.replace(" ", "") for postcode in POSTCODE.findall(str(adress))]
+                                   for adress in store.get_buildings().full_adress])
+
+def get_postcodes():
+    """Gives back the postcodes of every building, finds them if that did not happen yet"""
+    postcodes = state.get("postcodes")
+    if postcodes is None:
+        postcodes = load_postcodes()
+
+    return postcodes
+
+def in_range(postcode, low, high):
+    """Tells if a postcode is in the range, the ends can be shortened like 1091 to include all of 1091AA-1091ZZ"""
+    return low <= postcode[:len(low)] and postcode[:len(high)] <= high
+
+def select(bbox=None, postcodes=None, ids=None):
+    """
+    Positions of the buildings that are inside the bbox (min x, min y, max x, max y in web mercator), have an address in the
+    postcode range (low, high) and are in the list of ids. Every filter that is None is skipped.
+    """
+    positions = np.arange(len(store.get_buildings()))
+
+    if bbox is not None:
+        positions = np.intersect1d(positions, tiles.query(bbox))
+
+    if postcodes is not None:
+        low, high = [end.replace(" ", "").upper() for end in postcodes]
+        matches   = [position for position, codes in enumerate(get_postcodes())
+                     if any(in_range(postcode, low, high) for postcode in codes)]
+        positions = np.intersect1d(positions, matches)
+
+    if ids is not None:
+        positions = np.intersect1d(positions, store.get_positions(ids))
+
+    return positions
+
+def parse_selection(args):
+    """
+    Gives back the bbox, postcode range and ids of query arguments or command line options: bbox=<min x>,<min y>,<max x>,<max y>,
+    postcode=<low>-<high> and ids=<id>,<id>. Raises ValueError if one of them can not be read.
+    """
+    bbox, postcodes, ids = None, None, None
+
+    if args.get("bbox"):
+        bbox = [float(value) for value in args["bbox"].split(",")]
+        if len(bbox) != 4:
+            raise ValueError("bbox needs four values")
+
+    if args.get("postcode"):
+        postcodes = args["postcode"].split("-")
+        if len(postcodes) == 1:
+            postcodes = postcodes * 2
+        if len(postcodes) != 2:
+            raise ValueError("postcode should be a range like 1091AA-1092ZZ")
+
+    if args.get("ids"):
+        ids = [float(value) for value in args["ids"].split(",")]
+
+    return bbox, postcodes, ids
+
+def iter_chunks(positions, chunk_size=CHUNK_SIZE):
+    """
+    Gives the rows of the export in frames of chunk_size buildings. The data is taken when it is called, a streamed export
+    goes on after its request ended and can outlive a swap to another version of the snapshot.
+    """
+    df      = store.get_buildings()
+    lists   = {column: store.get_csr(column) for column in ROUTE_COLUMNS}
+    columns = [column for column in get_columns() if column not in ROUTE_COLUMNS]
+
+    return make_chunks(df, lists, columns, positions, chunk_size)
+
+def make_chunks(df, lists, columns, positions, chunk_size):
+    """Frames of chunk_size buildings of the given frame and encoded route columns"""
+    # an empty export still has the columns
+    for start in range(0, max(len(positions), 1), chunk_size):
+        chunk = df.iloc[positions[start:start + chunk_size]][columns].copy()
+        chunk["pand_id"] = chunk["pand_id"].astype(np.int64)
+
+        # route numbers are stored as integers already
+        for column in ROUTE_COLUMNS:
+            chunk[column] = columnar.to_lists(*lists[column], rows=positions[start:start + chunk_size])
+
+        yield chunk
+
+def write_csv(chunks):
+    """Writes the chunks as csv, lists are written as python strings like the building csv"""
+    for i, chunk in enumerate(chunks):
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, header=(i == 0), index=False)
+
+        yield buffer.getvalue().encode("utf-8")
+
+def write_ndjson(chunks):
+    """Writes the chunks as one json object per line"""
+    for chunk in chunks:
+        # newer pandas versions end with a newline already
+        lines = chunk.to_json(orient="records", lines=True).rstrip("\n")
+
+        if lines:
+            yield lines.encode("utf-8") + b"\n"
+
+class Sink:
+    """File for the parquet writer that keeps the written bytes until they are taken"""
+    closed = False
+
+    def __init__(self):
+        self.chunks   = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+
+        return data
+
+def write_parquet(chunks):
+    """Writes the chunks as parquet, one row group per chunk"""
+    sink   = Sink()
+    writer = None
+
+    for chunk in chunks:
+        table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(sink, table.schema)
+
+        writer.write_table(table)
+        yield sink.take()
+
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "parquet": write_parquet}
+
+def export(positions, file_format):
+    """Gives back a generator of the bytes of the export of the buildings at the given positions"""
+    if file_format not in WRITERS:
+        raise ValueError("unknown format " + str(file_format))
+    if file_format == "parquet" and pyarrow is None:
+        raise ValueError("parquet export needs pyarrow")
+
+    return WRITERS[file_format](iter_chunks(positions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export scores and blocked routes of buildings")
+    parser.add_argument("--format", default="csv", choices=list(FORMATS), help="file format of the export")
+    parser.add_argument("--bbox", help="min x,min y,max x,max y in web mercator")
+    parser.add_argument("--postcode", help="postcode range like 1091AA-1092ZZ or 1091-1092")
+    parser.add_argument("--ids", help="comma separated pand ids")
+    parser.add_argument("--output", help="file to write to, standard output by default")
+    args = parser.parse_args()
+
+    try:
+        positions = select(*parse_selection(vars(args)))
+        data      = export(positions, args.format)
+    except ValueError as error:
+        parser.error(str(error))
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    for part in data:
+        output.write(part)
+
+    if args.output:
+        output.close()
+    print("exported", len(positions), "buildings", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import pandas as pd
+import numpy as np
+from pyproj import Transformer
+
+from . import store, timing, snapshot, state
+
+TRAN_4326_TO_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857")
+
+GEOMETRY_PATH = "./data/geometry"
+ROADS_PATH    = "./data/all_roads_amsterdam.csv"
+LINES_PATH    = "./data/tram_metro_lijnen.csv"
+OV_PATH       = "./data/tram en metro lijnen plus stations.csv"
+
+LAYERS = ["buildings", "roads", "lines", "ov"]
+
+def parse_coordinates(string):
+    """Converts a string of "lat lon,lat lon" coordinates to a list of [lat, lon] pairs (not transformed)"""
+    string = string.replace('"', '')
+
+    coordinates = []
+    for coord in string.split(','):
+        coord = [c for c in coord.split(' ') if c != ""]
+        coordinates.append([float(coord[0]), float(coord[1])])
+
+    return coordinates
+
+def to_ragged(shapes):
+    """Puts a list of coordinate lists into one flat coordinate array and an offset array"""
+    lengths = np.array([len(shape) for shape in shapes], dtype=np.int64)
+
+    offsets     = np.zeros(len(shapes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+
+    coordinates = np.array([coord for shape in shapes for coord in shape], dtype=np.float64).reshape(-1, 2)
+
+    return coordinates, offsets
+
+def project(coordinates):
+    """Transforms a flat array of lat/lon coordinates to web mercator in one batch"""
+    with timing.stage("reproject"):
+        x, y = TRAN_4326_TO_3857.transform(coordinates[:, 0], coordinates[:, 1])
+
+    return np.column_stack([x, y])
+
+def build_layers():
+    """Projects all buildings, roads, tram/metro lines and ov segments, gives back the arrays per layer"""
+    shapes = {}
+
+    # roads that can be blocked
+    df = pd.read_csv(ROADS_PATH)
+    shapes["roads"] = (list(df['WKT_LAT_LNG'].apply(parse_coordinates)), df['number'].values.astype(np.float64))
+
+    # tram and metro lines for the base map
+    df = pd.read_csv(LINES_PATH)
+    shapes["lines"] = (list(df['WKT_LAT_LNG'].apply(parse_coordinates)), np.arange(len(df), dtype=np.float64))
+
+    # tram and metro segments between stations
+    df = pd.read_csv(OV_PATH)
+    shapes["ov"] = (list(df['lijn_coordinaten'].apply(parse_coordinates)), df['number'].values.astype(np.float64))
+
+    # building footprints in the order of the building store, already flat
+    xy, offsets, _ = store.get_csr("wgs")
+    layers = {"buildings": {"xy": project(np.asarray(xy)), "offsets": np.asarray(offsets),
+                            "ids": store.get_buildings().index.values.astype(np.float64)}}
+
+    for name, (coordinates, ids) in shapes.items():
+        coordinates, offsets = to_ragged(coordinates)
+        layers[name] = {"xy": project(coordinates), "offsets": offsets, "ids": ids}
+
+    return layers
+
+def build_geometry(path=GEOMETRY_PATH):
+    """Build step: writes the projected layers as .npy files that can be memory mapped"""
+    os.makedirs(path, exist_ok=True)
+
+    layers = build_layers()
+    for name, layer in layers.items():
+        for key, values in layer.items():
+            np.save(os.path.join(path, name + "_" + key + ".npy"), values)
+
+    return layers
+
+def load_geometry(path=None):
+    """Memory maps the projected layers of the snapshot or the build step, projects them in memory if there are none"""
+    if path is None:
+        path = snapshot.get_path("geometry") or GEOMETRY_PATH
+
+    try:
+        layers = {}
+        for name in LAYERS:
+            layers[name] = {key: np.load(os.path.join(path, name + "_" + key + ".npy"), mmap_mode="r")
+                            for key in ["xy", "offsets", "ids"]}
+
+        # geometry has to belong to the building data that is loaded
+        if not np.array_equal(layers["buildings"]["ids"], store.get_buildings().index.values):
+            print("geometry is out of date, projecting in memory")
+            layers = build_layers()
+    except FileNotFoundError:
+        layers = build_layers()
+
+    return state.put("geometry", layers)
+
+def get_layer(name):
+    """Gives back the projected arrays of a layer, loads them if that did not happen yet"""
+    layers = state.get("geometry")
+    if layers is None:
+        layers = load_geometry()
+
+    return layers[name]
+
+def get_shapes(name, positions=None):
+    """Gives back the x and y coordinates of the shapes at the given positions (all shapes if None)"""
+    layer   = get_layer(name)
+    xy      = layer["xy"]
+    offsets = layer["offsets"]
+
+    if positions is None:
+        positions = range(len(offsets) - 1)
+
+    xs = []
+    ys = []
+    for i in positions:
+        shape = xy[offsets[i]:offsets[i + 1]]
+        xs.append(shape[:, 0])
+        ys.append(shape[:, 1])
+
+    return xs, ys
+
+def get_positions(name, ids):
+    """Gives back the positions of the given ids in a layer, ids that are not present are skipped"""
+    layer_ids = get_layer(name)["ids"]
+
+    positions = np.flatnonzero(np.isin(layer_ids, np.asarray(ids, dtype=np.float64)))
+
+    return positions
+
+
+if __name__ == '__main__':
+    build_geometry()
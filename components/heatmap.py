@@ -1,95 +1,50 @@
-import pandas as pd
-import numpy as np
-import pyclipper
-from pyproj import Transformer, transform
-from ast import literal_eval
-from collections import Counter, OrderedDict
 import colorcet as cc
 
 # import bokeh modules
-from bokeh.plotting import figure, show
-from bokeh.tile_providers import get_provider, Vendors
-from bokeh.models.callbacks import CustomJS
-from bokeh.models import ColumnDataSource, TapTool, CustomJS, HoverTool, Line, MultiLine, LinearColorMapper, BasicTicker, ColorBar
+from bokeh.models import WMTSTileSource, TapTool, CustomJS, HoverTool, LinearColorMapper, ColorBar
 
-# reverse color map
-cc.fire.reverse()
+from . import store, tiles, raster
 
-TRAN_4326_TO_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857")
+# colors of the heatmap from low to high risk, reversed fire palette (a copy, colorcet itself is not changed)
+PALETTE = cc.fire[::-1]
 
-def draw_heatmap(fig, fire, score_type):
-    """"Draws all polygons given in the dataset and makes them clickable"""
-    
-    # load data
-    df = pd.read_csv("./data/city_area_buildings.csv")
-
-    x_coords = []
-    y_coords = []
-
-    # split coordinates to x and y coordinates
-    df["wgs"]         = df['wgs'].apply(lambda x:literal_eval(x))
-    df['full_adress'] = df["full_adress"].apply(str)
+def draw_heatmap(fig, fire, score_type, scores=None, query=""):
+    """
+    Draws all polygons given in the dataset and makes them clickable. Scores can be given as (scores, normalized scores),
+    otherwise the precomputed scores of score_type are used. Query is added to the url that loads the buildings in view.
+    """
     
-    for i in range(len(df)):
-        coords = df.iloc[i]['wgs']
-        coords = [TRAN_4326_TO_3857.transform(float(coord[0]), float(coord[1])) for coord in coords]
-        x_coords.append([[[c[1] for c in coords]]])
-        y_coords.append([[[c[0] for c in coords]]])
+    # get data from the building store
+    df = store.get_buildings()
 
     # identify score and fire type and select scores based on that
-    if score_type == 'default':
-        if fire == "small":
-            scores            = df['score_small_default']
-            scores_normalized = df['norm_score_small_default']
-        elif fire == "big":
-            scores            = df['score_big_default']
-            scores_normalized = df['norm_score_big_default']
-    elif score_type == 'residential':
-        if fire == "small":
-            scores            = df['score_small_residential']
-            scores_normalized = df['norm_score_small_residential']
-        elif fire == "big":
-            scores            = df['score_big_residential']
-    elif score_type == 'roads': 
-        if fire == "small":
-            scores            = df['score_small_road']
-            scores_normalized = df['norm_score_small_road']
-        elif fire == "big":
-            scores            = df['score_big_road']
-            scores_normalized = df['norm_score_big_road']
-
-    # put all selected data into dictionary
-    data = {'xs': x_coords, 'ys': y_coords, 'id':list(df["pand_id"]), 'scores':list(scores), 'norm_scores':list(scores_normalized), 
-            'full_adress':list(df['full_adress']), 'functions':list(df['gebruiksdoelVerblijfsobject'])}
-    
-    # set full adress in proper form for hovertool
-    data['full_adress'] = [item.replace("\n", "<br>") for item in data['full_adress']]
+    if scores is None:
+        # the focus on roads is called road in the columns
+        focus = "road" if score_type == "roads" else score_type
 
-    # set functions in proper form for hovertool
-    all_functions = []
+        scores = (df['score_' + fire + '_' + focus].values, df['norm_score_' + fire + '_' + focus].values)
 
-    for item in data["functions"]:
-        item   = dict(Counter(literal_eval(item)))
-        string = str()
+    scores_normalized = scores[1]
 
-        for element in item:
-            string = string + str(item[element]) + " " + str(element) + "<br>"
-        
-        all_functions.append(string)
+    # only the buildings in view are sent, the rest is loaded when the map is moved
+    bbox, level = tiles.get_view(fig)
+    positions   = tiles.query(bbox)
 
-    data['functions'] = all_functions
+    # zoomed out maps of the precomputed scores show raster tiles instead of polygons
+    max_width = raster.max_width() if score_type in raster.FOCUSES else 0
+    if max_width > 0 and bbox[2] - bbox[0] > max_width:
+        positions = positions[:0]
+
+    data = tiles.get_data(positions, level, scores)
 
     # create color mapper for plotting
-    exp_cmap = LinearColorMapper(palette=cc.fire, 
+    exp_cmap = LinearColorMapper(palette=PALETTE, 
                              low = min(scores_normalized), 
                              high = max(scores_normalized))
 
-    # set source for polygons
-    s1 = ColumnDataSource(data=data)
-
-    # all buildings to be plotted on map
-    glyph = fig.multi_polygons(xs='ys', ys='xs', color={"field":"norm_scores", "transform":exp_cmap}, name="pand", 
-                                source = s1, alpha=0.8, line_color="black", line_width=0.05)
+    # all buildings to be plotted on map, with the sources of the polygons
+    glyph, s1, coordinates = tiles.add_buildings(fig, data, color={"field":"norm_scores", "transform":exp_cmap}, name="pand",
+                                                 alpha=0.8, line_color="black", line_width=0.05)
     
     # callback when a building is clicked
     call = CustomJS(args=dict(source=s1, fire=fire), code="""
@@ -111,6 +66,12 @@ def draw_heatmap(fig, fire, score_type):
     tap = TapTool(renderers=[glyph], callback=call)
     fig.add_tools(tap)
 
+    # load other buildings when the view changes, with the same scores
+    tiles.add_viewport_loading(fig, s1, coordinates, query, max_width)
+
+    if max_width > 0:
+        fig = add_raster(fig, glyph, fire, score_type, max_width)
+
     # custom hovertool (necessary for "Click for more info..." part)
     TOOLTIPS="""
     <div class="bk" style="display: table; border-spacing: 2px;">
@@ -164,4 +125,24 @@ def draw_heatmap(fig, fire, score_type):
     bar = ColorBar(color_mapper=exp_cmap, location=(0,0), major_label_overrides={0:"0   Low effect", 1:"1   High effect"}, major_label_text_align="left")
     fig.add_layout(bar, "right")
 
-    return fig
\ No newline at end of file
+    return fig
+
+def add_raster(fig, glyph, fire, score_type, max_width):
+    """Adds the raster tiles of the heatmap, shown instead of the polygons when the view is wider than max_width meters"""
+    wide = fig.x_range.end - fig.x_range.start > max_width
+
+    tiles_raster = fig.add_tile(WMTSTileSource(url=raster.get_url(fire, score_type)), visible=wide)
+    glyph.visible = not wide
+
+    # switch between raster and polygons when zooming
+    callback = CustomJS(args=dict(plot=fig, raster=tiles_raster, glyph=glyph, max_width=max_width), code="""
+        var wide = plot.x_range.end - plot.x_range.start > max_width;
+
+        raster.visible = wide;
+        glyph.visible  = !wide;
+    """)
+
+    fig.x_range.js_on_change('start', callback)
+    fig.x_range.js_on_change('end', callback)
+
+    return fig
@@ -0,0 +1,354 @@
+import os
+import json
+import pandas as pd
+import numpy as np
+import pyclipper
+from collections import Counter
+
+from . import store, geometry, scoring, scenario, neighbors, network, transit, snapshot, state
+
+IMPACT_PATH = "./data/impact"
+OV_PATH     = "./data/tram en metro lijnen plus stations.csv"
+ROADS_PATH  = "./data/all_roads_amsterdam.csv"
+
+FIRES = ["small", "big"]
+
+# radius around the building in meters and in degrees per fire size
+METERS = {"small": 10, "big": 25}
+RADIUS = {fire: meters/100000 for fire, meters in METERS.items()}
+
+# largest number of fires in one compound scenario
+MAX_FIRES = 100
+
+# format of the precomputed bundles, raise it whenever make_bundle gives back other keys so older bundles are not served
+BUNDLE_FORMAT = 3
+
+ROAD_TYPES = {"calamiteit": "calamiteiten route", "hoofd": "hoofdnet route", "plus": "plusnet route"}
+
+# ov segments and roads, filled by load_routes
+_OV    = None
+_ROADS = None
+
+def load_routes():
+    """Reads the ov segments and roads once for the whole process, indexed on their number"""
+    global _OV, _ROADS
+
+    _OV    = pd.read_csv(OV_PATH, usecols=["number", "station1", "station2", "coords_s1", "coords_s2", "modaliteit", "lijn"]).set_index("number", drop=False)
+    _ROADS = pd.read_csv(ROADS_PATH, usecols=["number", "STT_NAAM", "AUTO"]).set_index("number", drop=False)
+
+    return _OV, _ROADS
+
+def get_routes():
+    """Gives back the ov segments and roads, reads them if that did not happen yet"""
+    if _OV is None:
+        load_routes()
+
+    return _OV, _ROADS
+
+def to_list(coordinates):
+    """Projected coordinates as a list rounded to centimeters, to keep the bundles small"""
+    return np.round(np.asarray(coordinates, dtype=float), 2).tolist()
+
+def count_functions(lists):
+    """Counts the functions of all buildings in a list of function lists"""
+    return dict(Counter(function for functions in lists for function in functions))
+
+def format_addresses(df_linked):
+    """Addresses of the linked buildings as one html string, unknown addresses are counted"""
+    count_unkown = df_linked.full_adress.isnull().values.ravel().sum()
+    all_adresses = list(df_linked.loc[df_linked['full_adress'].notnull(), 'full_adress'].values)
+
+    # create complete address
+    complete_adress = str()
+
+    for adress in all_adresses:
+        if "All in Amsterdam" in adress:
+            complete_adress += adress.replace("All in Amsterdam", "")
+        else:
+            complete_adress += adress.replace("\n", " ").replace(" Amsterdam", "\n")
+
+    complete_adress = complete_adress + "All in Amsterdam"
+
+    if count_unkown > 0:
+        complete_adress += "\n" + str(count_unkown) + " unkown adresses"
+
+    return complete_adress.replace("\n", "<br>")
+
+def get_radius(coordinates, fire):
+    """Projected outline of the radius around a building (calculated on the original coordinates)"""
+    clipper_offset = pyclipper.PyclipperOffset()
+    clipper_offset.AddPath(pyclipper.scale_to_clipper(coordinates), pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+
+    new_coordinates = pyclipper.scale_from_clipper(clipper_offset.Execute(pyclipper.scale_to_clipper(RADIUS[fire])))
+    projected       = geometry.project(np.array(new_coordinates[0]))
+
+    return {"xs": to_list(projected[:, 0]), "ys": to_list(projected[:, 1])}
+
+def get_blocked_ov(numbers):
+    """Blocked ov segments with their stations and projected coordinates"""
+    ov, _ = get_routes()
+    df    = ov.loc[ov.index.intersection(numbers)]
+
+    if len(df) == 0:
+        return []
+
+    all_coordsx, all_coordsy = geometry.get_shapes("ov", geometry.get_positions("ov", df.number))
+
+    # project the stations of all segments in one go
+    stations = geometry.project(np.array([[float(value) for value in coords.split(" ")]
+                                          for coords in pd.concat([df.coords_s1, df.coords_s2])]))
+
+    blocked = []
+    for i, (row, coordsx, coordsy) in enumerate(zip(df.itertuples(), all_coordsx, all_coordsy)):
+        blocked.append({"number": int(row.number), "stations": str(row.station1) + " - " + str(row.station2),
+                        "line": str(row.modaliteit) + " " + str(row.lijn), "xs": to_list(coordsx), "ys": to_list(coordsy),
+                        "station_xs": to_list(stations[[i, len(df) + i], 0]), "station_ys": to_list(stations[[i, len(df) + i], 1])})
+
+    return blocked
+
+def get_blocked_roads(numbers):
+    """Blocked roads with their name, type and projected coordinates"""
+    _, roads = get_routes()
+    df       = roads.loc[roads.index.intersection(numbers)]
+
+    if len(df) == 0:
+        return []
+
+    all_coordsx, all_coordsy = geometry.get_shapes("roads", geometry.get_positions("roads", df.number))
+
+    return [{"number": int(row.number), "name": row.STT_NAAM, "type": ROAD_TYPES.get(row.AUTO, row.AUTO),
+             "xs": to_list(coordsx), "ys": to_list(coordsy)}
+            for row, coordsx, coordsy in zip(df.itertuples(), all_coordsx, all_coordsy)]
+
+def get_outline(position, radius):
+    """Projected outline of a radius in meters around a building"""
+    x, y = scenario.get_outline(position, radius)
+
+    return {"xs": to_list(x), "ys": to_list(y)}
+
+def get_access(road_numbers):
+    """Detours around the blocked roads and the road length that can not be reached anymore, with the names of the roads"""
+    _, roads = get_routes()
+    access   = network.get_access(road_numbers)
+
+    detours = [dict(detour, name=", ".join(sorted(set(str(roads.STT_NAAM.get(number, "")) for number in detour["numbers"]))))
+               for detour in access["detours"]]
+
+    return dict(access, detours=detours)
+
+def get_raw_scores(functions, ov_numbers, road_numbers):
+    """Raw score of every focus for the counted functions and blocked ov segments and roads, the same as scoring.get_scores"""
+    ov, roads  = get_routes()
+    modalities = ov.loc[ov.index.intersection(ov_numbers)].modaliteit.value_counts()
+    road_types = roads.loc[roads.index.intersection(road_numbers)].AUTO.value_counts()
+
+    return {focus: float(sum(weights["function"].get(name, 0) * count for name, count in functions.items())
+                         + sum(weights["ov"].get(name, 0) * count for name, count in modalities.items())
+                         + sum(weights["road"].get(name, 0) * count for name, count in road_types.items()))
+            for focus, weights in scoring.WEIGHTS.items()}
+
+def get_affected(position, fire, radius=None):
+    """
+    Ids of the buildings, roads and ov segments affected by a fire in the building at position. Fires with a radius in
+    meters are looked up in the distance tables when they reach far enough, and searched in the spatial index otherwise.
+    """
+    if radius is None:
+        return {"buildings": np.asarray(store.get_list("linked_" + fire, position), dtype=float),
+                "roads": np.asarray(store.get_list("roads_" + fire, position), dtype=float),
+                "ov": np.asarray(store.get_list("ov_" + fire, position), dtype=float)}
+
+    if radius <= neighbors.get_max_distance():
+        return neighbors.find_impact(position, radius)
+
+    return scenario.find_impact(position, radius)
+
+def make_bundle(position, fire, radius=None):
+    """
+    Everything the building page shows about a building and a fire size, or a fire with a radius in meters. Fires with a
+    radius beyond the distance tables only have raw scores because there is nothing to normalize with.
+    """
+    df       = store.get_buildings()
+    building = df.iloc[position]
+    xs, ys   = geometry.get_shapes("buildings", [position])
+    found    = get_affected(position, fire, radius)
+
+    if radius is None:
+        outline = get_radius(store.get_list("wgs", position), fire)
+        scores  = {focus: float(building["norm_score_" + fire + "_" + focus]) for focus in scoring.WEIGHTS}
+        meters  = METERS[fire]
+    else:
+        outline = get_outline(position, radius)
+        meters  = radius
+
+        # scores of all buildings are only known within the distance tables
+        if radius <= neighbors.get_max_distance():
+            scores = {focus: float(neighbors.score_radius(radius)[1][position, i]) for i, focus in enumerate(scoring.WEIGHTS)}
+        else:
+            scores = None
+
+    linked_ids, ov_ids, road_ids = found["buildings"], found["ov"], found["roads"]
+
+    linked           = store.get_linked(linked_ids)
+    adjacent         = store.get_list("neighbors", position)
+    functions        = count_functions([store.get_list("gebruiksdoelVerblijfsobject", position)])
+    radius_functions = count_functions(store.get_lists("gebruiksdoelVerblijfsobject", store.get_positions(linked_ids)))
+
+    return {
+        "pand_id": int(building.pand_id),
+        "fire": fire,
+        "meters": meters,
+        "address": None if pd.isnull(building.full_adress) else str(building.full_adress),
+        "functions": functions,
+        "neighbor_functions": count_functions(store.get_lists("gebruiksdoelVerblijfsobject", store.get_positions(adjacent))),
+        "radius_functions": radius_functions,
+        "amount_neighbors": len(adjacent),
+        "amount_radius": len(linked_ids),
+        "radius_addresses": format_addresses(linked),
+        "scores": scores,
+        "raw_scores": get_raw_scores(Counter(functions) + Counter(radius_functions), ov_ids, road_ids),
+        "geometry": {"xs": to_list(xs[0]), "ys": to_list(ys[0])},
+        "radius": outline,
+        "ov": get_blocked_ov(ov_ids),
+        "transit": transit.get_disruption(ov_ids),
+        "roads": get_blocked_roads(road_ids),
+        "access": get_access(road_ids),
+    }
+
+def parse_fires(value):
+    """
+    Reads a list of fires like <pand id>:small,<pand id>:big,<pand id>:40 (a radius in meters) into (position, fire, radius)
+    tuples. Raises ValueError for fires that can not be read and KeyError for unknown buildings.
+    """
+    fires = []
+    for part in value.split(","):
+        pand_id, _, size = part.partition(":")
+        positions        = store.get_positions([float(pand_id)])
+
+        if len(positions) == 0:
+            raise KeyError(pand_id)
+
+        if size in FIRES:
+            fires.append((int(positions[0]), size, None))
+        else:
+            fires.append((int(positions[0]), "radius", scenario.check_radius(size)))
+
+    if len(fires) > MAX_FIRES:
+        raise ValueError("at most " + str(MAX_FIRES) + " fires at once")
+
+    return fires
+
+def make_compound(fires):
+    """Impact of several fires at once, fires are (position, fire, radius) tuples as given by parse_fires"""
+    df        = store.get_buildings()
+    positions = np.array([position for position, _, _ in fires], dtype=np.int64)
+    burning   = df.index.values[positions].astype(np.int64)
+
+    # union of the affected ids of all fires, burning buildings are not counted as affected
+    found    = [get_affected(position, fire, radius) for position, fire, radius in fires]
+    affected = {name: np.unique(np.concatenate([np.asarray(ids[name], dtype=np.int64) for ids in found]))
+                for name in ["buildings", "roads", "ov"]}
+    affected["buildings"] = np.setdiff1d(affected["buildings"], burning)
+
+    linked           = store.get_linked(affected["buildings"])
+    functions        = count_functions(store.get_lists("gebruiksdoelVerblijfsobject", positions))
+    radius_functions = count_functions(store.get_lists("gebruiksdoelVerblijfsobject", store.get_positions(affected["buildings"])))
+
+    return {
+        "fires": [{"pand_id": int(burning[i]), "fire": fire, "meters": METERS[fire] if radius is None else radius,
+                   "address": None if pd.isnull(df.full_adress.iloc[position]) else str(df.full_adress.iloc[position]),
+                   "radius": get_radius(store.get_list("wgs", position), fire) if radius is None else get_outline(position, radius)}
+                  for i, (position, fire, radius) in enumerate(fires)],
+        "functions": functions,
+        "radius_functions": radius_functions,
+        "amount_radius": len(affected["buildings"]),
+        "radius_addresses": format_addresses(linked),
+        "raw_scores": get_raw_scores(Counter(functions) + Counter(radius_functions), affected["ov"], affected["roads"]),
+        "buildings": affected["buildings"].tolist(),
+        "ov": get_blocked_ov(affected["ov"]),
+        "transit": transit.get_disruption(affected["ov"]),
+        "roads": get_blocked_roads(affected["roads"]),
+        "access": get_access(affected["roads"]),
+    }
+
+def build_impact(path=IMPACT_PATH):
+    """Writes the bundles of all buildings, one json line per building and fire with the byte offsets of the lines"""
+    os.makedirs(path, exist_ok=True)
+
+    df = store.get_buildings()
+
+    for fire in FIRES:
+        offsets = np.zeros(len(df) + 1, dtype=np.int64)
+
+        with open(os.path.join(path, fire + ".ndjson"), "wb") as file:
+            for position in range(len(df)):
+                file.write(json.dumps(make_bundle(position, fire), separators=(",", ":")).encode("utf-8") + b"\n")
+                offsets[position + 1] = file.tell()
+
+        np.save(os.path.join(path, fire + "_offsets.npy"), offsets)
+        print("wrote", len(df), "bundles of", fire, "fires")
+
+    np.save(os.path.join(path, "ids.npy"), df.index.values)
+    np.save(os.path.join(path, "buildings.npy"), np.array(snapshot.get_buildings_version()))
+    np.save(os.path.join(path, "format.npy"), np.array(BUNDLE_FORMAT))
+
+def load_impact(path=IMPACT_PATH):
+    """
+    Memory maps the bundles, bundles are made on request if they are missing, belong to other buildings or are written in
+    another format
+    """
+    bundles = state.put("impact", {})
+
+    format_path = os.path.join(path, "format.npy")
+    if not os.path.exists(format_path) or int(np.load(format_path)) != BUNDLE_FORMAT:
+        return bundles
+
+    ids_path = os.path.join(path, "ids.npy")
+    if not os.path.exists(ids_path) or not np.array_equal(np.load(ids_path), store.get_buildings().index.values):
+        return bundles
+
+    # a refresh of the snapshot changes buildings without changing their ids
+    version_path = os.path.join(path, "buildings.npy")
+    if (str(np.load(version_path)) if os.path.exists(version_path) else "") != snapshot.get_buildings_version():
+        return bundles
+
+    for fire in FIRES:
+        bundles[fire] = (np.memmap(os.path.join(path, fire + ".ndjson"), dtype=np.uint8, mode="r"),
+                         np.load(os.path.join(path, fire + "_offsets.npy"), mmap_mode="r"))
+
+    return bundles
+
+def get_bundle_json(pand_id, fire, radius=None):
+    """
+    Gives back the bundle of a building as json, for a fire with a radius in meters if given. Raises KeyError for unknown
+    buildings or fire sizes and ValueError for a radius that is not allowed.
+    """
+    bundles = state.get("impact")
+    if bundles is None:
+        bundles = load_impact()
+
+    try:
+        positions = store.get_positions([float(pand_id)])
+    except ValueError:
+        raise KeyError(pand_id)
+
+    if len(positions) == 0 or fire not in FIRES:
+        raise KeyError(pand_id)
+
+    position = int(positions[0])
+
+    if radius is not None:
+        return json.dumps(make_bundle(position, fire, scenario.check_radius(radius)), separators=(",", ":")).encode("utf-8")
+
+    if fire in bundles:
+        lines, offsets = bundles[fire]
+        return bytes(lines[offsets[position]:offsets[position + 1] - 1])
+
+    return json.dumps(make_bundle(position, fire), separators=(",", ":")).encode("utf-8")
+
+def get_bundle(pand_id, fire, radius=None):
+    """Gives back the bundle of a building, see get_bundle_json"""
+    return json.loads(get_bundle_json(pand_id, fire, radius))
+
+
+if __name__ == '__main__':
+    build_impact()
@@ -0,0 +1,178 @@
+"""
+Sparse table with for every building the distance in meters to every building, road and ov segment within a maximum
+distance, sorted by distance per building (csr layout). The impact of a fire with any radius up to the maximum is a binary
+search and a slice of the table. Build it from the root of the project after the geometry:
+
+    python -m components.neighbors --max-distance 50
+"""
+import os
+import argparse
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix, hstack
+
+from . import store, geometry, scoring, scenario, impact, snapshot, state
+from .columnar import to_offsets
+
+NEIGHBORS_PATH = "./data/neighbors"
+MAX_DISTANCE   = 50
+
+# number of buildings searched at once while building the table
+CHUNK_SIZE = 10000
+
+# number of radii of which the scores of all buildings are kept
+CACHE_SIZE = 16
+
+LAYERS = ["buildings", "roads", "ov"]
+
+def build_table(name, max_distance):
+    """Distance table from every building to the shapes of a layer within max_distance meters, a building is not its own neighbor"""
+    index     = scenario.get_index()
+    buildings = index["buildings"][1]
+    tree, shapes, _ = index[name]
+
+    all_rows, all_columns, all_distances = [], [], []
+    for start in range(0, len(buildings), CHUNK_SIZE):
+        chunk         = buildings[start:start + CHUNK_SIZE]
+        rows, columns = tree.query(chunk, predicate="dwithin", distance=max_distance)
+        distances     = shapely.distance(chunk[rows], shapes[columns])
+        rows          = rows + start
+
+        if name == "buildings":
+            keep = rows != columns
+            rows, columns, distances = rows[keep], columns[keep], distances[keep]
+
+        all_rows.append(rows)
+        all_columns.append(columns)
+        all_distances.append(distances)
+
+    rows      = np.concatenate(all_rows)
+    columns   = np.concatenate(all_columns)
+    distances = np.concatenate(all_distances)
+
+    # per building, nearest first
+    order = np.lexsort((columns, distances, rows))
+
+    return {"offsets": to_offsets(np.bincount(rows, minlength=len(buildings))),
+            "positions": columns[order].astype(np.int32),
+            "distances": distances[order].astype(np.float32)}
+
+def build_neighbors(path=NEIGHBORS_PATH, max_distance=MAX_DISTANCE):
+    """Build step: writes the distance tables of all layers as .npy files that can be memory mapped"""
+    os.makedirs(path, exist_ok=True)
+
+    for name in LAYERS:
+        table = build_table(name, max_distance)
+        for key, values in table.items():
+            np.save(os.path.join(path, name + "_" + key + ".npy"), values)
+
+        print("wrote", len(table["positions"]), "pairs of buildings and", name)
+
+    np.save(os.path.join(path, "ids.npy"), store.get_buildings().index.values)
+    np.save(os.path.join(path, "buildings.npy"), np.array(snapshot.get_buildings_version()))
+    np.save(os.path.join(path, "max_distance.npy"), np.array(max_distance, dtype=np.float64))
+
+def load_neighbors(path=NEIGHBORS_PATH):
+    """Memory maps the distance tables, there are none if they are missing or belong to other buildings"""
+    tables = state.put("neighbors", {})
+
+    ids_path = os.path.join(path, "ids.npy")
+    if not os.path.exists(ids_path) or not np.array_equal(np.load(ids_path), store.get_buildings().index.values):
+        return tables
+
+    # a refresh of the snapshot changes buildings without changing their ids
+    version_path = os.path.join(path, "buildings.npy")
+    if (str(np.load(version_path)) if os.path.exists(version_path) else "") != snapshot.get_buildings_version():
+        return tables
+
+    for name in LAYERS:
+        tables[name] = {key: np.load(os.path.join(path, name + "_" + key + ".npy"), mmap_mode="r")
+                        for key in ["offsets", "positions", "distances"]}
+
+    tables["max_distance"] = float(np.load(os.path.join(path, "max_distance.npy")))
+
+    return tables
+
+def get_tables():
+    """Gives back the tables per layer and their maximum distance, loads them if that did not happen yet"""
+    tables = state.get("neighbors")
+    if tables is None:
+        tables = load_neighbors()
+
+    return tables
+
+def get_max_distance():
+    """Largest radius in meters the tables can answer, 0 if there are no tables"""
+    return get_tables().get("max_distance", 0)
+
+def within(position, name, radius):
+    """Positions in a layer of the shapes within radius meters of the building at position, nearest first"""
+    table = get_tables()[name]
+    start = table["offsets"][position]
+    end   = table["offsets"][position + 1]
+
+    # distances are sorted, so everything up to the radius is one slice
+    end = start + np.searchsorted(table["distances"][start:end], radius, side="right")
+
+    return np.asarray(table["positions"][start:end])
+
+def find_impact(position, radius):
+    """Ids of the buildings, roads and ov segments within radius meters of the building at position"""
+    return {name: np.asarray(geometry.get_layer(name)["ids"], dtype=float)[within(position, name, radius)] for name in LAYERS}
+
+def incidence_within(name, radius):
+    """Sparse building x shape matrix with a one for every shape of a layer within radius meters"""
+    table = get_tables()[name]
+    keep  = np.asarray(table["distances"]) <= radius
+    rows  = np.repeat(np.arange(len(table["offsets"]) - 1), np.diff(table["offsets"]))[keep]
+
+    return csr_matrix((np.ones(len(rows)), (rows, np.asarray(table["positions"])[keep])),
+                      shape=(len(table["offsets"]) - 1, len(geometry.get_layer(name)["offsets"]) - 1))
+
+def get_counts(radius):
+    """Building x feature count matrix for a fire with radius meters, columns as (kind, name) pairs like scoring.get_counts"""
+    ov, roads = impact.get_routes()
+
+    # type of every shape in the ov and road layers
+    modality  = ov.modaliteit.reindex(np.asarray(geometry.get_layer("ov")["ids"])).fillna("").values
+    road_type = roads.AUTO.reindex(np.asarray(geometry.get_layer("roads")["ids"])).fillna("").values
+
+    modalities = sorted(set(modality) - {""})
+    road_types = sorted(set(road_type) - {""})
+    lists      = store.get_lists("gebruiksdoelVerblijfsobject")
+    functions  = sorted(set(function for values in lists for function in values))
+
+    columns = [("ov", name) for name in modalities] + [("road", name) for name in road_types] + \
+              [("function", name) for name in functions]
+
+    # segment x modality, road x type and building x function, shapes without a type are left out
+    ov_modality    = scoring.one_hot(modality, modalities + [""])[:, :len(modalities)]
+    road_type      = scoring.one_hot(road_type, road_types + [""])[:, :len(road_types)]
+    function_count = scoring.counts(lists, functions)
+
+    matrix = hstack([incidence_within("ov", radius) @ ov_modality, incidence_within("roads", radius) @ road_type,
+                     function_count + incidence_within("buildings", radius) @ function_count]).tocsr()
+
+    return columns, matrix
+
+@state.cached(CACHE_SIZE)
+def score_radius(radius):
+    """Raw and min max normalized scores of all buildings for every focus for a fire with radius meters"""
+    columns, matrix = get_counts(radius)
+    scores          = matrix @ scoring.weight_matrix(columns)
+
+    scale = scores.max(axis=0) - scores.min(axis=0)
+    scale[scale == 0] = 1
+
+    return scores, (scores - scores.min(axis=0)) / scale
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the distance tables of buildings, roads and ov segments")
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE, help="largest radius in meters that can be asked for")
+    args = parser.parse_args()
+
+    build_neighbors(max_distance=args.max_distance)
+
+
+if __name__ == '__main__':
+    main()
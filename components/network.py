@@ -0,0 +1,218 @@
+import heapq
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra, connected_components
+
+from . import geometry, scenario, snapshot, state
+
+# road vertices closer than this many meters are the same junction
+SNAP = 1.0
+
+# number of landmarks of which the distances to all junctions are kept, more landmarks give tighter bounds
+LANDMARKS = 8
+
+# detours longer than this many meters are not searched, the road counts as cut off
+MAX_DETOUR = 5000
+
+# largest number of points of a closure between which detours are searched
+MAX_ENTRIES = 6
+
+# number of sets of blocked roads of which the access impact is kept
+CACHE_SIZE = 256
+
+# arrays of the road graph that are kept in the snapshot
+ARRAYS = ["indptr", "indices", "lengths", "numbers", "size", "landmarks", "distances", "main"]
+
+def build_network():
+    """
+    Builds the road graph: junctions are road vertices snapped to SNAP meters, every piece of road between two vertices is
+    an edge in both directions with its length in meters and the number of its road.
+    """
+    layer   = geometry.get_layer("roads")
+    offsets = np.asarray(layer["offsets"])
+    metric  = scenario.project_metric("roads")
+
+    # junction of every vertex
+    junctions, node = np.unique(np.round(metric / SNAP).astype(np.int64), axis=0, return_inverse=True)
+    node = node.ravel()
+
+    # pieces between consecutive vertices of the same road
+    shape   = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    same    = shape[:-1] == shape[1:]
+    sources = node[:-1][same]
+    targets = node[1:][same]
+    lengths = np.hypot(*(metric[1:][same] - metric[:-1][same]).T)
+    numbers = np.asarray(layer["ids"], dtype=float)[shape[:-1][same]]
+
+    keep = sources != targets
+    sources, targets, lengths, numbers = sources[keep], targets[keep], lengths[keep], numbers[keep]
+
+    # both directions, sorted per junction
+    sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+    lengths, numbers = np.concatenate([lengths, lengths]), np.concatenate([numbers, numbers])
+
+    order  = np.argsort(sources, kind="stable")
+    indptr = np.zeros(len(junctions) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=len(junctions)))
+
+    network = {"indptr": indptr, "indices": targets[order], "lengths": lengths[order], "numbers": numbers[order],
+               "size": len(junctions)}
+
+    network["landmarks"], network["distances"] = choose_landmarks(network)
+
+    # junctions connected to the largest part of the network when nothing is blocked
+    network["main"] = main_component(network, np.zeros(len(network["indices"]), dtype=bool))
+
+    return network
+
+def to_matrix(network, blocked):
+    """Sparse adjacency matrix of the network without the blocked edges"""
+    rows    = np.repeat(np.arange(network["size"]), np.diff(network["indptr"]))[~blocked]
+    columns = network["indices"][~blocked]
+    lengths = network["lengths"][~blocked]
+
+    # scipy sums duplicate entries, only keep the shortest of parallel roads
+    order = np.lexsort((lengths, columns, rows))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (rows[order][1:] != rows[order][:-1]) | (columns[order][1:] != columns[order][:-1])
+    order = order[first]
+
+    return csr_matrix((lengths[order], (rows[order], columns[order])), shape=(network["size"], network["size"]))
+
+def choose_landmarks(network):
+    """Picks landmarks far away from each other (each one the farthest from the ones before) with their distances to all junctions"""
+    matrix    = to_matrix(network, np.zeros(len(network["indices"]), dtype=bool))
+    landmarks = [0]
+    distances = []
+
+    for _ in range(min(LANDMARKS, network["size"])):
+        distances.append(dijkstra(matrix, indices=landmarks[-1]))
+
+        # farthest junction that can be reached from all landmarks so far
+        nearest = np.min(distances, axis=0)
+        nearest[~np.isfinite(nearest)] = -1
+        landmarks.append(int(np.argmax(nearest)))
+
+    return np.array(landmarks[:-1]), np.array(distances, dtype=np.float32)
+
+def main_component(network, blocked):
+    """Mask of the junctions in the largest connected part of the network without the blocked edges"""
+    _, labels = connected_components(to_matrix(network, blocked), directed=False)
+
+    return labels == np.argmax(np.bincount(labels))
+
+def load_network():
+    """Memory maps the road graph of the snapshot, or builds it once for the whole process if there is no snapshot"""
+    arrays = snapshot.read_arrays("network")
+
+    if arrays is None:
+        return state.put("network", build_network())
+
+    return state.put("network", dict(arrays, size=int(arrays["size"])))
+
+def get_network():
+    """Gives back the road graph, builds it if that did not happen yet"""
+    network = state.get("network")
+    if network is None:
+        network = load_network()
+
+    return network
+
+def lower_bound(network, node, target):
+    """Lower bound of the distance between two junctions from the landmark distances (triangle inequality)"""
+    distances = network["distances"]
+
+    with np.errstate(invalid="ignore"):
+        bound = np.abs(distances[:, target] - distances[:, node])
+
+    # different parts of the network can not be reached at all
+    if np.isinf(distances[:, node]).any() != np.isinf(distances[:, target]).any():
+        return np.inf
+
+    return float(np.nanmax(bound)) if np.isfinite(bound).any() else 0.0
+
+def shortest_path(network, source, target, blocked, limit=np.inf):
+    """
+    Length of the shortest path between two junctions without the blocked edges, A* search guided by the landmarks.
+    Gives back inf if there is no path shorter than limit. Blocking roads only makes paths longer, so the landmark
+    distances of the whole network stay valid lower bounds.
+    """
+    indptr, indices, lengths = network["indptr"], network["indices"], network["lengths"]
+
+    best = {source: 0.0}
+    heap = [(lower_bound(network, source, target), 0.0, source)]
+
+    while heap:
+        estimate, length, node = heapq.heappop(heap)
+
+        if node == target:
+            return length
+        if estimate > limit:
+            return np.inf
+        if length > best.get(node, np.inf):
+            continue
+
+        for edge in range(indptr[node], indptr[node + 1]):
+            if blocked[edge]:
+                continue
+
+            neighbor   = indices[edge]
+            new_length = length + lengths[edge]
+
+            if new_length < best.get(neighbor, np.inf):
+                best[neighbor] = new_length
+                heapq.heappush(heap, (new_length + lower_bound(network, neighbor, target), new_length, neighbor))
+
+    return np.inf
+
+def get_closures(network, blocked):
+    """
+    Splits the blocked edges in closures (blocked roads that are connected to each other) and gives back for every
+    closure its junctions where it meets open road and the numbers of its roads
+    """
+    rows = np.repeat(np.arange(network["size"]), np.diff(network["indptr"]))
+
+    matrix    = csr_matrix((np.ones(blocked.sum()), (rows[blocked], network["indices"][blocked])), shape=(network["size"], network["size"]))
+    _, labels = connected_components(matrix, directed=False)
+
+    # junctions on blocked roads that still have open road
+    on_blocked = np.bincount(rows[blocked], minlength=network["size"]) > 0
+    on_open    = np.bincount(rows[~blocked], minlength=network["size"]) > 0
+
+    closures = []
+    for label in np.unique(labels[rows[blocked]]):
+        closures.append((np.flatnonzero(on_blocked & on_open & (labels == label)),
+                         np.unique(network["numbers"][blocked & (labels[rows] == label)])))
+
+    return closures
+
+@state.cached(CACHE_SIZE)
+def find_access(numbers):
+    """Detours around every closure and the lost road length for a sorted tuple of blocked road numbers, the last results are cached"""
+    network = get_network()
+    blocked = np.isin(network["numbers"], numbers)
+    nothing = np.zeros(len(blocked), dtype=bool)
+
+    # detour between every two points where a closure meets open road, against the way through the closure
+    detours = []
+    for entries, closed in get_closures(network, blocked):
+        for i, source in enumerate(entries[:MAX_ENTRIES]):
+            for target in entries[i + 1:MAX_ENTRIES]:
+                normal = shortest_path(network, source, target, nothing)
+                detour = shortest_path(network, source, target, blocked, normal + MAX_DETOUR)
+
+                detours.append({"numbers": [int(number) for number in closed], "normal": round(float(normal), 1),
+                                "detour": None if np.isinf(detour) else round(float(detour), 1),
+                                "extra": None if np.isinf(detour) else round(float(detour - normal), 1)})
+
+    # junctions with open road that can not be reached from the rest of the network anymore
+    rows = np.repeat(np.arange(network["size"]), np.diff(network["indptr"]))
+    lost = network["main"] & ~main_component(network, blocked) & (np.bincount(rows[~blocked], minlength=network["size"]) > 0)
+
+    edges = (lost[rows] | lost[network["indices"]]) & ~blocked
+
+    return {"detours": detours, "lost_junctions": int(lost.sum()), "lost_length": round(float(network["lengths"][edges].sum() / 2), 1)}
+
+def get_access(numbers):
+    """Gives back the detours around the closed roads and the road length that can not be reached anymore"""
+    return find_access(tuple(sorted(float(number) for number in numbers)))
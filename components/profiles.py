@@ -0,0 +1,90 @@
+import math
+import pandas as pd
+import numpy as np
+from copy import deepcopy
+from scipy.sparse import csr_matrix
+
+from . import store, scoring, snapshot, state
+
+OV_PATH    = "./data/tram en metro lijnen plus stations.csv"
+ROADS_PATH = "./data/all_roads_amsterdam.csv"
+
+# number of weight profiles of which the scores are kept
+CACHE_SIZE = 64
+
+def build_counts():
+    """Building x feature count matrices of all buildings"""
+    ov        = pd.read_csv(OV_PATH, usecols=["number", "modaliteit"])
+    all_roads = pd.read_csv(ROADS_PATH, usecols=["number", "AUTO"])
+
+    # footprints and neighbors are not needed for the counts
+    columns = ["gebruiksdoelVerblijfsobject"] + [kind + "_" + fire for kind in ["linked", "ov", "roads"] for fire in scoring.FIRES]
+
+    return scoring.get_counts(store.get_frame(columns), ov, all_roads)
+
+def load_counts():
+    """Memory maps the count matrices of the snapshot, or builds them once for the whole process if there is no snapshot"""
+    arrays = snapshot.read_arrays("counts")
+
+    if arrays is None:
+        return state.put("counts", build_counts())
+
+    counts = {"columns": list(zip(arrays["kinds"].tolist(), arrays["names"].tolist()))}
+    for fire in scoring.FIRES:
+        matrix       = snapshot.read_arrays("counts_" + fire)
+        counts[fire] = csr_matrix((matrix["data"], matrix["indices"], matrix["indptr"]), shape=tuple(matrix["shape"]))
+
+    return state.put("counts", counts)
+
+def get_counts():
+    """Gives back the count matrices, builds them if that did not happen yet"""
+    counts = state.get("counts")
+    if counts is None:
+        counts = load_counts()
+
+    return counts
+
+def parse_weights(args):
+    """
+    Gives back the weights of one focus from query arguments. The weights of the focus given by base (default focus if
+    not given) are used, every argument <kind>.<name>=<weight> (like function.residential function=4 or ov.Metro=2)
+    overwrites one weight. Raises ValueError for names that are not weights of any focus or weights that are not finite
+    numbers.
+    """
+    base = args.get("base", "default")
+    if base not in scoring.WEIGHTS:
+        raise ValueError("unknown focus " + base)
+
+    weights = deepcopy(scoring.WEIGHTS[base])
+
+    for key, value in args.items():
+        if key == "base":
+            continue
+
+        kind, _, name = key.partition(".")
+        if not any(name in focus.get(kind, {}) for focus in scoring.WEIGHTS.values()):
+            raise ValueError("unknown weight " + key)
+
+        weights[kind][name] = float(value)
+        if not math.isfinite(weights[kind][name]):
+            raise ValueError("weight " + key + " should be a finite number")
+
+    return weights
+
+@state.cached(CACHE_SIZE)
+def score_vector(fire, vector):
+    """Raw and min max normalized scores of all buildings for one weight vector, the last results are cached"""
+    scores = get_counts()[fire] @ np.array(vector)
+
+    scale = scores.max() - scores.min()
+    if scale == 0:
+        scale = 1
+
+    return scores, (scores - scores.min()) / scale
+
+def score_profile(fire, weights):
+    """Scores all buildings live with the weights of one focus, gives back the raw and normalized scores"""
+    columns = get_counts()["columns"]
+    vector  = tuple(weights[kind].get(name, 0) for kind, name in columns)
+
+    return score_vector(fire, vector)
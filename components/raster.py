@@ -0,0 +1,168 @@
+import os
+import io
+import numpy as np
+from PIL import Image
+
+from . import store, geometry, tiles, cache
+
+TILES_PATH = "./data/tiles"
+TILE_SIZE  = 256
+
+# half the width of the web mercator world in meters
+ORIGIN = 20037508.342789244
+
+# zoom levels below VECTOR_ZOOM are drawn with raster tiles, levels from MIN_ZOOM are rendered beforehand
+MIN_ZOOM    = 10
+VECTOR_ZOOM = 14
+
+# same transparency as the polygons of the heatmap
+ALPHA = 0.8
+
+FOCUSES = {"default": "default", "residential": "residential", "roads": "road"}
+
+def pixel_size(zoom):
+    """Size of one pixel in meters at a zoom level"""
+    return 2 * ORIGIN / (TILE_SIZE * 2 ** zoom)
+
+def max_width():
+    """Width of the map in meters above which the raster tiles are shown instead of polygons"""
+    return tiles.PLOT_WIDTH * pixel_size(VECTOR_ZOOM)
+
+def tile_bounds(z, x, y):
+    """Bounding box (min x, min y, max x, max y) in web mercator of an XYZ tile"""
+    span = 2 * ORIGIN / 2 ** z
+
+    return (-ORIGIN + x * span, ORIGIN - (y + 1) * span, -ORIGIN + (x + 1) * span, ORIGIN - y * span)
+
+def get_url(fire, focus):
+    """Url template of the tiles of a heatmap, contains the data version so tiles can be cached forever"""
+    return "/tiles/" + cache.check_version()[:12] + "/" + fire + "/" + focus + "/{Z}/{X}/{Y}.png"
+
+def get_path(version, fire, focus, z, x, y):
+    """Place of a tile on disk"""
+    return os.path.join(TILES_PATH, version, fire + "_" + focus, str(z), str(x), str(y) + ".png")
+
+def to_rgb(palette):
+    """Converts a palette of hex colors to an array of rgb values"""
+    return np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in palette], dtype=np.uint8)
+
+def inside(px, py, xy):
+    """Tells for every point if it is inside the polygon, even odd rule on all edges at once"""
+    x1, y1 = xy[:-1, 0], xy[:-1, 1]
+    x2, y2 = xy[1:, 0], xy[1:, 1]
+
+    py = py[:, None]
+    px = px[:, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+
+    return crossing.sum(axis=1) % 2 == 1
+
+def rasterize(bounds, positions, values):
+    """
+    Gives back a TILE_SIZE x TILE_SIZE array with the value of the building covering every pixel, nan where there is no
+    building. Buildings smaller than a pixel still color the pixel they are in, the highest value wins.
+    """
+    grid = np.full((TILE_SIZE, TILE_SIZE), np.nan)
+    size = (bounds[2] - bounds[0]) / TILE_SIZE
+
+    layer   = geometry.get_layer("buildings")
+    xy      = layer["xy"]
+    offsets = layer["offsets"]
+
+    # lower values first so higher values are drawn over them
+    for position in positions[np.argsort(values[positions])]:
+        shape = np.asarray(xy[offsets[position]:offsets[position + 1]])
+        if len(shape) == 0:
+            continue
+
+        # pixels of the bounding box of the building, rows start at the top
+        cols = np.arange(max(int((shape[:, 0].min() - bounds[0]) / size), 0), min(int((shape[:, 0].max() - bounds[0]) / size) + 1, TILE_SIZE))
+        rows = np.arange(max(int((bounds[3] - shape[:, 1].max()) / size), 0), min(int((bounds[3] - shape[:, 1].min()) / size) + 1, TILE_SIZE))
+
+        if len(cols) == 0 or len(rows) == 0:
+            continue
+
+        col, row = [grid_index.ravel() for grid_index in np.meshgrid(cols, rows)]
+        hit      = inside(bounds[0] + (col + 0.5) * size, bounds[3] - (row + 0.5) * size, shape)
+
+        if hit.any():
+            grid[row[hit], col[hit]] = values[position]
+        else:
+            # too small to cover a pixel center, color the pixel of its middle
+            center = shape.mean(axis=0)
+            c, r   = int((center[0] - bounds[0]) / size), int((bounds[3] - center[1]) / size)
+            if 0 <= c < TILE_SIZE and 0 <= r < TILE_SIZE:
+                grid[r, c] = values[position]
+
+    return grid
+
+def render_tile(fire, focus, z, x, y, palette):
+    """Renders a tile of the heatmap of a fire and focus as png"""
+    values = np.asarray(store.get_buildings()['norm_score_' + fire + '_' + FOCUSES[focus]].values, dtype=float)
+    bounds = tile_bounds(z, x, y)
+
+    grid = rasterize(bounds, tiles.query(bounds), values)
+
+    # same color mapping as the LinearColorMapper of the heatmap
+    low, high = np.nanmin(values), np.nanmax(values)
+    scale     = high - low if high > low else 1
+    colors    = to_rgb(palette)
+    filled    = ~np.isnan(grid)
+    index     = np.clip(((grid[filled] - low) / scale * len(colors)).astype(int), 0, len(colors) - 1)
+
+    image = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    image[filled, :3] = colors[index]
+    image[filled, 3]  = int(ALPHA * 255)
+
+    buffer = io.BytesIO()
+    Image.fromarray(image, "RGBA").save(buffer, format="PNG", optimize=True)
+
+    return buffer.getvalue()
+
+def get_tile(version, fire, focus, z, x, y, palette):
+    """Gives back the path of a tile, renders and stores it if it is not on disk yet"""
+    path = get_path(version, fire, focus, z, x, y)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first so other requests never read half a tile
+        temporary = path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(render_tile(fire, focus, z, x, y, palette))
+        os.replace(temporary, path)
+
+    return path
+
+def tile_range(z):
+    """Range of tile columns and rows at zoom level z that contain buildings"""
+    bounds = tiles.get_bounds()
+    span   = 2 * ORIGIN / 2 ** z
+
+    x_min, x_max = int((bounds[:, 0].min() + ORIGIN) // span), int((bounds[:, 2].max() + ORIGIN) // span)
+    y_min, y_max = int((ORIGIN - bounds[:, 3].max()) // span), int((ORIGIN - bounds[:, 1].min()) // span)
+
+    return range(x_min, x_max + 1), range(y_min, y_max + 1)
+
+def render_all(palette):
+    """Renders the tiles of all heatmaps for the zoom levels from MIN_ZOOM up to VECTOR_ZOOM"""
+    version = cache.check_version()[:12]
+
+    for fire in ["small", "big"]:
+        for focus in FOCUSES:
+            for z in range(MIN_ZOOM, VECTOR_ZOOM):
+                columns, rows = tile_range(z)
+                for x in columns:
+                    for y in rows:
+                        get_tile(version, fire, focus, z, x, y, palette)
+
+            print("rendered tiles of", fire, focus)
+
+
+if __name__ == '__main__':
+    # same colors as the heatmap in the browser
+    from . import heatmap
+
+    render_all(heatmap.PALETTE)
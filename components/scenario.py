@@ -0,0 +1,107 @@
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.strtree import STRtree
+
+from . import store, geometry, timing, snapshot, state
+
+# Amersfoort / RD New, the Dutch grid in meters
+METRIC_CRS = "EPSG:28992"
+
+TRAN_3857_TO_METRIC = Transformer.from_crs("EPSG:3857", METRIC_CRS, always_xy=True)
+TRAN_METRIC_TO_3857 = Transformer.from_crs(METRIC_CRS, "EPSG:3857", always_xy=True)
+
+# largest radius in meters that can be asked for
+MAX_RADIUS = 500
+
+# number of (building, radius) scenarios of which the impact is kept
+CACHE_SIZE = 1024
+
+def project_metric(name):
+    """Coordinates of a projected layer in the metric crs"""
+    xy   = np.asarray(geometry.get_layer(name)["xy"])
+    x, y = TRAN_3857_TO_METRIC.transform(xy[:, 0], xy[:, 1])
+
+    return np.column_stack([x, y])
+
+def to_metric(name):
+    """Geometries of a projected layer in the metric crs, polygons for buildings and lines otherwise"""
+    offsets = np.asarray(geometry.get_layer(name)["offsets"])
+    index   = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    # the metric coordinates are in the snapshot if there is one
+    arrays = snapshot.read_arrays("metric_" + name)
+    xy     = project_metric(name) if arrays is None else np.asarray(arrays["xy"])
+
+    # shapes without coordinates stay None
+    shapes = np.empty(len(offsets) - 1, dtype=object)
+
+    if name == "buildings":
+        shapely.polygons(shapely.linearrings(xy, indices=index), out=shapes)
+    else:
+        shapely.linestrings(xy, indices=index, out=shapes)
+
+    return shapes
+
+def load_index():
+    """Builds the spatial index of buildings, roads and ov segments once for the whole process"""
+    index = {}
+    for name in ["buildings", "roads", "ov"]:
+        shapes      = to_metric(name)
+        index[name] = (STRtree(shapes), shapes, np.asarray(geometry.get_layer(name)["ids"], dtype=float))
+
+    return state.put("index", index)
+
+def get_index():
+    """Gives back the spatial index, builds it if that did not happen yet"""
+    index = state.get("index")
+    if index is None:
+        index = load_index()
+
+    return index
+
+def check_radius(radius):
+    """Gives back the radius as float, raises ValueError if it is not a number between 0 and MAX_RADIUS meters"""
+    radius = float(radius)
+
+    if not 0 < radius <= MAX_RADIUS:
+        raise ValueError("radius should be between 0 and " + str(MAX_RADIUS) + " meters")
+
+    return radius
+
+@state.cached(CACHE_SIZE)
+def find_impact(position, radius):
+    """Ids of the buildings, roads and ov segments within radius meters of the building at position, the last results are cached"""
+    index    = get_index()
+    building = index["buildings"][1][position]
+
+    impact = {}
+    for name, (tree, _, ids) in index.items():
+        found        = np.sort(tree.query(building, predicate="dwithin", distance=radius))
+        impact[name] = ids[found]
+
+    # the building itself is not affected by its own fire
+    impact["buildings"] = impact["buildings"][impact["buildings"] != store.get_buildings().index[position]]
+
+    return impact
+
+def get_impact(pand_id, radius):
+    """
+    Gives back the ids of the buildings, roads and ov segments within radius meters of a building. Raises KeyError for
+    unknown buildings and ValueError for a radius that is not allowed.
+    """
+    positions = store.get_positions([float(pand_id)])
+    if len(positions) == 0:
+        raise KeyError(pand_id)
+
+    return find_impact(int(positions[0]), check_radius(radius))
+
+def get_outline(position, radius):
+    """Outline of the area within radius meters of the building at position, projected to web mercator"""
+    building = get_index()["buildings"][1][position]
+    outline  = shapely.get_coordinates(shapely.get_exterior_ring(shapely.buffer(building, radius)))
+
+    with timing.stage("reproject"):
+        x, y = TRAN_METRIC_TO_3857.transform(outline[:, 0], outline[:, 1])
+
+    return x, y
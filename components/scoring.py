@@ -0,0 +1,193 @@
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+from .columnar import to_csr
+
+FIRES = ["small", "big"]
+
+# weights per focus (same as the mappers in get_area_information.ipynb)
+WEIGHTS = {
+    "default": {
+        "ov": {
+            'Tram' : 3,
+            'Metro': 4
+        },
+        "road": {
+            'calamiteit': 3,
+            'hoofd'     : 3,
+            'plus'      : 3
+        },
+        "function": {
+            'other usage'          : 0,
+            'shopping function'    : 1,
+            'sports function'      : 1,
+            'accomodation function': 2,
+            'cell function'        : 3,
+            'industry function'    : 2,
+            'office function'      : 1,
+            'residential function' : 0,
+            'meet function'        : 1,
+            'educational function' : 2,
+            'health care function' : 3
+        }
+    },
+    "residential": {
+        "ov": {
+            'Tram' : 3,
+            'Metro': 4
+        },
+        "road": {
+            'hoofd'     : 3,
+            'plus'      : 3,
+            'calamiteit': 3
+        },
+        "function": {
+            'other usage'          : 1,
+            'shopping function'    : 1,
+            'sports function'      : 1,
+            'accomodation function': 1,
+            'cell function'        : 2,
+            'industry function'    : 1,
+            'office function'      : 1,
+            'residential function' : 6,
+            'meet function'        : 1,
+            'educational function' : 1,
+            'health care function' : 2
+        }
+    },
+    "road": {
+        "ov": {
+            'Tram' : 5,
+            'Metro': 6
+        },
+        "road": {
+            'hoofd'     : 5,
+            'plus'      : 5,
+            'calamiteit': 5
+        },
+        "function": {
+            'other usage'          : 0,
+            'shopping function'    : 1,
+            'sports function'      : 1,
+            'accomodation function': 2,
+            'cell function'        : 3,
+            'industry function'    : 2,
+            'office function'      : 1,
+            'residential function' : 0,
+            'meet function'        : 1,
+            'educational function' : 2,
+            'health care function' : 3
+        }
+    }
+}
+
+def score_columns():
+    """Gives back the names of all score columns"""
+    return ["score_" + fire + "_" + focus for focus in WEIGHTS for fire in FIRES]
+
+def incidence(lists, ids):
+    """Sparse matrix with a one for every (row, id) pair in the lists, ids that are not present are skipped"""
+    ids   = np.asarray(ids, dtype=np.float64)
+    order = np.argsort(ids)
+
+    values, offsets = to_csr(lists, np.float64)
+    rows            = np.repeat(np.arange(len(lists)), np.diff(offsets))
+
+    if len(ids) == 0 or len(values) == 0:
+        return csr_matrix((len(lists), len(ids)))
+
+    # column of every value, found with a binary search in the sorted ids
+    found = order[np.searchsorted(ids, values, sorter=order).clip(0, len(ids) - 1)]
+    keep  = ids[found] == values
+
+    matrix = csr_matrix((np.ones(keep.sum()), (rows[keep], found[keep])), shape=(len(lists), len(ids)))
+
+    # every id counts once, like filtering a frame with isin
+    matrix.data[:] = 1
+
+    return matrix
+
+def one_hot(values, categories):
+    """Sparse matrix with a one in the column of the category of every value"""
+    columns = {category: i for i, category in enumerate(categories)}
+
+    return incidence([[columns[value]] for value in values], np.arange(len(categories)))
+
+def counts(lists, categories):
+    """Sparse matrix with the number of times every category is in the lists"""
+    columns = {category: i for i, category in enumerate(categories)}
+
+    values, offsets = to_csr([[columns[value] for value in values] for values in lists], np.int64)
+    rows            = np.repeat(np.arange(len(lists)), np.diff(offsets))
+
+    return csr_matrix((np.ones(len(values)), (rows, values)), shape=(len(lists), len(categories)))
+
+def get_counts(city_info, ov, all_roads, buildings=None):
+    """
+    Gives back per fire size a sparse matrix with for every building the number of affected ov segments per modality,
+    roads per type and functions (own building and linked buildings). Functions of linked buildings are looked up in
+    buildings (frame with pand_id and gebruiksdoelVerblijfsobject), which is city_info itself by default. The columns
+    of the matrices are given back as (kind, name) pairs.
+    """
+    if buildings is None:
+        buildings = city_info
+
+    modalities = sorted(ov.modaliteit.unique())
+    road_types = sorted(all_roads.AUTO.unique())
+    functions  = sorted(set(function for values in buildings.gebruiksdoelVerblijfsobject for function in values) |
+                        set(function for values in city_info.gebruiksdoelVerblijfsobject for function in values))
+
+    columns = [("ov", name) for name in modalities] + [("road", name) for name in road_types] + \
+              [("function", name) for name in functions]
+
+    # segment x modality, road x type and building x function
+    ov_modality   = one_hot(ov.modaliteit, modalities)
+    road_type     = one_hot(all_roads.AUTO, road_types)
+    own_functions = counts(city_info.gebruiksdoelVerblijfsobject, functions)
+    functions     = counts(buildings.gebruiksdoelVerblijfsobject, functions)
+
+    matrices = {"columns": columns}
+    for fire in FIRES:
+        # building x ov segment, building x road and building x linked building
+        building_ov     = incidence(city_info["ov_" + fire], ov.number)
+        building_road   = incidence(city_info["roads_" + fire], all_roads.number)
+        building_linked = incidence(city_info["linked_" + fire], buildings.pand_id)
+
+        matrices[fire] = hstack([building_ov @ ov_modality, building_road @ road_type,
+                                 own_functions + building_linked @ functions]).tocsr()
+
+    return matrices
+
+def weight_matrix(columns, weights=WEIGHTS):
+    """Weights of every column of the count matrices for every focus, weights that are not given are 0"""
+    return np.array([[weights[focus][kind].get(name, 0) for focus in weights] for kind, name in columns], dtype=np.float64)
+
+def get_scores(matrices, weights=WEIGHTS):
+    """Gives back per fire size the raw scores of every building for every focus (buildings x focusses)"""
+    weight = weight_matrix(matrices["columns"], weights)
+
+    return {fire: matrices[fire] @ weight for fire in FIRES}
+
+def add_scores(city_info, ov, all_roads, buildings=None):
+    """
+    Adds the raw score_<fire>_<focus> columns to the frame with buildings. Functions of linked buildings are looked up
+    in buildings (frame with pand_id and gebruiksdoelVerblijfsobject), which is city_info itself by default.
+    """
+    scores = get_scores(get_counts(city_info, ov, all_roads, buildings))
+
+    for fire in FIRES:
+        for i, focus in enumerate(WEIGHTS):
+            city_info["score_" + fire + "_" + focus] = scores[fire][:, i]
+
+    return city_info
+
+def normalize(city_info, minimum, maximum):
+    """Adds the norm_score_<fire>_<focus> columns, min max scaled with the given minimum and maximum per column"""
+    for column in score_columns():
+        scale = maximum[column] - minimum[column]
+        if scale == 0:
+            scale = 1
+
+        city_info["norm_" + column] = (city_info[column] - minimum[column]) / scale
+
+    return city_info
@@ -0,0 +1,222 @@
+"""
+Address search for jumping the map to a building. Every address is split into entries of a street, a range of house
+numbers and a postcode, also the addresses with several streets that end in "All in Amsterdam". The entries are kept in
+sorted arrays, so a prefix of a street or postcode is found with a binary search instead of a scan of all addresses.
+"""
+import re
+import unicodedata
+import numpy as np
+
+from . import store, tiles, snapshot, columnar, state
+
+# number of results given back when no limit is asked for, and the most that can be asked for
+LIMIT     = 10
+MAX_LIMIT = 50
+
+# number of candidate entries that are checked first, every next chunk is twice as large
+CHUNK_SIZE = 256
+
+# one line of an address: street, house number or range of house numbers (with letters) and the postcode of combined addresses
+LINE = re.compile(r"^(?P<street>.+?)(?:\s+(?P<low>\d+)\w*(?:\s*-\s*(?P<high>\d+)\w*)?)?(?:\s+(?P<postcode>\d{4} ?[A-Z]{2}))?$")
+
+# second line of an address with one postcode
+POSTCODE_LINE = re.compile(r"^(?P<postcode>\d{4} ?[A-Z]{2})(?:\s+\S.*)?$")
+
+# a postcode in a query, with one letter it is the start of one
+QUERY_POSTCODE = re.compile(r"\b\d{4} ?[a-z]{1,2}\b")
+
+def normalize(text):
+    """Lower case text without accents, with words separated by single spaces"""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(character for character in text if not unicodedata.combining(character))
+
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+def parse_address(adress):
+    """Gives back (street, lowest number, highest number, postcode) of every line of an address, -1 if there is no number"""
+    entries = []
+
+    for line in str(adress).split("\n"):
+        line = line.strip()
+        if not line or line == "All in Amsterdam":
+            continue
+
+        # the postcode line of a single address belongs to the street lines before it
+        match = POSTCODE_LINE.match(line)
+        if match is not None and entries:
+            entries = [(street, low, high, postcode or match["postcode"].replace(" ", "")) for street, low, high, postcode in entries]
+            continue
+
+        match = LINE.match(line)
+        low   = int(match["low"]) if match["low"] else -1
+        high  = int(match["high"]) if match["high"] else low
+
+        entries.append((match["street"], min(low, high), max(low, high), (match["postcode"] or "").replace(" ", "")))
+
+    return entries
+
+def build_search():
+    """Parses the addresses of all buildings into the arrays of the search index"""
+    rows = [(position,) + entry for position, adress in enumerate(store.get_buildings().full_adress)
+            if isinstance(adress, str) for entry in parse_address(adress)]
+
+    positions, names, lows, highs, postcodes = [np.array(values) for values in zip(*rows)] if rows else [np.array([])] * 5
+
+    # streets are numbered in the order of their normalized names, the entries in the order of street and house number
+    keys            = np.array([normalize(name) for name in names], dtype=str)
+    streets, codes  = np.unique(keys, return_inverse=True)
+    order           = np.lexsort((lows, codes))
+    codes           = codes[order]
+
+    # name to show per street, the first one found
+    first   = np.unique(codes, return_index=True)[1]
+    display = names[order][first].astype(str)
+
+    # every word after the first of a street name, so the middle of a name like "van baerlestraat" is found as well
+    words = [(key[match.start():], code) for code, key in enumerate(streets.tolist()) for match in re.finditer(r" (?=\S)", key)]
+    words = sorted((key[1:], code) for key, code in words)
+
+    postcode_order = np.argsort(postcodes[order], kind="stable")
+
+    index = {"streets": streets, "display": display, "offsets": columnar.to_offsets(np.bincount(codes, minlength=len(streets))),
+             "words": np.array([key for key, _ in words], dtype=str), "word_streets": np.array([code for _, code in words], dtype=np.int64),
+             "positions": positions[order].astype(np.int64), "streets_of": codes, "lows": lows[order].astype(np.int64),
+             "highs": highs[order].astype(np.int64), "postcodes": postcodes[order].astype(str),
+             "postcode_order": postcode_order, "sorted_postcodes": postcodes[order][postcode_order].astype(str)}
+
+    return index
+
+def load_search():
+    """Search index once for the whole process, memory mapped from the snapshot if there is one"""
+    index = snapshot.read_arrays("search")
+    if index is None:
+        index = build_search()
+
+    return state.put("search", index)
+
+def get_index():
+    """Gives back the search index, makes it if that did not happen yet"""
+    index = state.get("search")
+    if index is None:
+        index = load_search()
+
+    return index
+
+def prefix_range(values, prefix):
+    """First and last index plus one of the values that start with prefix, values are sorted"""
+    # nothing is longer than the values, the bounds have their type so the values are not converted on every search
+    if len(prefix) > values.dtype.itemsize // 4:
+        return 0, 0
+
+    bounds = np.array([prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)], dtype=values.dtype)
+
+    return tuple(np.searchsorted(values, bounds).tolist())
+
+def parse_query(text):
+    """Gives back the street, house number and postcode (or start of one) of a query, None for the parts it does not have"""
+    text     = normalize(text)
+    postcode = None
+
+    match = QUERY_POSTCODE.search(text)
+    if match is not None:
+        postcode = match.group().replace(" ", "").upper()
+        text     = text[:match.start()] + " " + text[match.end():]
+
+    # four digits at the start or after the house number are the start of a postcode
+    words = text.split()
+    if postcode is None and words and re.fullmatch(r"\d{4}", words[0]):
+        postcode = words.pop(0)
+
+    numbers = [i for i, word in enumerate(words) if re.fullmatch(r"\d+[a-z]?", word)]
+    if postcode is None and len(numbers) > 1 and re.fullmatch(r"\d{4}", words[numbers[-1]]):
+        postcode = words.pop(numbers.pop())
+
+    # the last number is the house number, numbers before it are part of the street (like 1e helmersstraat)
+    if numbers and (numbers[-1] > 0 or postcode is not None):
+        number = int(re.match(r"\d+", words[numbers[-1]]).group())
+        words  = words[:numbers[-1]]
+    else:
+        number = None
+
+    return " ".join(words) or None, number, postcode
+
+def iter_candidates(street, postcode):
+    """
+    Groups of entries that can match, in the order they are shown: the exact street, streets that start with it and streets
+    with a later word that starts with it, or the entries of the postcode (in order of postcode) when there is no street
+    """
+    index = get_index()
+
+    if street is None:
+        low, high = prefix_range(index["sorted_postcodes"], postcode)
+        yield index["postcode_order"][low:high]
+        return
+
+    # streets are sorted, so the entries of the streets with the prefix are one slice
+    low, high = prefix_range(index["streets"], street)
+    exact     = int(low < high and index["streets"][low] == street)
+
+    yield np.arange(index["offsets"][low], index["offsets"][low + exact])
+    yield np.arange(index["offsets"][low + exact], index["offsets"][high])
+
+    start, end = prefix_range(index["words"], street)
+    inner      = np.setdiff1d(index["word_streets"][start:end], np.arange(low, high))
+
+    if len(inner) > 0:
+        yield columnar.take_csr(np.arange(index["offsets"][-1]), index["offsets"], inner)[0]
+
+def find_entries(street, number, postcode, limit):
+    """Indexes of the entries that match, one per building and at most limit"""
+    index = get_index()
+    found = np.zeros(0, dtype=np.int64)
+
+    if street is None and postcode is None:
+        return found
+
+    # short prefixes match most of the city, the candidates are checked in growing chunks until there are enough buildings,
+    # later groups are only made when they are needed
+    for entries in iter_candidates(street, postcode):
+        start, size = 0, CHUNK_SIZE
+
+        while start < len(entries) and len(found) < limit:
+            chunk       = entries[start:start + size]
+            start, size = start + size, size * 2
+
+            if number is not None:
+                chunk = chunk[(index["lows"][chunk] <= number) & (number <= index["highs"][chunk])]
+            if street is not None and postcode is not None:
+                chunk = chunk[np.char.startswith(index["postcodes"][chunk], postcode)]
+
+            # one entry per building, in the order they were found
+            found    = np.concatenate([found, chunk])
+            _, first = np.unique(index["positions"][found], return_index=True)
+            found    = found[np.sort(first)]
+
+        if len(found) >= limit:
+            break
+
+    return found[:limit]
+
+def format_entry(entry):
+    """Address of one entry as a single line"""
+    index  = get_index()
+    low    = index["lows"][entry]
+    high   = index["highs"][entry]
+    number = "" if low < 0 else " " + str(low) if low == high else " " + str(low) + "-" + str(high)
+
+    return index["display"][index["streets_of"][entry]] + number + (", " + index["postcodes"][entry] if index["postcodes"][entry] else "")
+
+def search(text, limit=LIMIT):
+    """
+    Buildings with an address that matches the query, like "keizersgracht 12", "1015CJ" or "keizersgr 12 1015". Gives back
+    the pand id, the matched address and the bbox (min x, min y, max x, max y in web mercator) of at most limit buildings.
+    """
+    street, number, postcode = parse_query(text)
+
+    entries   = find_entries(street, number, postcode, min(max(int(limit), 1), MAX_LIMIT))
+    positions = get_index()["positions"][entries]
+    ids       = store.get_buildings().pand_id.values[positions]
+    bounds    = tiles.get_bounds()[positions]
+
+    return [{"pand_id": int(pand_id), "address": format_entry(entry), "bbox": [float(value) for value in bbox]}
+            for entry, pand_id, bbox in zip(entries.tolist(), ids, bounds)]
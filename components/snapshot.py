@@ -0,0 +1,252 @@
+"""
+Versioned snapshot of everything the server prepares on startup: building columns, projected geometry, bounding boxes,
+metric coordinates for the spatial index, the road graph, the public transport layer, the count matrices of the scores,
+the hover strings and the search index.
+Every version is a directory in SNAPSHOT_PATH and the file current holds the name of the version that is served. Workers
+memory map the files read only, so all workers on a host share one copy in the page cache and start without parsing or
+projecting anything. Build it from the root of the project (run again when the data changes):
+
+    python -m components.snapshot
+
+Small changes of the buildings are made into a new version by data_preperation.refresh. A running server loads the
+version in current next to the one it serves and swaps to it between requests, see start_request.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+import traceback
+import numpy as np
+from flask import g
+
+from . import cache, store, geometry, tiles, scenario, network, base_map, profiles, scoring, search, timing, state
+
+SNAPSHOT_PATH = "./data/snapshot"
+
+# number of versions that are kept, workers that did not swap yet still use the older ones
+KEEP_VERSIONS = 3
+
+# function that loads all data of the process, set by watch
+_RELOAD = None
+
+# version that is loaded next to the served one and versions that could not be loaded, see start_request
+_LOADING = None
+_FAILED  = set()
+
+# number of requests that are handled and if a swap is waiting for them, see start_request
+_ACTIVE   = 0
+_SWAPPING = False
+_SWAP     = threading.Condition()
+
+def read_current(root=SNAPSHOT_PATH):
+    """Name of the version in current, None if there is no snapshot or the version is not there"""
+    try:
+        with open(os.path.join(root, "current")) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    return name if os.path.exists(os.path.join(root, name, "manifest.json")) else None
+
+def write_arrays(name, arrays, path):
+    """Writes a group of arrays as .npy files, gives back their keys for the manifest"""
+    os.makedirs(path, exist_ok=True)
+
+    for key, values in arrays.items():
+        np.save(os.path.join(path, name + "_" + key + ".npy"), np.asarray(values))
+
+    return list(arrays)
+
+def load_snapshot(root=SNAPSHOT_PATH, name=None):
+    """
+    Reads the manifest of a version (the one in current by default) for the whole process, there is no snapshot if it is
+    missing or made of other data
+    """
+    manifest = {}
+
+    if name is None:
+        name = read_current(root)
+
+    # the name in current the data is loaded for, also when the snapshot is out of date
+    state.put("current", name)
+
+    if name is not None:
+        path = os.path.join(root, name)
+        with open(os.path.join(path, "manifest.json")) as f:
+            read = json.load(f)
+
+        if read["version"] == cache.data_version():
+            manifest = dict(read, path=path, name=name)
+        else:
+            print("snapshot is out of date, preparing the data in memory")
+
+    return state.put("manifest", manifest)
+
+def get_manifest():
+    """Gives back the manifest of the loaded version, reads it if that did not happen yet"""
+    manifest = state.get("manifest")
+    if manifest is None:
+        manifest = load_snapshot()
+
+    return manifest
+
+def get_version():
+    """Name of the loaded version, empty if there is no snapshot"""
+    return get_manifest().get("name", "")
+
+def get_buildings_version():
+    """Version of the buildings of the snapshot, empty if they are the buildings of the csv"""
+    return get_manifest().get("buildings", "")
+
+def get_path(name):
+    """Directory of the snapshot with the building columns or geometry, None if the snapshot does not have it"""
+    manifest = get_manifest()
+    if "path" not in manifest or not os.path.isdir(os.path.join(manifest["path"], name)):
+        return None
+
+    return os.path.join(manifest["path"], name)
+
+def read_arrays(name):
+    """Memory maps a group of arrays of the snapshot read only, None if the snapshot does not have them"""
+    manifest = get_manifest()
+    if name not in manifest.get("arrays", {}):
+        return None
+
+    return {key: np.load(os.path.join(manifest["path"], name + "_" + key + ".npy"), mmap_mode="r")
+            for key in manifest["arrays"][name]}
+
+def new_version(root=SNAPSHOT_PATH):
+    """Makes the directory of a new version, versions are named after the time they are made"""
+    # with microseconds, a refresh can follow a build in the same second
+    now  = time.time()
+    name = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + "%06d" % (now % 1 * 1000000)
+    path = os.path.join(root, name + "-" + str(os.getpid()))
+    os.makedirs(path)
+
+    return path
+
+def write_snapshot(path, manifest):
+    """Writes all prepared arrays of the building columns in path/buildings and the manifest of the version"""
+    store.load_buildings(columns_path=os.path.join(path, "buildings"))
+    geometry.build_geometry(os.path.join(path, "geometry"))
+    geometry.load_geometry(os.path.join(path, "geometry"))
+
+    arrays = {"bounds": write_arrays("bounds", {"bounds": tiles.compute_bounds()}, path)}
+
+    # strings of the hovertool and the search index as typed arrays, which all workers share
+    arrays["hover"]  = write_arrays("hover", tiles.build_hover(), path)
+    arrays["search"] = write_arrays("search", search.build_search(), path)
+
+    for name in ["buildings", "roads", "ov"]:
+        arrays["metric_" + name] = write_arrays("metric_" + name, {"xy": scenario.project_metric(name)}, path)
+
+    graph = network.build_network()
+    arrays["network"] = write_arrays("network", {key: graph[key] for key in network.ARRAYS}, path)
+
+    arrays["transport"] = write_arrays("transport", base_map.build_transport(), path)
+
+    counts = profiles.build_counts()
+    arrays["counts"] = write_arrays("counts", {"kinds": [kind for kind, _ in counts["columns"]],
+                                               "names": [name for _, name in counts["columns"]]}, path)
+    for fire in scoring.FIRES:
+        arrays["counts_" + fire] = write_arrays("counts_" + fire, {"data": counts[fire].data, "indices": counts[fire].indices,
+                                                                   "indptr": counts[fire].indptr, "shape": counts[fire].shape}, path)
+
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(dict(manifest, arrays=arrays), f)
+
+def set_current(path, root=SNAPSHOT_PATH):
+    """Makes a written version the one that is served and removes the oldest versions"""
+    # replace current in one step, so workers never read half a name
+    temporary = os.path.join(root, "current." + str(os.getpid()) + ".tmp")
+    with open(temporary, "w") as f:
+        f.write(os.path.basename(path))
+    os.replace(temporary, os.path.join(root, "current"))
+
+    versions = sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+    for name in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, name))
+
+def build_snapshot(root=SNAPSHOT_PATH):
+    """Build step: converts the buildings csv and writes a new version of the snapshot with all prepared arrays"""
+    path = new_version(root)
+
+    store.convert_buildings(columns_path=os.path.join(path, "buildings"))
+
+    # the version of the data the snapshot is made of, the buildings are the ones of the csv
+    write_snapshot(path, {"version": cache.data_version(), "buildings": ""})
+    set_current(path, root)
+
+    print("wrote snapshot", os.path.basename(path), "of", len(store.get_buildings()), "buildings")
+
+def watch(reload):
+    """Lets the requests swap to a new version of the snapshot, reload is called to load all data of the process again"""
+    global _RELOAD
+
+    _RELOAD = reload
+
+def start_request():
+    """
+    Before every request: starts loading the version in current next to the served one when it changed, see swap. New
+    requests only wait while the loaded version replaces the served one, which takes no time.
+    """
+    global _ACTIVE, _LOADING
+
+    with _SWAP:
+        while _SWAPPING:
+            _SWAP.wait()
+
+        # a snapshot that is gone or could not be loaded is not swapped to, the served data stays
+        name = read_current()
+        if _RELOAD is not None and name is not None and name != state.get("current") and name != _LOADING and name not in _FAILED:
+            _LOADING = name
+            threading.Thread(target=swap, args=(name,), daemon=True).start()
+
+        _ACTIVE += 1
+        g.snapshot = True
+
+def swap(name):
+    """
+    Loads all data of a version next to the served data, and serves it once the requests that run are done, so no request
+    sees data of two versions. The served data stays when the version can not be loaded.
+    """
+    global _LOADING, _SWAPPING
+
+    try:
+        with timing.stage("swap"):
+            staged = state.stage(lambda: (load_snapshot(name=name), _RELOAD()))
+    except Exception:
+        print("could not load snapshot", name)
+        traceback.print_exc()
+
+        staged = None
+        _FAILED.add(name)
+
+    with _SWAP:
+        _LOADING = None
+
+        if staged is not None:
+            _SWAPPING = True
+
+            try:
+                while _ACTIVE > 0:
+                    _SWAP.wait()
+
+                state.install(staged)
+            finally:
+                _SWAPPING = False
+                _SWAP.notify_all()
+
+def end_request(error=None):
+    """After every request, also when it failed: lets a waiting swap know the request is done"""
+    global _ACTIVE
+
+    if g.pop("snapshot", False):
+        with _SWAP:
+            _ACTIVE -= 1
+            _SWAP.notify_all()
+
+
+if __name__ == '__main__':
+    build_snapshot()
@@ -0,0 +1,56 @@
+"""
+Data the process has loaded, like the buildings, geometry and indexes made of them. Modules keep it here instead of in
+their own globals, so a new version of the snapshot can be loaded next to the one that is served (see stage) and then
+replace it in one step (see install).
+"""
+import threading
+from functools import lru_cache
+
+# state that is served and the state this thread is loading into, if any
+_CURRENT = {}
+_LOCAL   = threading.local()
+
+# memoized functions of which the results belong to the served state, cleared by install
+_CACHES = []
+
+def get(key):
+    """Value of key in the state this thread works on, None if it is not loaded"""
+    staged = getattr(_LOCAL, "staged", None)
+
+    return (_CURRENT if staged is None else staged).get(key)
+
+def put(key, value):
+    """Sets key in the state this thread works on, gives back the value"""
+    staged = getattr(_LOCAL, "staged", None)
+    (_CURRENT if staged is None else staged)[key] = value
+
+    return value
+
+def stage(load):
+    """Calls load with a new, empty state for this thread and gives it back, the served state is not changed"""
+    _LOCAL.staged = {}
+
+    try:
+        load()
+        return _LOCAL.staged
+    finally:
+        _LOCAL.staged = None
+
+def install(staged):
+    """Serves a state made by stage, results of the memoized functions of the old state are dropped"""
+    global _CURRENT
+
+    _CURRENT = staged
+
+    for function in _CACHES:
+        function.cache_clear()
+
+def cached(maxsize):
+    """Like lru_cache, for functions of which the results depend on the served state"""
+    def decorate(function):
+        function = lru_cache(maxsize=maxsize)(function)
+        _CACHES.append(function)
+
+        return function
+
+    return decorate
@@ -0,0 +1,121 @@
+import os
+import pandas as pd
+import numpy as np
+from ast import literal_eval
+
+from . import columnar, snapshot, state
+
+BUILDINGS_PATH = "./data/city_area_buildings.csv"
+COLUMNS_PATH   = "./data/city_area_buildings"
+
+# columns that are stored as python lists in the csv
+LIST_COLUMNS = ["wgs", "gebruiksdoelVerblijfsobject", "neighbors", "linked_small", "linked_big",
+                "ov_small", "ov_big", "roads_small", "roads_big"]
+
+def read_buildings_csv(path=BUILDINGS_PATH):
+    """Reads the building csv and parses the list columns that are stored as python strings"""
+    df = pd.read_csv(path)
+
+    for column in LIST_COLUMNS:
+        df[column] = df[column].apply(literal_eval)
+
+    return df
+
+def convert_buildings(path=BUILDINGS_PATH, columns_path=COLUMNS_PATH):
+    """Converts the building csv to the typed columnar format that is loaded by the server"""
+    columnar.write_columns(read_buildings_csv(path), columns_path)
+
+def load_buildings(path=BUILDINGS_PATH, columns_path=None):
+    """
+    Reads the building data once and indexes the frame on pand_id, from the snapshot if there is one. The list columns are
+    kept apart as flat arrays, which all workers share when they are memory mapped from the columnar format, use get_lists
+    to read them. The csv is read when it is newer than the columnar format. Raises ValueError when a pand id is found
+    more than once.
+    """
+    if columns_path is None:
+        columns_path = snapshot.get_path("buildings") or COLUMNS_PATH
+
+    converted = os.path.exists(columns_path)
+    if converted and os.path.exists(path) and \
+            os.path.getmtime(path) > os.path.getmtime(os.path.join(columns_path, "columns.json")):
+        print("columnar buildings are older than the csv, reading the csv")
+        converted = False
+
+    # use the columnar format if it is converted and up to date, the csv otherwise
+    if converted:
+        df    = columnar.read_columns(columns_path, lists=False)
+        lists = columnar.read_lists(columns_path)
+    else:
+        df    = read_buildings_csv(path)
+        lists = {column: columnar.encode_list(column, df[column]) for column in LIST_COLUMNS}
+        df    = df.drop(columns=LIST_COLUMNS)
+
+    # hash index on pand_id, ids in the linked columns are floats as well
+    df.index = pd.Index(df['pand_id'].astype(float).values)
+
+    # every building is found by its pand id, checking that also fills the hash table now, pandas is not safe when several
+    # requests do that at the same time
+    if not df.index.is_unique:
+        duplicates = df['pand_id'][df.index.duplicated()].unique()
+        raise ValueError("pand ids are not unique: " + ", ".join(str(pand_id) for pand_id in duplicates[:10]))
+
+    # flat values, offsets and categories of every list column, memory mapped when the columnar format is used
+    state.put("lists", lists)
+
+    return state.put("buildings", df)
+
+def get_buildings():
+    """Gives back the frame with all buildings, loads it if that did not happen yet"""
+    df = state.get("buildings")
+    if df is None:
+        df = load_buildings()
+
+    return df
+
+def get_lists(column, positions=None):
+    """Lists of a list column (like linked_small or wgs) of the buildings at the given positions, all buildings if None"""
+    return columnar.to_lists(*get_csr(column), rows=positions)
+
+def get_csr(column):
+    """Flat values, offsets and categories (None if the column is not categorical) of a list column of all buildings"""
+    get_buildings()
+
+    return state.get("lists")[column]
+
+def get_list(column, position):
+    """List of a list column of the building at position"""
+    return get_lists(column, [position])[0]
+
+def get_frame(columns=LIST_COLUMNS):
+    """Frame with all buildings that has the given list columns as well, for build steps that work on whole columns"""
+    df = get_buildings()
+
+    return df.assign(**{column: get_lists(column) for column in columns})
+
+def get_building(pand_id):
+    """Gives back a frame with only the selected building"""
+    df = get_buildings()
+
+    return df.loc[[float(pand_id)]]
+
+def get_positions(ids):
+    """Gives back the row positions of the given pand ids in the frame, ids that are not present are skipped"""
+    df = get_buildings()
+
+    positions = df.index.get_indexer(np.asarray(ids, dtype=float))
+    positions = positions[positions >= 0]
+
+    # keep order of the frame
+    positions.sort()
+
+    return positions
+
+def get_linked(ids):
+    """Gives back a frame with the buildings of the given pand ids"""
+    df = get_buildings()
+
+    return df.iloc[get_positions(ids)]
+
+
+if __name__ == '__main__':
+    convert_buildings()
@@ -0,0 +1,242 @@
+import numpy as np
+import shapely
+from collections import Counter
+
+from bokeh.models import ColumnDataSource, CustomJSTransform
+from bokeh.models.callbacks import CustomJS
+from bokeh.transform import transform
+
+from . import store, geometry, snapshot, columnar, state
+
+# width of the maps in pixels, used to decide how much detail is visible
+PLOT_WIDTH = 800
+
+# simplification tolerance is 2**level meters, below the lowest level polygons are sent as they are
+MIN_LEVEL = 0
+MAX_LEVEL = 8
+
+# coordinates are sent as float32 offsets from the origin when the city fits within this many meters of it (about 1 cm precision)
+MAX_OFFSET = 2 ** 16
+
+def get_level(width):
+    """Level of detail for a view of width meters, a tolerance of about one pixel"""
+    level = int(np.floor(np.log2(max(width / PLOT_WIDTH, 1e-9))))
+
+    if level < MIN_LEVEL:
+        return None
+
+    return min(level, MAX_LEVEL)
+
+def compute_bounds():
+    """Bounding box (min x, min y, max x, max y) in web mercator of every building"""
+    layer   = geometry.get_layer("buildings")
+    xy      = np.asarray(layer["xy"])
+    offsets = np.asarray(layer["offsets"])
+
+    # empty footprints get an empty box
+    starts = offsets[:-1].clip(0, max(len(xy) - 1, 0))
+
+    return np.column_stack([np.minimum.reduceat(xy[:, 0], starts), np.minimum.reduceat(xy[:, 1], starts),
+                            np.maximum.reduceat(xy[:, 0], starts), np.maximum.reduceat(xy[:, 1], starts)])
+
+def load_bounds():
+    """Bounding boxes of all buildings and the origin of the coordinates once for the whole process, from the snapshot if there is one"""
+    arrays = snapshot.read_arrays("bounds")
+    bounds = compute_bounds() if arrays is None else arrays["bounds"]
+
+    # whole kilometers below the south west corner of the city, the same for every map and api call
+    origin = np.floor(np.nanmin(bounds[:, :2], axis=0) / 1000) * 1000 if len(bounds) > 0 else np.zeros(2)
+
+    # simplified polygons per level are made when they are asked for
+    return state.put("tiles", {"bounds": bounds, "origin": origin, "simplified": {}})
+
+def get_tiles():
+    """Gives back the bounding boxes, origin and simplified polygons, loads them if that did not happen yet"""
+    tiles = state.get("tiles")
+    if tiles is None:
+        tiles = load_bounds()
+
+    return tiles
+
+def get_bounds():
+    """Gives back the bounding boxes of all buildings"""
+    return get_tiles()["bounds"]
+
+def get_origin():
+    """Gives back the origin (x, y in web mercator) the coordinates of the buildings are sent relative to"""
+    return get_tiles()["origin"]
+
+def get_dtype():
+    """Type of the coordinates that are sent, float32 when the offsets from the origin are small enough"""
+    bounds = get_bounds()
+    extent = np.nanmax(bounds[:, 2:] - get_origin()) if len(bounds) else 0
+
+    return np.float32 if extent < MAX_OFFSET else np.float64
+
+def query(bbox):
+    """Gives back the positions of the buildings that overlap the bounding box (min x, min y, max x, max y)"""
+    bounds = get_bounds()
+
+    inside = (bounds[:, 2] >= bbox[0]) & (bounds[:, 3] >= bbox[1]) & (bounds[:, 0] <= bbox[2]) & (bounds[:, 1] <= bbox[3])
+
+    return np.flatnonzero(inside)
+
+def get_simplified(level):
+    """Building polygons of all buildings simplified for a level, as flat coordinates and offsets"""
+    simplified = get_tiles()["simplified"]
+
+    if level not in simplified:
+        layer   = geometry.get_layer("buildings")
+        offsets = np.asarray(layer["offsets"])
+        index   = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+        # simplify all polygons in one go
+        polygons = shapely.polygons(shapely.linearrings(np.asarray(layer["xy"]), indices=index))
+        polygons = shapely.simplify(polygons, 2 ** level, preserve_topology=True)
+
+        xy, index       = shapely.get_coordinates(polygons, return_index=True)
+        new_offsets     = np.zeros(len(offsets), dtype=np.int64)
+        new_offsets[1:] = np.cumsum(np.bincount(index, minlength=len(offsets) - 1))
+
+        simplified[level] = (xy, new_offsets)
+
+    return simplified[level]
+
+def get_polygons(positions, level=None):
+    """Flat coordinates relative to the origin and offsets of the buildings at the given positions"""
+    if level is None:
+        layer       = geometry.get_layer("buildings")
+        xy, offsets = layer["xy"], layer["offsets"]
+    else:
+        xy, offsets = get_simplified(level)
+
+    xy, offsets = columnar.take_csr(xy, offsets, positions)
+
+    return (xy - get_origin()).astype(get_dtype()), offsets
+
+def format_functions(functions):
+    """Counts the functions in a building and puts them in format for the hovertool"""
+    string = str()
+    for function, count in Counter(functions).items():
+        string = string + str(count) + " " + str(function) + "<br>"
+
+    return string
+
+def build_hover():
+    """Address and functions of all buildings as html for the hovertool, as utf-8 bytes and offsets"""
+    df = store.get_buildings()
+
+    addresses, address_offsets  = columnar.encode_strings(str(item).replace("\n", "<br>") for item in df['full_adress'])
+    functions, function_offsets = columnar.encode_strings(format_functions(item)
+                                                          for item in store.get_lists('gebruiksdoelVerblijfsobject'))
+
+    return {"addresses": addresses, "address_offsets": address_offsets, "functions": functions, "function_offsets": function_offsets}
+
+def load_hover():
+    """Hover strings of all buildings once for the whole process, memory mapped from the snapshot if there is one"""
+    hover = snapshot.read_arrays("hover")
+    if hover is None:
+        hover = build_hover()
+
+    return state.put("hover", hover)
+
+def get_hover(positions):
+    """Gives back the address and functions hover strings of the buildings at the given positions"""
+    hover = state.get("hover")
+    if hover is None:
+        hover = load_hover()
+
+    return (columnar.decode_strings(hover["addresses"], hover["address_offsets"], positions),
+            columnar.decode_strings(hover["functions"], hover["function_offsets"], positions))
+
+def get_data(positions, level=None, scores=None):
+    """
+    Columns for the building polygons at the given positions, scores can be given as (scores, normalized scores). The
+    coordinates of all buildings are in the flat columns x and y, start and end give the part of every building.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    addresses, functions = get_hover(positions)
+
+    xy, offsets = get_polygons(positions, level)
+
+    # typed arrays, so bokeh sends them as binary instead of a json list of numbers
+    data = {'x': xy[:, 0], 'y': xy[:, 1], 'start': offsets[:-1].astype(np.int32), 'end': offsets[1:].astype(np.int32),
+            'id': store.get_buildings()["pand_id"].values[positions].astype(np.float64),
+            'full_adress': addresses, 'functions': functions}
+
+    if scores is not None:
+        data['scores']      = np.asarray(scores[0])[positions].astype(np.float32)
+        data['norm_scores'] = np.asarray(scores[1])[positions].astype(np.float32)
+
+    return data
+
+def get_transform(source, coordinates, axis):
+    """Turns the start column of source and the flat offsets of one axis in coordinates back into polygons in web mercator"""
+    return CustomJSTransform(args=dict(source=source, coordinates=coordinates, column="xy"[axis], origin=float(get_origin()[axis])), v_func="""
+        /* xs is the start column of source, every building is one ring */
+        var values = coordinates.data[column];
+        var end    = source.data.end;
+        var shapes = new Array(xs.length);
+
+        for (var i = 0; i < xs.length; i++) {
+            var ring = new Float64Array(end[i] - xs[i]);
+            for (var j = 0; j < ring.length; j++) {
+                ring[j] = values[xs[i] + j] + origin;
+            }
+            shapes[i] = [[ring]];
+        }
+
+        return shapes;
+    """)
+
+def add_buildings(fig, data, **kwargs):
+    """Draws the buildings of get_data as multi_polygons, gives back the glyph, the source of the buildings and the source of the coordinates"""
+    coordinates = ColumnDataSource(data={key: data[key] for key in ['x', 'y']})
+    source      = ColumnDataSource(data={key: value for key, value in data.items() if key not in ['x', 'y']})
+
+    glyph = fig.multi_polygons(xs=transform('start', get_transform(source, coordinates, 0)),
+                               ys=transform('start', get_transform(source, coordinates, 1)), source=source, **kwargs)
+
+    return glyph, source, coordinates
+
+def get_view(fig):
+    """Bounding box and level of detail of the current ranges of a figure"""
+    bbox = (fig.x_range.start, fig.y_range.start, fig.x_range.end, fig.y_range.end)
+
+    return bbox, get_level(bbox[2] - bbox[0])
+
+def add_viewport_loading(fig, source, coordinates, query="", max_width=0):
+    """
+    Loads the buildings of the visible area into source and their coordinates into coordinates every time the map is moved
+    or zoomed, nothing is loaded when the view is wider than max_width meters (if given)
+    """
+    callback = CustomJS(args=dict(plot=fig, source=source, coordinates=coordinates, query=query, max_width=max_width), code="""
+        /* wait until panning or zooming stopped */
+        clearTimeout(window.buildingTimeout);
+
+        if (max_width > 0 && plot.x_range.end - plot.x_range.start > max_width) {
+            return;
+        }
+
+        window.buildingTimeout = setTimeout(function() {
+            var bbox = [plot.x_range.start, plot.y_range.start, plot.x_range.end, plot.y_range.end];
+            var url  = '/api/buildings?bbox=' + bbox.join(',') + query;
+
+            fetch(url).then(function(response) {
+                return response.json();
+            }).then(function(data) {
+                /* the coordinates first, the polygons are made of them when source changes */
+                coordinates.data = {x: data.x, y: data.y};
+                delete data.x;
+                delete data.y;
+                source.data = data;
+            });
+        }, 250);
+    """)
+
+    fig.x_range.js_on_change('start', callback)
+    fig.x_range.js_on_change('end', callback)
+    fig.y_range.js_on_change('start', callback)
+    fig.y_range.js_on_change('end', callback)
+
+    return fig
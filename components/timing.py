@@ -0,0 +1,125 @@
+"""
+Timing of the stages of a request (data load, reprojection, glyphs, serialization, template render). Stages of a request are
+sent in the Server-Timing header and all stages are kept as histograms for /metrics, per process. When PROFILE_REQUESTS is
+set, a request with ?profile=1 gives back the cProfile statistics of the request instead of the page.
+"""
+import os
+import time
+import pstats
+import cProfile
+import threading
+from io import StringIO
+from contextlib import contextmanager
+from flask import g, request, has_request_context, make_response
+from werkzeug.datastructures import ImmutableMultiDict
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# profiling a request has to be allowed when the app is started
+PROFILE = bool(os.environ.get("PROFILE_REQUESTS"))
+
+# number of functions in the profile of a request
+PROFILE_LINES = 40
+
+HELP = {"app_stage_seconds": "Time spent in a stage of a request", "app_request_seconds": "Time spent on a request"}
+
+# bucket counts, sum and count per metric and labels
+_HISTOGRAMS = {}
+_LOCK       = threading.Lock()
+
+def observe(metric, seconds, **labels):
+    """Counts a duration in the histogram of a metric with the given labels"""
+    key = (metric, tuple(sorted(labels.items())))
+
+    with _LOCK:
+        histogram = _HISTOGRAMS.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+
+        histogram[1] += seconds
+        histogram[2] += 1
+
+@contextmanager
+def stage(name):
+    """Times the code in the with block as a stage, stages of a request with the same name are added up"""
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe("app_stage_seconds", seconds, stage=name)
+
+        if has_request_context() and "stages" in g:
+            g.stages[name] = g.stages.get(name, 0.0) + seconds
+
+def server_timing(stages, total):
+    """Server-Timing header value of the stages and the whole request, in milliseconds"""
+    return ", ".join(name + ";dur=" + str(round(seconds * 1000, 2)) for name, seconds in list(stages.items()) + [("total", total)])
+
+def start_request():
+    """
+    Starts timing a request, and profiling it if that is allowed and asked for. The profile argument is taken out of the
+    query, so the routes do not see it.
+    """
+    g.start  = time.perf_counter()
+    g.stages = {}
+
+    if "profile" not in request.args:
+        return
+
+    args         = request.args.copy()
+    profile      = args.pop("profile")
+    request.args = ImmutableMultiDict(args)
+
+    if PROFILE and profile:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def finish_request(response):
+    """Adds the Server-Timing header, gives back the profile instead of the response if the request is profiled"""
+    if "start" not in g:
+        return response
+
+    total = time.perf_counter() - g.start
+    observe("app_request_seconds", total, endpoint=str(request.endpoint))
+
+    if "profiler" in g:
+        g.profiler.disable()
+
+        output = StringIO()
+        pstats.Stats(g.profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+
+        response = make_response(output.getvalue())
+        response.mimetype = "text/plain"
+
+    response.headers["Server-Timing"] = server_timing(g.stages, total)
+
+    return response
+
+def format_labels(labels, **extra):
+    """Prometheus labels like {stage="load",le="0.1"}"""
+    return "{" + ",".join(name + '="' + str(value) + '"' for name, value in list(labels) + list(extra.items())) + "}"
+
+def metrics():
+    """All histograms in the Prometheus text format"""
+    with _LOCK:
+        histograms = sorted((key, [list(value[0]), value[1], value[2]]) for key, value in _HISTOGRAMS.items())
+
+    lines = []
+    for metric in sorted(set(metric for (metric, _), _ in histograms)):
+        lines += ["# HELP " + metric + " " + HELP[metric], "# TYPE " + metric + " histogram"]
+
+        for (name, labels), (counts, total, count) in histograms:
+            if name != metric:
+                continue
+
+            lines += [metric + "_bucket" + format_labels(labels, le=bound) + " " + str(amount) for bound, amount in zip(BUCKETS, counts)]
+            lines += [metric + "_bucket" + format_labels(labels, le="+Inf") + " " + str(count),
+                      metric + "_sum" + format_labels(labels) + " " + repr(total),
+                      metric + "_count" + format_labels(labels) + " " + str(count)]
+
+    return "\n".join(lines) + "\n"
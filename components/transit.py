@@ -0,0 +1,135 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+
+from . import impact, state
+
+def build_line(segments):
+    """Station graph of one line: its stations in order along the line and the two stations of every segment as positions in that order"""
+    names = list(dict.fromkeys(list(segments.station1) + list(segments.station2)))
+    index = {name: i for i, name in enumerate(names)}
+    ends  = np.array([[index[station1], index[station2]] for station1, station2 in zip(segments.station1, segments.station2)])
+
+    matrix = csr_matrix((np.ones(len(ends)), (ends[:, 0], ends[:, 1])), shape=(len(names), len(names)))
+    degree = np.bincount(ends.ravel(), minlength=len(names))
+
+    # walk the line from one of its end stations, so parts of the line can be shown in order
+    start = int(np.argmin(degree))
+    order = breadth_first_order(matrix, start, directed=False, return_predecessors=False)
+    order = np.concatenate([order, np.setdiff1d(np.arange(len(names)), order)])
+
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[order] = np.arange(len(names))
+    ends        = rank[ends]
+
+    # link between two next stations of every segment and the number of segments of every link, parallel tracks are
+    # segments of the same link
+    links = ends.min(axis=1)
+
+    return {"stations": [names[i] for i in order], "ends": ends, "numbers": segments.number.values.astype(float),
+            "path": bool(np.all(np.abs(ends[:, 0] - ends[:, 1]) == 1)), "links": links,
+            "link_segments": np.bincount(links, minlength=len(names) - 1)}
+
+def build_transit():
+    """Builds the station graph per line and for every segment its line and stations, so a query only combines segments"""
+    ov, _ = impact.get_routes()
+
+    lines    = {}
+    segments = {}
+    for (modality, line), group in ov.groupby(["modaliteit", "lijn"]):
+        name        = str(modality) + " " + str(line)
+        lines[name] = build_line(group)
+
+        for i, number in enumerate(lines[name]["numbers"]):
+            segments[number] = (name, i)
+
+    # number of segments of all lines at every station, a station is unreachable when all of them are blocked
+    served = ov.groupby("station1").size().add(ov.groupby("station2").size(), fill_value=0)
+
+    return {"lines": lines, "segments": segments, "served": served.to_dict()}
+
+def load_transit():
+    """Builds the station graphs once for the whole process"""
+    return state.put("transit", build_transit())
+
+def get_transit():
+    """Gives back the station graphs, builds them if that did not happen yet"""
+    transit = state.get("transit")
+    if transit is None:
+        transit = load_transit()
+
+    return transit
+
+def split_path(line, blocked):
+    """
+    Like split_line, for a line of which every segment joins two next stations. A link is cut when all its segments are
+    blocked, the parts of the line are the runs of links between the cuts, so no graph has to be searched.
+    """
+    size    = len(line["stations"])
+    running = np.bincount(line["links"][blocked], minlength=size - 1) < line["link_segments"]
+
+    # first and last link of every run of running links
+    edges  = np.diff(np.concatenate([[False], running, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    stops  = np.flatnonzero(edges == -1)
+    parts  = [line["stations"][start:stop + 1] for start, stop in zip(starts.tolist(), stops.tolist())]
+
+    # stations next to a blocked segment that still have a running link
+    touched = np.zeros(size, dtype=bool)
+    touched[line["ends"][blocked].ravel()] = True
+
+    served = np.zeros(size, dtype=bool)
+    served[:-1] |= running
+    served[1:]  |= running
+
+    end_points = [line["stations"][i] for i in np.flatnonzero(touched & served)]
+
+    return parts, end_points
+
+def split_line(line, blocked):
+    """Parts of a line that still run without the blocked segments (positions in the line) and its new end stations"""
+    size   = len(line["stations"])
+    ends   = line["ends"][~blocked]
+    before = np.bincount(line["ends"].ravel(), minlength=size)
+    after  = np.bincount(ends.ravel(), minlength=size)
+
+    matrix    = csr_matrix((np.ones(len(ends)), (ends[:, 0], ends[:, 1])), shape=(size, size))
+    _, labels = connected_components(matrix, directed=False)
+
+    # stations without running segments are not part of the line anymore
+    running = after > 0
+    parts   = [[line["stations"][i] for i in np.flatnonzero(running & (labels == label))]
+               for label in np.unique(labels[running])]
+
+    end_points = [line["stations"][i] for i in np.flatnonzero((after < before) & running)]
+
+    return parts, end_points
+
+def get_disruption(numbers):
+    """Gives back per blocked line if it is split or closed with its remaining parts and new end stations, and the unreachable stations"""
+    transit = get_transit()
+
+    # blocked segments per line
+    blocked = {}
+    for number in numbers:
+        number = float(number)
+        if number in transit["segments"]:
+            name, i = transit["segments"][number]
+            blocked.setdefault(name, np.zeros(len(transit["lines"][name]["numbers"]), dtype=bool))[i] = True
+
+    lines   = []
+    stopped = {}
+    for name, mask in sorted(blocked.items()):
+        line              = transit["lines"][name]
+        parts, end_points = (split_path if line["path"] else split_line)(line, mask)
+
+        lines.append({"line": name, "split": len(parts) > 1, "closed": len(parts) == 0, "parts": parts, "end_points": end_points})
+
+        # blocked segments at every station over all lines
+        for station1, station2 in line["ends"][mask]:
+            for station in [line["stations"][station1], line["stations"][station2]]:
+                stopped[station] = stopped.get(station, 0) + 1
+
+    unreachable = sorted(station for station, count in stopped.items() if count >= transit["served"][station])
+
+    return {"lines": lines, "unreachable": unreachable}
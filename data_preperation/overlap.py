@@ -0,0 +1,109 @@
+import numpy as np
+import pyclipper
+import shapely
+from shapely.strtree import STRtree
+
+# buffer sizes in meters (same as in get_area_information.ipynb)
+RADIUS_NEIGHBORS = 1
+RADIUS_SMALL     = 10
+RADIUS_BIG       = 25
+
+# default scale pyclipper uses to put coordinates to integers
+CLIPPER_SCALE = pyclipper.scale_to_clipper(1)
+
+def convert(test):
+    """Converts string of "lat lon" coordinates to a list of lists of floats"""
+    test  = test.replace('"', '')
+    test2 = test.split(',')
+
+    test3 = [x.split(' ') for x in test2]
+
+    final = []
+    for coord in test3:
+        coord = [float(c) for c in coord if c != ""]
+        final.append(coord)
+
+    return final
+
+def get_offset(coordinates, radius):
+    """Calculates the offset polygon around a building, radius in meters"""
+    # transform radius to right size for clipper
+    radius = radius/100000
+
+    # do clipper calculations to get offset
+    clipper_offset     = pyclipper.PyclipperOffset()
+    coordinates_scaled = pyclipper.scale_to_clipper(coordinates)
+
+    clipper_offset.AddPath(coordinates_scaled, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+
+    new_coordinates = clipper_offset.Execute(pyclipper.scale_to_clipper(radius))
+
+    # same as pyclipper.scale_from_clipper, but in one numpy division
+    return np.array(new_coordinates[0], dtype=np.float64) / CLIPPER_SCALE
+
+def get_overlap(offsets, geometries, ids):
+    """
+    Gives back for every offset polygon the ids of the geometries that intersect it. Uses a STRtree on the geometries
+    and one bulk query with prepared offset polygons, ids are given back in the order of the geometries.
+    """
+    tree     = STRtree(geometries)
+    polygons = np.array([shapely.polygons(offset) for offset in offsets], dtype=object)
+    shapely.prepare(polygons)
+
+    # pairs of (offset polygon, geometry) that intersect
+    offset_idx, geometry_idx = tree.query(polygons, predicate="intersects")
+
+    # sort pairs per offset polygon and keep order of the geometries within
+    order        = np.lexsort((geometry_idx, offset_idx))
+    offset_idx   = offset_idx[order]
+    geometry_idx = geometry_idx[order]
+
+    ids    = np.asarray(ids, dtype=float)
+    splits = np.searchsorted(offset_idx, np.arange(1, len(polygons)))
+
+    return [ids[part].tolist() for part in np.split(geometry_idx, splits)]
+
+def get_overlap_polygons(offsets, wgs, ids):
+    """Gives back for every offset polygon the ids of the buildings that intersect it"""
+    return get_overlap(offsets, [shapely.polygons(coordinates) for coordinates in wgs], ids)
+
+def get_overlap_polygon_line(offsets, lines, ids):
+    """Gives back for every offset polygon the ids of the lines (ov or roads) that intersect it"""
+    return get_overlap(offsets, [shapely.linestrings(coordinates) for coordinates in lines], ids)
+
+def remove_own(linked, own_ids):
+    """Removes the id of the building itself from its linked buildings"""
+    for ids, own_id in zip(linked, own_ids):
+        ids.remove(float(own_id))
+
+    return linked
+
+def add_overlap_columns(city_info, ov, all_roads, buildings=None):
+    """
+    Adds the neighbors, linked_small, linked_big, ov_small, ov_big, roads_small and roads_big columns to the frame with
+    buildings, gives the same result as get_area_information.ipynb. The lijn_coordinaten of ov and WKT_LAT_LNG of all_roads
+    should be converted to lists already. Overlapping buildings are searched in buildings (frame with pand_id and wgs),
+    which is city_info itself by default.
+    """
+    if buildings is None:
+        buildings = city_info
+
+    # offsets around every building
+    offset_neighbors = [get_offset(coordinates, RADIUS_NEIGHBORS) for coordinates in city_info.wgs]
+    offset_small     = [get_offset(coordinates, RADIUS_SMALL) for coordinates in city_info.wgs]
+    offset_big       = [get_offset(coordinates, RADIUS_BIG) for coordinates in city_info.wgs]
+
+    # overlapping buildings without the building itself
+    city_info["neighbors"]    = remove_own(get_overlap_polygons(offset_neighbors, buildings.wgs, buildings.pand_id), city_info.pand_id)
+    city_info["linked_small"] = remove_own(get_overlap_polygons(offset_small, buildings.wgs, buildings.pand_id), city_info.pand_id)
+    city_info["linked_big"]   = remove_own(get_overlap_polygons(offset_big, buildings.wgs, buildings.pand_id), city_info.pand_id)
+
+    # overlapping tram and metro lines
+    city_info["ov_small"] = get_overlap_polygon_line(offset_small, ov.lijn_coordinaten, ov.number)
+    city_info["ov_big"]   = get_overlap_polygon_line(offset_big, ov.lijn_coordinaten, ov.number)
+
+    # overlapping roads
+    city_info["roads_small"] = get_overlap_polygon_line(offset_small, all_roads.WKT_LAT_LNG, all_roads.number)
+    city_info["roads_big"]   = get_overlap_polygon_line(offset_big, all_roads.WKT_LAT_LNG, all_roads.number)
+
+    return city_info
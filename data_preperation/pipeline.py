@@ -0,0 +1,249 @@
+"""
+Preprocessing pipeline of get_area_information.ipynb as a command line script. The buildings are split in spatial chunks that
+are processed in a process pool, every chunk carries a halo of surrounding buildings so overlaps across chunk borders are
+correct. Run from the root of the project:
+
+    python -m data_preperation.pipeline --input data_preperation/oud_oost_original.csv --workers 8
+"""
+import os
+import argparse
+import tempfile
+import itertools
+import pandas as pd
+import numpy as np
+from ast import literal_eval
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from components import scoring
+
+from . import overlap
+
+# translation of the BAG functions
+FUNCTIONS = {
+    "woonfunctie":"residential function",
+    "winkelfunctie":"shopping function",
+    "industriefunctie":"industry function",
+    "bijeenkomstfunctie":"meet function",
+    "kantoorfunctie":"office function",
+    "overige gebruiksfunctie":"other usage",
+    "onderwijsfunctie":"educational function",
+    "gezondheidszorgfunctie":"health care function",
+    "sportfunctie":"sports function",
+    "logiesfunctie":"accomodation function",
+    "celfunctie":"cell function"
+}
+
+ROAD_TYPES = {'PLUS':'plus', 'HOOFD':'hoofd', 'CORRIDOR':'plus', 'PLUS_BGG':'plus', 'CORRIDOR_B':'plus'}
+
+# columns written to the output, in this order
+OUTPUT_COLUMNS = ["pand_id", "full_adress", "wgs", "gebruiksdoelVerblijfsobject", "neighbors", "linked_small", "linked_big",
+                  "ov_small", "ov_big", "roads_small", "roads_big"]
+
+# chunks per worker that are submitted at once, more chunks are submitted as they are done
+PENDING = 2
+
+# data shared by all chunks in a worker, set by init_worker
+_OV    = None
+_ROADS = None
+
+def get_address(group):
+    """Address of the verblijfsobjecten with the same postcode in a building"""
+    # one address in the building
+    if len(group) == 1:
+        straat      = str(group.openbareRuimteNaam.values[0])
+        huisnummers = str(int(group.huisnummer.values[0]))
+        postcode    = str(group.postcode.values[0])
+
+    # multiple addresses in the building
+    else:
+        alle_straten = group.openbareRuimteNaam.unique()
+        if len(alle_straten) == 1:
+            straat = alle_straten[0]
+        else:
+            straat = str(group.openbareRuimteNaam.mode().values[0])
+
+        alle_huisnummers = group.huisnummer.unique()
+        if len(alle_huisnummers) == 1:
+            huisnummers = str(int(alle_huisnummers[0]))
+        else:
+            huisnummers = str(int(min(alle_huisnummers))) + "-" + str(int(max(alle_huisnummers)))
+
+        postcode = str(group.postcode.values[0])
+
+    return str(straat + ' ' + huisnummers + "\n" + postcode + " Amsterdam")
+
+def combine_addresses(addresses):
+    """Full address of a building, multiple postcodes are combined into one "All in Amsterdam" address"""
+    if len(addresses) > 1:
+        adress = str()
+        for row in addresses:
+            street = row.split("\n")
+            adress = adress + street[0] + " " + street[1].split(" ")[0] + "\n"
+
+        return adress + "All in Amsterdam"
+
+    return addresses[0]
+
+def read_buildings(path):
+    """Reads the BAG extract and gives back one row per building with address, coordinates and functions"""
+    info_city = pd.read_csv(path)
+    info_city["pand_id"] = info_city["pand_id"].apply(str)
+
+    # addresses per building
+    info_adresses = info_city.groupby(["pand_id", "postcode"]).apply(get_address).rename("adress").reset_index()
+    info_adresses = info_adresses.groupby("pand_id").adress.apply(lambda x:combine_addresses(list(x))).rename("full_adress").reset_index()
+
+    # coordinates and functions per building
+    info_building = info_city[["pand_id", "wgs"]].drop_duplicates()
+    info_building["wgs"] = info_building.wgs.apply(literal_eval)
+    info_function = info_city.groupby("pand_id").gebruiksdoelVerblijfsobject.apply(lambda x:[FUNCTIONS[f] for f in x]).reset_index()
+
+    city_info = pd.merge(info_adresses, info_building, on="pand_id", how="right").merge(info_function, on="pand_id", how="left")
+
+    return city_info.reset_index(drop=True)
+
+def read_ov(path):
+    """Reads the tram and metro segments between stations"""
+    ov = pd.read_csv(path)
+    ov["lijn_coordinaten"] = ov.lijn_coordinaten.apply(overlap.convert)
+
+    return ov
+
+def read_roads(plus_path, emergency_path):
+    """Reads and combines the plus/hoofd net and the emergency routes, the same way as all_roads_amsterdam.csv is made"""
+    df_roads = pd.read_csv(plus_path, delimiter=";")
+    df_roads = df_roads[['OBJECTNUMMER', "STT_NAAM", "AUTO", "WKT_LAT_LNG"]][df_roads.AUTO.notnull()]
+    df_roads['WKT_LAT_LNG'] = df_roads.WKT_LAT_LNG.apply(lambda x:x.replace("LINESTRING(", "").replace(")", ""))
+
+    df_emergency = pd.read_csv(emergency_path)
+    df_emergency['AUTO'] = "calamiteit"
+
+    all_roads = pd.concat([df_roads.drop(columns="OBJECTNUMMER"), df_emergency[['STT_NAAM', 'AUTO', 'WKT_LAT_LNG']]]).reset_index(drop=True)
+    all_roads['AUTO']        = all_roads.AUTO.replace(ROAD_TYPES)
+    all_roads['number']      = all_roads.index
+    all_roads["WKT_LAT_LNG"] = all_roads.WKT_LAT_LNG.apply(overlap.convert)
+
+    return all_roads
+
+def get_bounds(wgs):
+    """Gives back the bounding box (min lat, min lon, max lat, max lon) of every building"""
+    bounds = np.empty((len(wgs), 4))
+
+    for i, coordinates in enumerate(wgs):
+        coordinates = np.asarray(coordinates)
+        bounds[i, :2] = coordinates.min(axis=0)
+        bounds[i, 2:] = coordinates.max(axis=0)
+
+    return bounds
+
+def split_chunks(bounds, chunk_size, halo):
+    """
+    Splits the buildings in square grid cells of chunk_size degrees. Gives back for every chunk the positions of its buildings
+    and the positions of all buildings that overlap the chunk extended with the halo.
+    """
+    cells = np.floor(bounds[:, :2] / chunk_size).astype(np.int64)
+
+    chunks = []
+    for cell in np.unique(cells, axis=0):
+        positions = np.flatnonzero((cells == cell).all(axis=1))
+
+        # extent of the buildings in the chunk plus the largest buffer
+        low  = bounds[positions, :2].min(axis=0) - halo
+        high = bounds[positions, 2:].max(axis=0) + halo
+
+        in_halo = np.flatnonzero((bounds[:, 2:] >= low).all(axis=1) & (bounds[:, :2] <= high).all(axis=1))
+
+        chunks.append((positions, in_halo))
+
+    return chunks
+
+def init_worker(ov, all_roads):
+    """Keeps the ov segments and roads in the worker so they are only sent once"""
+    global _OV, _ROADS
+
+    _OV    = ov
+    _ROADS = all_roads
+
+def process_chunk(chunk, halo):
+    """Calculates overlaps and raw scores for the buildings in a chunk"""
+    chunk = overlap.add_overlap_columns(chunk, _OV, _ROADS, buildings=halo)
+    chunk = scoring.add_scores(chunk, _OV, _ROADS, buildings=halo)
+
+    return chunk
+
+def process_chunks(executor, city_info, chunks, columns, workers):
+    """
+    Gives back the index and result of every chunk as soon as it is done. Chunks are submitted when others are done, so at
+    most PENDING chunks per worker with their halo are copied and waiting at once.
+    """
+    waiting = iter(enumerate(chunks))
+    pending = {}
+
+    while True:
+        for i, (positions, in_halo) in itertools.islice(waiting, workers * PENDING - len(pending)):
+            pending[executor.submit(process_chunk, city_info.iloc[positions][columns].copy(), city_info.iloc[in_halo][columns])] = i
+
+        if not pending:
+            return
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+def write_csv(df, path, header):
+    """Appends rows to the output csv, lists are written as python strings like the notebook does"""
+    df.to_csv(path, mode="w" if header else "a", header=header, index=False)
+
+def run(input_path, ov_path, plus_path, emergency_path, output_path, workers=None, chunk_size=0.005):
+    """Runs the whole preprocessing and writes the buildings to output_path"""
+    city_info = read_buildings(input_path)
+    ov        = read_ov(ov_path)
+    all_roads = read_roads(plus_path, emergency_path)
+
+    # chunks with a halo of the largest buffer, so every overlapping building is in the halo
+    halo   = overlap.RADIUS_BIG / 100000 * 1.01
+    chunks = split_chunks(get_bounds(city_info.wgs), chunk_size, halo)
+    print("processing", len(city_info), "buildings in", len(chunks), "chunks")
+
+    if workers is None:
+        workers = os.cpu_count()
+
+    columns = ["pand_id", "full_adress", "wgs", "gebruiksdoelVerblijfsobject"]
+    minimum = {}
+    maximum = {}
+
+    with tempfile.TemporaryDirectory() as parts, \
+         ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ov, all_roads)) as executor:
+
+        # store every chunk on disk as soon as it is done and keep track of score ranges for normalization
+        for done, (i, chunk) in enumerate(process_chunks(executor, city_info, chunks, columns, workers)):
+            chunk.to_pickle(os.path.join(parts, str(i) + ".pkl"))
+
+            for column in scoring.score_columns():
+                minimum[column] = min(minimum.get(column, np.inf), chunk[column].min())
+                maximum[column] = max(maximum.get(column, -np.inf), chunk[column].max())
+
+            print("done with chunk", done + 1, "of", len(chunks))
+
+        # normalize and write the chunks one by one
+        output_columns = OUTPUT_COLUMNS + scoring.score_columns() + ["norm_" + column for column in scoring.score_columns()]
+        for i in range(len(chunks)):
+            chunk = scoring.normalize(pd.read_pickle(os.path.join(parts, str(i) + ".pkl")), minimum, maximum)
+            write_csv(chunk[output_columns], output_path, header=(i == 0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess BAG buildings into city_area_buildings.csv")
+    parser.add_argument("--input", default="./data_preperation/oud_oost_original.csv", help="BAG extract with one row per verblijfsobject")
+    parser.add_argument("--ov", default="./data_preperation/tram en metro lijnen plus stations.csv", help="tram and metro segments")
+    parser.add_argument("--plus-roads", default="./data_preperation/PLUSHOOFDNETTEN.csv", help="plus and hoofd net roads")
+    parser.add_argument("--emergency-roads", default="./data_preperation/emergency_routes.csv", help="emergency routes")
+    parser.add_argument("--output", default="./data/city_area_buildings.csv", help="csv with all building information")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--chunk-size", type=float, default=0.005, help="size of the spatial chunks in degrees")
+    args = parser.parse_args()
+
+    run(args.input, args.ov, args.plus_roads, args.emergency_roads, args.output, args.workers, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
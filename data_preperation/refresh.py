@@ -0,0 +1,142 @@
+"""
+Incremental refresh of the buildings in the snapshot. Only the changed buildings and the buildings within the largest buffer
+of their old or new footprint get new overlaps (neighbors, linked_*, ov_*, roads_*) and raw scores, everything else is kept.
+The result is written as a new version of the snapshot, which the running server swaps to. Run from the root of the project:
+
+    python -m data_preperation.refresh --input changed_buildings.csv --removed removed_ids.txt
+"""
+import os
+import time
+import argparse
+import pandas as pd
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from components import store, snapshot, columnar, scoring, cache
+
+from . import overlap, pipeline
+
+OV_PATH    = "./data/tram en metro lijnen plus stations.csv"
+ROADS_PATH = "./data/all_roads_amsterdam.csv"
+
+# distance in degrees within which a building can overlap the buffers of another one, the same as the halo of the pipeline
+HALO = overlap.RADIUS_BIG / 100000 * 1.01
+
+def read_routes(ov_path=OV_PATH, roads_path=ROADS_PATH):
+    """Reads the ov segments and roads the server uses, with their coordinates converted to lists"""
+    ov = pipeline.read_ov(ov_path)
+
+    all_roads = pd.read_csv(roads_path)
+    all_roads["WKT_LAT_LNG"] = all_roads.WKT_LAT_LNG.apply(overlap.convert)
+
+    return ov, all_roads
+
+def to_polygons(xy, offsets):
+    """Footprints of flat lat/lon coordinates, footprints without coordinates are empty"""
+    offsets = np.asarray(offsets)
+    index   = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    rings = np.empty(len(offsets) - 1, dtype=object)
+    shapely.linearrings(np.asarray(xy), indices=index, out=rings)
+
+    return shapely.polygons(rings)
+
+def refresh(changes, removed):
+    """
+    Applies changed or new buildings (frame with pand_id, full_adress, wgs and gebruiksdoelVerblijfsobject like
+    pipeline.read_buildings gives back) and removed pand ids to the loaded buildings. Gives back the new frame without
+    list columns, the encoded list columns and the number of buildings that were computed again.
+    """
+    df      = store.get_buildings()
+    old_ids = df.index.values
+    new_ids = changes.pand_id.astype(float).values
+    changes = changes.set_index(new_ids)
+
+    # old rows stay in place and new buildings are added at the end, rows of -1 are taken from the changes
+    keep  = ~np.isin(old_ids, np.asarray(removed, dtype=float))
+    added = new_ids[~np.isin(new_ids, old_ids)]
+    ids   = np.concatenate([old_ids[keep], added])
+    rows  = np.concatenate([np.flatnonzero(keep), np.full(len(added), -1)])
+    rows[np.isin(ids, new_ids)] = -1
+
+    lists = {column: columnar.update_list(column, store.get_csr(column), rows, changes.loc[ids[rows < 0], column])
+             for column in ["wgs", "gebruiksdoelVerblijfsobject"]}
+
+    # buildings near the old or the new footprint of a changed building can get other overlaps
+    polygons = to_polygons(*lists["wgs"][:2])
+    gone     = np.flatnonzero(np.isin(old_ids, np.concatenate([new_ids, np.asarray(removed, dtype=float)])))
+    old      = to_polygons(*columnar.take_csr(*store.get_csr("wgs")[:2], gone))
+    tree     = STRtree(polygons)
+
+    searched = np.concatenate([polygons[rows < 0], old])
+    affected = np.union1d(np.flatnonzero(rows < 0), tree.query(searched, predicate="dwithin", distance=HALO)[1])
+
+    # every building that can overlap the buffers of the affected buildings
+    halo = np.union1d(affected, tree.query(polygons[affected], predicate="dwithin", distance=HALO)[1])
+
+    buildings = pd.DataFrame({"pand_id": ids[halo].astype(np.int64),
+                              "wgs": columnar.to_lists(*lists["wgs"], rows=halo),
+                              "gebruiksdoelVerblijfsobject": columnar.to_lists(*lists["gebruiksdoelVerblijfsobject"], rows=halo)})
+
+    # the same steps as a chunk of the pipeline, with the halo of the affected buildings (a chunk can not be empty)
+    chunk = buildings[np.isin(halo, affected)].copy()
+    if len(chunk) > 0:
+        chunk = pipeline.process_chunk(chunk, buildings)
+
+    scores = scoring.score_columns()
+    chunk  = chunk.reindex(columns=store.LIST_COLUMNS + scores)
+
+    # affected rows get the new lists, other rows keep theirs
+    rows = np.concatenate([np.flatnonzero(keep), np.full(len(added), -1)])
+    rows[affected] = -1
+
+    lists = {column: columnar.update_list(column, store.get_csr(column), rows, chunk[column]) for column in store.LIST_COLUMNS}
+
+    # columns without lists, addresses of the changed buildings and scores of the affected ones are new
+    frame = pd.concat([df[keep], pd.DataFrame({"pand_id": added.astype(np.int64)}, index=added)])
+    frame.loc[new_ids, "full_adress"] = changes.full_adress
+
+    frame.iloc[affected, [frame.columns.get_loc(column) for column in scores]] = chunk[scores].values
+
+    frame = scoring.normalize(frame, frame[scores].min(), frame[scores].max())
+
+    return frame.reset_index(drop=True), lists, len(affected)
+
+def run(input_path, removed_path=None, ov_path=OV_PATH, roads_path=ROADS_PATH):
+    """Refreshes the buildings of the current snapshot and writes the result as the new current version"""
+    start = time.time()
+
+    manifest = snapshot.load_snapshot()
+    changes  = pipeline.read_buildings(input_path) if input_path else pd.DataFrame(columns=["pand_id", "full_adress", "wgs", "gebruiksdoelVerblijfsobject"])
+    removed  = np.loadtxt(removed_path, dtype=float, ndmin=1) if removed_path else []
+
+    pipeline.init_worker(*read_routes(ov_path, roads_path))
+
+    store.load_buildings()
+    frame, lists, count = refresh(changes, removed)
+
+    path = snapshot.new_version()
+    columnar.write_columns(frame, os.path.join(path, "buildings"), lists)
+
+    # the refresh is made of the same source data, with other buildings
+    snapshot.write_snapshot(path, {"version": manifest.get("version", cache.data_version()), "buildings": os.path.basename(path),
+                                   "parent": manifest.get("name")})
+    snapshot.set_current(path)
+
+    print("refreshed", len(changes), "changed,", len(removed), "removed and", count, "affected buildings into snapshot",
+          os.path.basename(path), "in", round(time.time() - start, 1), "seconds")
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh changed buildings in the snapshot without preprocessing everything")
+    parser.add_argument("--input", default=None, help="BAG extract with one row per verblijfsobject of the changed or new buildings")
+    parser.add_argument("--removed", default=None, help="file with one pand id per line of buildings that are gone")
+    parser.add_argument("--ov", default=OV_PATH, help="tram and metro segments")
+    parser.add_argument("--roads", default=ROADS_PATH, help="all roads that can be blocked")
+    args = parser.parse_args()
+
+    run(args.input, args.removed, args.ov, args.roads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Fixtures of the tests: a small synthetic city in a scratch directory with links to the other data files of the project,
+like the benchmarks use, and the app loaded on it. Run from the root of the project:
+
+    python -m pytest -q
+"""
+import os
+import sys
+import importlib
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import run
+from components import snapshot, state
+
+# number of buildings of the synthetic city
+SIZE = 400
+
+@pytest.fixture(scope="session")
+def city(tmp_path_factory):
+    """Directory with a synthetic city in data, without a snapshot"""
+    path = str(tmp_path_factory.mktemp("city") / "city")
+    run.prepare_data(SIZE, path)
+
+    return path
+
+@pytest.fixture(scope="session")
+def app(city):
+    """The app module loaded on the synthetic city"""
+    from flask.cli import prepare_import
+
+    cwd = os.getcwd()
+    os.chdir(city)
+
+    try:
+        yield importlib.import_module(prepare_import(os.path.join(ROOT, "app.py")))
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    """Directory with its own synthetic city, the working directory of the test"""
+    path = str(tmp_path / "city")
+    run.prepare_data(100, path)
+    monkeypatch.chdir(path)
+
+    # nothing of earlier tests is served or swapped to
+    monkeypatch.setattr(snapshot, "_RELOAD", None)
+    monkeypatch.setattr(snapshot, "_FAILED", set())
+    state.install({})
+
+    return path
+
+@pytest.fixture
+def client(app, city, monkeypatch):
+    """Test client of the app, requests are handled in the directory of the city"""
+    monkeypatch.chdir(city)
+
+    return app.app.test_client()
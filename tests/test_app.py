@@ -0,0 +1,89 @@
+
+def get_bbox(app):
+    """Bbox around all buildings of the city"""
+    bounds = app.tiles.get_bounds()
+
+    return ",".join(str(value) for value in [bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()])
+
+def test_buildings_exclude(app, client):
+    bbox    = get_bbox(app)
+    pand_id = int(app.store.get_buildings().pand_id.iloc[0])
+
+    ids = client.get("/api/buildings?bbox=" + bbox).get_json()["id"]
+    assert pand_id in ids
+
+    ids = client.get("/api/buildings?bbox=" + bbox + "&exclude=" + str(float(pand_id))).get_json()["id"]
+    assert pand_id not in ids
+
+def test_buildings_rejects_bad_exclude(app, client):
+    bbox = get_bbox(app)
+
+    for exclude in ["abc", "1,,2", "nan", "inf"]:
+        assert client.get("/api/buildings?bbox=" + bbox + "&exclude=" + exclude).status_code == 400
+
+def test_buildings_rejects_bad_bbox(client):
+    for bbox in ["", "1,2,3", "a,b,c,d", "nan,nan,nan,nan", "0,0,inf,1", "1,0,0,1", "0,1,1,0"]:
+        assert client.get("/api/buildings?bbox=" + bbox).status_code == 400
+
+def test_requests_do_not_read_data_files(app, client, monkeypatch):
+    def data_version(*args):
+        raise AssertionError("the version of the data is found on a request")
+
+    monkeypatch.setattr(app.cache, "data_version", data_version)
+    url = app.raster.get_url("small", "default").format(Z=0, X=0, Y=0)
+
+    assert client.get("/heatmap/small/default").status_code == 200
+    assert client.get(url).status_code == 200
+
+def test_profile_argument_is_not_a_weight(app, client):
+    url = "/api/buildings?bbox=" + get_bbox(app) + "&fire=small&focus=custom&function.residential function=2"
+
+    assert client.get(url + "&profile=1").get_json() == client.get(url).get_json()
+
+def test_custom_weights_should_be_finite(app, client):
+    url = "/api/buildings?bbox=" + get_bbox(app) + "&fire=small&focus=custom&ov.Metro="
+
+    assert client.get(url + "2").status_code == 200
+    assert client.get(url + "inf").status_code == 400
+    assert client.get(url + "nan").status_code == 400
+
+def test_etag_per_encoding(client):
+    identity = client.get("/map/0/0")
+    gzipped  = client.get("/map/0/0", headers={"Accept-Encoding": "gzip"})
+
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in gzipped.headers["Vary"]
+    assert gzipped.get_etag()[0] == identity.get_etag()[0] + "-gzip"
+
+def test_etag_not_modified(client):
+    for headers in [{}, {"Accept-Encoding": "gzip"}]:
+        etag = client.get("/map/0/0", headers=headers).headers["ETag"]
+
+        response = client.get("/map/0/0", headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+
+    # an ETag of older data is not the page
+    response = client.get("/map/0/0", headers={"Accept-Encoding": "gzip", "If-None-Match": '"older-gzip"'})
+    assert response.status_code == 200
+
+def test_etag_of_static_file(app, client):
+    url  = app.assets.BOKEH_URL + "static/js/bokeh.min.js"
+    etag = client.get(url, headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+    assert etag.endswith('-gzip"')
+    assert client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+
+def test_search(app, client):
+    df      = app.store.get_buildings()
+    row     = df[df.full_adress.notnull()].iloc[0]
+    line    = row.full_adress.split("\n")[0]
+    results = client.get("/api/search?q=" + line).get_json()
+
+    assert results[0]["pand_id"] == row.pand_id
+    assert results[0]["address"].startswith(line)
+    assert len(client.get("/api/search?q=straat&limit=3").get_json()) == 3
+    assert client.get("/api/search?q=").get_json() == []
+
+def test_search_rejects_bad_limit(client):
+    assert client.get("/api/search?q=straat&limit=abc").status_code == 400
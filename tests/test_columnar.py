@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from components import columnar
+
+IDS       = [[1, 2, 3], [], [4], [5, 6]]
+WGS       = [[[52.1, 4.8], [52.2, 4.9], [52.1, 4.8]], [], [[52.3, 4.7]], [[52.0, 4.6], [52.4, 4.5]]]
+FUNCTIONS = [["office function", "residential function"], [], ["residential function"], ["shopping function"]]
+
+def test_csr_round_trip():
+    values, offsets = columnar.to_csr(IDS, np.int64)
+
+    assert offsets.tolist() == [0, 3, 3, 4, 6]
+    assert columnar.from_csr(values, offsets) == IDS
+    assert columnar.from_csr(*columnar.to_csr([], np.int64)) == []
+
+def test_take_csr():
+    values, offsets = columnar.take_csr(*columnar.to_csr(IDS, np.int64), [3, 1, 0, 3])
+
+    assert columnar.from_csr(values, offsets) == [IDS[3], IDS[1], IDS[0], IDS[3]]
+
+def test_encode_list_round_trip():
+    for column, lists in [("linked_big", IDS), ("wgs", WGS), ("gebruiksdoelVerblijfsobject", FUNCTIONS)]:
+        encoded = columnar.encode_list(column, lists)
+
+        assert columnar.to_lists(*encoded) == lists
+        assert columnar.to_lists(*encoded, rows=[2, 0]) == [lists[2], lists[0]]
+
+def test_update_list():
+    # a row is removed, a row is changed and a row with a new function is added
+    rows    = [0, -1, 3, -1]
+    lists   = [["cell function"], ["sports function", "office function"]]
+    encoded = columnar.update_list("gebruiksdoelVerblijfsobject", columnar.encode_list("gebruiksdoelVerblijfsobject", FUNCTIONS), rows, lists)
+
+    assert columnar.to_lists(*encoded) == [FUNCTIONS[0], lists[0], FUNCTIONS[3], lists[1]]
+    assert encoded[0].dtype == np.int16
+
+def test_columns_round_trip(tmp_path):
+    df = pd.DataFrame({"pand_id": np.arange(4, dtype=np.int64), "full_adress": ["Straat 1\n1091AA", None, "Één 2", ""],
+                       "score": [0.5, 1.0, np.nan, 2.0], "linked_big": IDS, "wgs": WGS, "gebruiksdoelVerblijfsobject": FUNCTIONS})
+    columnar.write_columns(df, str(tmp_path))
+
+    read = columnar.read_columns(str(tmp_path))
+    pd.testing.assert_frame_equal(read[df.columns], df)
+
+    lists = columnar.read_lists(str(tmp_path))
+    assert columnar.to_lists(*lists["gebruiksdoelVerblijfsobject"]) == FUNCTIONS
+    assert columnar.to_lists(*lists["wgs"], rows=[3]) == [WGS[3]]
+    assert list(columnar.read_columns(str(tmp_path), lists=False).columns) == ["pand_id", "full_adress", "score"]
@@ -0,0 +1,32 @@
+import os
+import json
+import numpy as np
+
+from components import impact, store
+
+def test_bundles_of_another_format_are_not_served(scratch):
+    impact.build_impact()
+    pand_id = store.get_buildings().pand_id.iloc[0]
+
+    assert "small" in impact.load_impact()
+    assert "access" in impact.get_bundle(pand_id, "small")
+
+    # bundles written before access and transit were added, without a format
+    with open(os.path.join(impact.IMPACT_PATH, "small.ndjson"), "rb") as f:
+        bundles = [json.loads(line) for line in f]
+
+    offsets = np.zeros(len(bundles) + 1, dtype=np.int64)
+    with open(os.path.join(impact.IMPACT_PATH, "small.ndjson"), "wb") as f:
+        for i, bundle in enumerate(bundles):
+            del bundle["access"], bundle["transit"]
+            f.write(json.dumps(bundle).encode("utf-8") + b"\n")
+            offsets[i + 1] = f.tell()
+
+    np.save(os.path.join(impact.IMPACT_PATH, "small_offsets.npy"), offsets)
+    os.remove(os.path.join(impact.IMPACT_PATH, "format.npy"))
+
+    assert impact.load_impact() == {}
+    assert {"access", "transit"} <= set(impact.get_bundle(pand_id, "small"))
+
+    np.save(os.path.join(impact.IMPACT_PATH, "format.npy"), np.array(impact.BUNDLE_FORMAT - 1))
+    assert impact.load_impact() == {}
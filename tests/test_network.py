@@ -0,0 +1,53 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from components import network
+
+def make_network(side, seed=0):
+    """Grid of side x side junctions with roads of random length to the right and down, some roads are missing"""
+    rng   = np.random.default_rng(seed)
+    nodes = np.arange(side * side).reshape(side, side)
+
+    sources = np.concatenate([nodes[:, :-1].ravel(), nodes[:-1].ravel()])
+    targets = np.concatenate([nodes[:, 1:].ravel(), nodes[1:].ravel()])
+    keep    = rng.random(len(sources)) > 0.1
+    sources, targets = sources[keep], targets[keep]
+    lengths = rng.uniform(10, 100, len(sources))
+
+    # both directions, sorted per junction like build_network
+    sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+    lengths = np.concatenate([lengths, lengths])
+
+    order  = np.argsort(sources, kind="stable")
+    indptr = np.zeros(side * side + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=side * side))
+
+    graph = {"indptr": indptr, "indices": targets[order], "lengths": lengths[order], "size": side * side}
+    graph["landmarks"], graph["distances"] = network.choose_landmarks(graph)
+
+    return graph
+
+def test_shortest_path_matches_dijkstra():
+    graph = make_network(15)
+    rng   = np.random.default_rng(1)
+
+    # a few sources to many targets, with and without blocked roads
+    for share in [0, 0.1, 0.25]:
+        blocked = rng.random(len(graph["indices"])) < share
+        sources = rng.integers(graph["size"], size=5)
+        exact   = dijkstra(network.to_matrix(graph, blocked), indices=sources)
+
+        for source, distances in zip(sources, exact):
+            for target in rng.integers(graph["size"], size=20):
+                length = network.shortest_path(graph, int(source), int(target), blocked)
+
+                assert length == distances[target] or np.isclose(length, distances[target], rtol=1e-6)
+
+def test_shortest_path_limit():
+    graph   = make_network(10)
+    blocked = np.zeros(len(graph["indices"]), dtype=bool)
+    length  = network.shortest_path(graph, 0, graph["size"] - 1, blocked)
+
+    assert np.isfinite(length)
+    assert network.shortest_path(graph, 0, graph["size"] - 1, blocked, limit=length + 1) == length
+    assert network.shortest_path(graph, 0, graph["size"] - 1, blocked, limit=length / 2) == np.inf
@@ -0,0 +1,26 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from data_preperation import pipeline
+
+def test_process_chunks_bounds_pending_chunks(monkeypatch):
+    monkeypatch.setattr(pipeline, "process_chunk", lambda chunk, halo: chunk)
+    submitted = []
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, *args):
+            submitted.append(args)
+            return super().submit(*args)
+
+    city_info = pd.DataFrame({"pand_id": range(100)})
+    chunks    = [([i], [i]) for i in range(100)]
+    results   = {}
+
+    with Executor(max_workers=3) as executor:
+        for i, chunk in pipeline.process_chunks(executor, city_info, chunks, ["pand_id"], workers=3):
+            # chunks that are submitted and not given back yet
+            assert len(submitted) - len(results) <= 3 * pipeline.PENDING
+            results[i] = chunk
+
+    assert len(submitted) == 100
+    assert all(results[i].pand_id.tolist() == [i] for i in range(100))
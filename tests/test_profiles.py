@@ -0,0 +1,23 @@
+import pytest
+from copy import deepcopy
+
+from components import profiles, scoring
+
+def test_parse_weights():
+    residential = deepcopy(scoring.WEIGHTS["residential"])
+    weights     = profiles.parse_weights({"base": "residential", "ov.Metro": "2", "function.office function": "0.5"})
+
+    assert weights["ov"]["Metro"] == 2
+    assert weights["function"]["office function"] == 0.5
+    assert weights["road"] == residential["road"]
+
+    # the weights of the focus are not changed
+    assert scoring.WEIGHTS["residential"] == residential
+    assert profiles.parse_weights({}) == scoring.WEIGHTS["default"]
+
+@pytest.mark.parametrize("args", [{"base": "unknown"}, {"unknown.Metro": "1"}, {"ov": "1"}, {"ov.": "1"},
+                                  {"ov.Metro": "abc"}, {"ov.Metro": ""}, {"ov.Metro": "inf"}, {"ov.Metro": "-inf"},
+                                  {"ov.Metro": "nan"}, {"ov.Bus": "1"}, {"function.typo": "1"}])
+def test_parse_weights_rejects(args):
+    with pytest.raises(ValueError):
+        profiles.parse_weights(args)
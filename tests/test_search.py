@@ -0,0 +1,26 @@
+import pytest
+
+from components import search
+
+@pytest.mark.parametrize("text, query", [
+    ("Keizersgracht 12", ("keizersgracht", 12, None)),
+    ("1e Helmersstraat 5", ("1e helmersstraat", 5, None)),
+    ("Één straat 3a", ("een straat", 3, None)),
+    ("Van Baerlestraat", ("van baerlestraat", None, None)),
+    ("1015CJ", (None, None, "1015CJ")),
+    ("1015 c", (None, None, "1015C")),
+    ("keizersgr 12 1015", ("keizersgr", 12, "1015")),
+    ("keizersgracht 12, 1015 cj", ("keizersgracht", 12, "1015CJ")),
+])
+def test_parse_query(text, query):
+    assert search.parse_query(text) == query
+
+@pytest.mark.parametrize("text", ["", "   ", "!?", "-"])
+def test_parse_query_without_address(text):
+    assert search.parse_query(text) == (None, None, None)
+
+def test_parse_address():
+    assert search.parse_address("Keizersgracht 12-14A\n1015CJ Amsterdam") == [("Keizersgracht", 12, 14, "1015CJ")]
+    assert search.parse_address("Plein\n1011AB Amsterdam") == [("Plein", -1, -1, "1011AB")]
+    assert search.parse_address("Straat 1 1091AA\nLaan 3 1092BB\nAll in Amsterdam") == [("Straat", 1, 1, "1091AA"),
+                                                                                          ("Laan", 3, 3, "1092BB")]
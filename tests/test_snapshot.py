@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from flask import Flask
+
+from components import snapshot, state, store, cache, export, tiles, search
+from data_preperation import refresh
+
+# seconds a swap in another thread gets to finish
+TIMEOUT = 10
+
+def write_version(name, root=snapshot.SNAPSHOT_PATH):
+    """Writes an empty version of the snapshot of the current data and makes it current"""
+    path = os.path.join(root, name)
+    os.makedirs(path)
+
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump({"version": cache.data_version(), "buildings": "", "arrays": {}}, f)
+
+    snapshot.set_current(path, root)
+
+def load_name():
+    """Reload of the tests, keeps the name of the loaded version"""
+    state.put("name", snapshot.get_manifest()["name"])
+
+def wait_for(condition):
+    """Waits until condition gives back True"""
+    end = time.time() + TIMEOUT
+    while not condition():
+        assert time.time() < end
+        time.sleep(0.01)
+
+def make_app():
+    """App that swaps versions between requests and gives back the name of the version it serves"""
+    app = Flask(__name__)
+    app.before_request(snapshot.start_request)
+    app.teardown_request(snapshot.end_request)
+    app.add_url_rule("/", "name", lambda: state.get("name"))
+
+    return app
+
+def test_refresh_writes_new_version(scratch):
+    snapshot.build_snapshot()
+    first = snapshot.read_current()
+
+    df      = store.get_buildings()
+    changed = int(df.pand_id.iloc[0])
+    removed = int(df.pand_id.iloc[1])
+    added   = int(df.pand_id.max()) + 1
+    ring    = store.get_list("wgs", 0)
+
+    with open("changes.csv", "w") as f:
+        f.write("pand_id,postcode,huisnummer,openbareRuimteNaam,wgs,gebruiksdoelVerblijfsobject\n")
+        f.write(str(changed) + ",1091AB,3,Nieuwe Straat,\"" + str(ring) + "\",winkelfunctie\n")
+        f.write(str(added) + ",1091AB,5,Nieuwe Straat,\"" + str(ring) + "\",woonfunctie\n")
+    with open("removed.txt", "w") as f:
+        f.write(str(removed) + "\n")
+
+    refresh.run("changes.csv", "removed.txt")
+
+    name = snapshot.read_current()
+    assert name != first
+    assert os.path.exists(os.path.join(snapshot.SNAPSHOT_PATH, first))
+
+    state.install(state.stage(lambda: (snapshot.load_snapshot(), store.load_buildings())))
+    df = store.get_buildings()
+
+    assert snapshot.get_manifest()["parent"] == first
+    assert snapshot.get_buildings_version() == name
+    assert list(df.pand_id.values[store.get_positions([changed, added])]) == [changed, added]
+    assert len(store.get_positions([removed])) == 0
+    assert "Nieuwe Straat 3" in df.loc[float(changed)].full_adress
+    assert store.get_list("gebruiksdoelVerblijfsobject", store.get_positions([added])[0]) == ["residential function"]
+
+def test_strings_are_memory_mapped(scratch):
+    state.install(state.stage(store.load_buildings))
+    positions = np.arange(len(store.get_buildings()))[::-1]
+    street    = store.get_buildings().full_adress.iloc[0].split()[0]
+    hover     = tiles.get_hover(positions)
+    found     = search.search(street)
+
+    snapshot.build_snapshot()
+    state.install(state.stage(lambda: (snapshot.load_snapshot(), store.load_buildings(), tiles.load_hover(),
+                                       search.load_search())))
+
+    # shared by the workers instead of made in every one of them
+    assert isinstance(state.get("hover")["addresses"], np.memmap)
+    assert isinstance(search.get_index()["display"], np.memmap)
+
+    assert tiles.get_hover(positions) == hover
+    assert search.search(street) == found
+    assert len(found) > 0
+
+def test_stage_does_not_change_served_state(scratch):
+    state.put("name", "served")
+    staged = state.stage(lambda: state.put("name", "staged"))
+
+    assert state.get("name") == "served"
+    assert staged == {"name": "staged"}
+
+    state.install(staged)
+    assert state.get("name") == "staged"
+
+def test_request_swaps_to_new_version(scratch):
+    write_version("a")
+    state.install(state.stage(lambda: (snapshot.load_snapshot(), load_name())))
+    snapshot.watch(load_name)
+
+    client = make_app().test_client()
+    assert client.get("/").data == b"a"
+
+    write_version("b")
+    client.get("/")
+
+    wait_for(lambda: state.get("current") == "b")
+    assert client.get("/").data == b"b"
+
+def test_swap_waits_for_running_requests(scratch):
+    write_version("a")
+    state.install(state.stage(lambda: (snapshot.load_snapshot(), load_name())))
+    snapshot.watch(load_name)
+
+    app = make_app()
+    with app.test_request_context("/"):
+        snapshot.start_request()
+
+        write_version("b")
+        swap = threading.Thread(target=snapshot.swap, args=("b",))
+        swap.start()
+
+        # loaded next to the served version, not served while the request runs
+        wait_for(lambda: snapshot._SWAPPING)
+        assert state.get("name") == "a"
+
+        snapshot.end_request()
+
+    swap.join(TIMEOUT)
+    assert state.get("name") == "b"
+
+def test_failed_swap_keeps_served_version(scratch):
+    write_version("a")
+    state.install(state.stage(lambda: (snapshot.load_snapshot(), load_name())))
+
+    def reload():
+        load_name()
+        raise OSError("broken version")
+
+    snapshot.watch(reload)
+    write_version("b")
+    snapshot.swap("b")
+
+    assert state.get("name") == "a"
+    assert state.get("current") == "a"
+
+    # the version is not loaded again by every request
+    client = make_app().test_client()
+    assert client.get("/").data == b"a"
+    assert snapshot._LOADING is None
+
+def test_export_keeps_data_of_its_request(scratch):
+    state.install(state.stage(store.load_buildings))
+    positions = np.arange(len(store.get_buildings()))
+    chunks    = export.iter_chunks(positions, chunk_size=10)
+
+    # another version is served before the streamed export is written
+    state.install(state.stage(lambda: state.put("buildings", store.get_buildings().iloc[:5])))
+
+    assert sum(len(chunk) for chunk in chunks) == len(positions)
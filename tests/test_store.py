@@ -0,0 +1,39 @@
+import os
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from components import store, state
+
+def write_city(path, size=20):
+    """Synthetic city as csv, gives back its frame"""
+    df = synthetic.make_city(size)
+    df.to_csv(path, index=False)
+
+    return df
+
+def test_load_buildings(tmp_path):
+    df     = write_city(tmp_path / "buildings.csv")
+    staged = state.stage(lambda: store.load_buildings(tmp_path / "buildings.csv", str(tmp_path / "columns")))
+
+    assert staged["buildings"].index.is_unique
+    assert list(staged["buildings"].pand_id) == list(df.pand_id)
+
+def test_load_buildings_reads_newer_csv(tmp_path):
+    write_city(tmp_path / "buildings.csv")
+    store.convert_buildings(tmp_path / "buildings.csv", str(tmp_path / "columns"))
+
+    # the pipeline wrote another city after the conversion
+    df      = write_city(tmp_path / "buildings.csv", size=10)
+    written = os.path.getmtime(tmp_path / "columns" / "columns.json")
+    os.utime(tmp_path / "buildings.csv", (written + 1, written + 1))
+
+    staged = state.stage(lambda: store.load_buildings(tmp_path / "buildings.csv", str(tmp_path / "columns")))
+    assert list(staged["buildings"].pand_id) == list(df.pand_id)
+
+def test_load_buildings_rejects_duplicate_ids(tmp_path):
+    df = write_city(tmp_path / "buildings.csv")
+    pd.concat([df, df.iloc[[3]]]).to_csv(tmp_path / "buildings.csv", index=False)
+
+    with pytest.raises(ValueError, match=str(df.pand_id.iloc[3])):
+        store.load_buildings(tmp_path / "buildings.csv", str(tmp_path / "columns"))
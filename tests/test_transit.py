@@ -0,0 +1,34 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+from components import transit
+
+def make_line(pairs):
+    """Station graph of a line with a segment between every pair of stations, numbered from 1"""
+    station1, station2 = zip(*pairs)
+
+    return transit.build_line(pd.DataFrame({"station1": station1, "station2": station2, "number": np.arange(1, len(pairs) + 1)}))
+
+def test_split_path_matches_split_line():
+    # the segment between b and c has a parallel track
+    line = make_line([("a", "b"), ("b", "c"), ("c", "d"), ("d", "e"), ("b", "c")])
+    assert line["path"]
+
+    for blocked in itertools.product([False, True], repeat=len(line["numbers"])):
+        blocked = np.array(blocked)
+        assert transit.split_path(line, blocked) == transit.split_line(line, blocked)
+
+def test_split_path():
+    line = make_line([("a", "b"), ("b", "c"), ("c", "d"), ("d", "e")])
+    stations = line["stations"]
+
+    parts, end_points = transit.split_path(line, line["numbers"] == 2)
+    assert parts == [stations[:2], stations[2:]]
+    assert end_points == stations[1:3]
+
+    parts, end_points = transit.split_path(line, line["numbers"] > 0)
+    assert parts == [] and end_points == []
+
+def test_branched_line_is_not_a_path():
+    assert not make_line([("a", "b"), ("b", "c"), ("b", "d")])["path"]